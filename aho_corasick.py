@@ -0,0 +1,98 @@
+from collections import deque
+from typing import Dict, Iterable, List, Set
+
+
+class AhoCorasick:
+    """
+    An Aho-Corasick automaton: finds which of many patterns occur in a text, in a single scan of the text.
+
+    The patterns are laid out in a trie. Each node has a failure link to the node of its longest proper suffix that is
+    also in the trie, so when the next character doesn't continue the current match, the scan falls back along
+    failure links instead of starting over. Each node lists every pattern ending there, including those reached by
+    failure links, so all patterns ending at a character are found at once.
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        """
+        Build the automaton of the given patterns.
+
+        :param patterns: The patterns to find. Each is known by its position
+        """
+
+        self.patterns: List[str] = list(patterns)
+
+        # Per node: its children by character, its failure link, and the patterns ending at it
+        self._children: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._outputs: List[List[int]] = [[]]
+
+        # The empty pattern occurs in every text, so it is never looked for
+        self.everywhere: List[int] = [number for number, pattern in enumerate(self.patterns) if not pattern]
+
+        for number, pattern in enumerate(self.patterns):
+            if pattern:
+                self._add(pattern, number)
+
+        self._link()
+
+    def _add(self, pattern: str, number: int) -> None:
+        """
+        Add a pattern to the trie.
+
+        :param pattern: The pattern
+        :param number: Its position in the patterns
+        """
+
+        node = 0
+        for character in pattern:
+            child = self._children[node].get(character)
+            if child is None:
+                child = len(self._children)
+                self._children[node][character] = child
+                self._children.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+            node = child
+
+        self._outputs[node].append(number)
+
+    def _link(self) -> None:
+        """
+        Set the failure link of every node, breadth first, so each node's link is set before its children's, and add
+        the patterns ending at each node's link to its own.
+        """
+
+        queue = deque(self._children[0].values())
+
+        while queue:
+            node = queue.popleft()
+            for character, child in self._children[node].items():
+                # The longest suffix the child's string can fall back to, going by its parent's
+                fallback = self._fail[node]
+                while character not in self._children[fallback] and fallback:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._children[fallback].get(character, 0)
+
+                self._outputs[child] = self._outputs[child] + self._outputs[self._fail[child]]
+                queue.append(child)
+
+    def find(self, text: str) -> Set[int]:
+        """
+        Find which patterns occur in a text.
+
+        :param text: The text to scan
+        :return: The positions of the patterns occurring in it, anywhere
+        """
+
+        found = set(self.everywhere)
+        children, fail, outputs = self._children, self._fail, self._outputs
+
+        node = 0
+        for character in text:
+            while character not in children[node] and node:
+                node = fail[node]
+            node = children[node].get(character, 0)
+            if outputs[node]:
+                found.update(outputs[node])
+
+        return found
@@ -0,0 +1,485 @@
+import io
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager, redirect_stdout
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import subproject1
+import subproject2
+import subproject3
+from index_writer import WRITER, write_index
+from metrics import peak_rss
+from utilities import render_benchmark_table
+
+# The size of the real Reuters-21578 corpus, which a scale of 1 emulates: its number of articles, and articles per file
+BASE_ARTICLES = 21_578
+ARTICLES_PER_FILE = 1_000
+
+# The range of the number of tokens in the body of an article, around the real corpus's average
+BODY_TOKENS = (20, 250)
+
+# Heaps' law constants sizing the vocabulary to the number of tokens, so larger scales have more distinct terms
+HEAPS_K = 44
+HEAPS_BETA = 0.49
+
+# The most common words of the real corpus, given the top Zipf ranks so the stopword stages remove real stopwords
+COMMON_WORDS = ["the", "of", "to", "said", "and", "a", "in", "mln", "vs", "for", "dlrs", "it", "pct", "on", "from",
+                "is", "that", "its", "cts", "by", "at", "year", "be", "with", "will", "was", "billion", "net", "he",
+                "would", "an", "has", "company", "as", "not", "which", "loss", "shares", "are", "bank", "this",
+                "stock", "market", "oil", "trade", "share", "have", "were", "rate", "sales", "prices", "Reuter"]
+
+# What the rest of the vocabulary is built from, suffixes included so stemming has variants to merge
+_SYLLABLES = ["ba", "be", "bo", "ca", "co", "cu", "da", "de", "di", "fa", "fe", "fo", "ga", "go", "gu", "ha", "he",
+              "ja", "ka", "ke", "la", "le", "li", "lo", "ma", "me", "mi", "mo", "na", "ne", "ni", "no", "pa", "pe",
+              "pi", "po", "ra", "re", "ri", "ro", "sa", "se", "si", "so", "ta", "te", "ti", "to", "va", "ve", "vi",
+              "wa", "we", "za", "zo", "tran", "port", "mar", "ket", "con", "ver", "pro", "dent", "ex", "strat"]
+_SUFFIXES = ["", "", "", "s", "ed", "ing", "ation", "er", "ers", "ly", "ment", "ness"]
+_PLACES = ["NEW YORK", "LONDON", "TOKYO", "WASHINGTON", "BONN", "PARIS", "CHICAGO", "OTTAWA"]
+_TOPICS = ["earn", "acq", "money-fx", "grain", "crude", "trade", "interest", "ship"]
+
+# How many single-term queries to time, and how many queries each timed batch holds
+QUERY_COUNT = 200
+BATCH_SIZE = 50
+
+# The batch sizes to time searching one query at a time against batch searching at, to find where batches win
+CROSSOVER_SIZES = (1, 2, 3, 5, 10, 20, 50, 100)
+
+# Where benchmark results are saved by default
+RESULTS_DIR = Path('output/benchmarks')
+
+
+def generate_corpus(directory: Path, scale: float = 1.0, seed: int = 0) -> List[Path]:
+    """
+    Write a synthetic corpus in the SGML layout of Reuters-21578: `reut2-NNN.sgm` files of 1,000 `<REUTERS>` articles,
+    each with a title and dateline the indexer skips, and a body of text.
+
+    Words are drawn from a Zipf distribution over a vocabulary sized by Heaps' law, so term and postings counts grow
+    with the scale like a real corpus would. Bodies mix in sentence-initial capitals, numbers, acronyms, contractions
+    and entity references, so every stage of the pipeline has something to do. The same seed always gives the same
+    files.
+
+    :param directory: The directory to write the corpus files to
+    :param scale: How many times the size of the real corpus to make it, i.e. 1, 10 or 100. Fractions give a smaller
+                  corpus, for quick runs
+    :param seed: The seed of the random words
+    :return: The corpus files written, in order
+    """
+
+    rng = random.Random(seed)
+    articles = max(round(BASE_ARTICLES * scale), 1)
+
+    # Size the vocabulary to the expected number of tokens, then rank it, common words first
+    vocabulary = _vocabulary(rng, int(HEAPS_K * (articles * sum(BODY_TOKENS) / 2) ** HEAPS_BETA))
+    cumulative_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+
+    directory.mkdir(exist_ok=True, parents=True)
+    files = []
+
+    for number, first in enumerate(range(1, articles + 1, ARTICLES_PER_FILE)):
+        file = directory / f"reut2-{number:03d}.sgm"
+        with open(file, 'wt', encoding='latin-1') as f:
+            f.write('<!DOCTYPE lewis SYSTEM "lewis.dtd">\n')
+            for newid in range(first, min(first + ARTICLES_PER_FILE, articles + 1)):
+                words = rng.choices(vocabulary, cum_weights=cumulative_weights, k=rng.randint(*BODY_TOKENS))
+                f.write(_article(rng, newid, words))
+        files.append(file)
+
+    return files
+
+
+def _vocabulary(rng: random.Random, size: int) -> List[str]:
+    """
+    Make up a vocabulary of distinct words, the real corpus's most common words first.
+
+    :param rng: The random number generator to make words with
+    :param size: How many words to make up
+    :return: The words, by Zipf rank
+    """
+
+    words = dict.fromkeys(COMMON_WORDS)
+    while len(words) < size:
+        word = ''.join(rng.choices(_SYLLABLES, k=rng.randint(1, 4))) + rng.choice(_SUFFIXES)
+        words.setdefault(word.capitalize() if rng.random() < 0.1 else word)
+
+    return list(words)
+
+
+def _article(rng: random.Random, newid: int, words: List[str]) -> str:
+    """
+    Lay out a single synthetic article like a `<REUTERS>` element of the real corpus.
+
+    :param rng: The random number generator to vary the text with
+    :param newid: The docID of the article
+    :param words: The words of its body
+    :return: The SGML of the article
+    """
+
+    # Break the words into sentences and lines, sprinkling in the tokens the tokenizer has to handle with care
+    body = []
+    for position, word in enumerate(words):
+        roll = rng.random()
+        if roll < 0.04:
+            word = str(rng.randint(1, 2000))
+        elif roll < 0.06:
+            word = f"{rng.randint(1, 99)}.{rng.randint(0, 9)}"
+        elif roll < 0.07:
+            word = rng.choice(["U.S.", "it's", "can't", "&lt;ACME&gt;", "Corp's", "(Reuters)"])
+
+        if position % 15 == 0:
+            word = word.capitalize()
+        body.append(word)
+        if position % 15 == 14:
+            body[-1] += '.'
+        if position % 12 == 11:
+            body[-1] += '\n'
+
+    title = ' '.join(words[:6]).upper()
+    topic = rng.choice(_TOPICS)
+
+    return (f'<REUTERS TOPICS="YES" LEWISSPLIT="TRAIN" CGISPLIT="TRAINING-SET" OLDID="{5000 + newid}" '
+            f'NEWID="{newid}">\n'
+            f'<DATE>26-FEB-1987 15:01:01.79</DATE>\n'
+            f'<TOPICS><D>{topic}</D></TOPICS>\n'
+            f'<PLACES><D>usa</D></PLACES>\n<PEOPLE></PEOPLE>\n<ORGS></ORGS>\n<EXCHANGES></EXCHANGES>\n'
+            f'<COMPANIES></COMPANIES>\n'
+            f'<UNKNOWN> \n&#5;&#5;&#5;C\n&#22;&#22;&#1;f{newid % 10000:04d}&#31;reute\n'
+            f'u f BC-{topic.upper()}</UNKNOWN>\n'
+            f'<TEXT>&#2;\n<TITLE>{title}</TITLE>\n'
+            f'<DATELINE>    {rng.choice(_PLACES)}, Feb 26 - </DATELINE><BODY>{" ".join(body)}\n Reuter\n&#3;</BODY>'
+            f'</TEXT>\n</REUTERS>\n')
+
+
+def percentile(samples: Sequence[float], percent: float) -> float:
+    """
+    Get a percentile of some timings, by the nearest rank: the smallest timing at least that percent of the timings
+    are no slower than. With fewer than 100 timings, the 99th percentile is the slowest of them.
+
+    :param samples: The timings
+    :param percent: The percentile to get, from 0 to 100
+    :return: The timing at that percentile
+    """
+
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(math.ceil(percent / 100 * len(ordered)) - 1, 0))]
+
+
+def summarize(samples: List[float], items: int, unit: str) -> dict:
+    """
+    Summarize the timings of a benchmark.
+
+    :param samples: The seconds each timed run took
+    :param items: How many items, i.e. articles or queries, each timed run handled
+    :param unit: What the items are, for the throughput, i.e. 'articles/s'
+    :return: A dictionary of the timings in milliseconds, the throughput at the median timing, and the peak RSS so far.
+    `p99_is_max` says whether there were too few runs for the 99th percentile to be anything but the slowest run
+    """
+
+    p50 = percentile(samples, 50)
+
+    return {'runs': len(samples), 'p50_ms': p50 * 1000, 'p99_ms': percentile(samples, 99) * 1000,
+            'p99_is_max': len(samples) < 100, 'mean_ms': sum(samples) / len(samples) * 1000,
+            'throughput': items / p50 if p50 else None, 'throughput_unit': unit, 'peak_rss_bytes': peak_rss()}
+
+
+def time_runs(run: Callable[[], object], repeat: int) -> Tuple[List[float], object]:
+    """
+    Time a benchmark a number of times, silencing what it prints.
+
+    Anything the run hands over to the background index writer is saved between runs, outside of the timing, so runs
+    don't overlap with the saving of the last one.
+
+    :param run: The benchmark to run
+    :param repeat: How many times to run it
+    :return: The seconds each run took, and what the last run returned
+    """
+
+    samples = []
+    result = None
+
+    for _ in range(repeat):
+        with redirect_stdout(io.StringIO()):
+            tick = time.perf_counter()
+            result = run()
+            samples.append(time.perf_counter() - tick)
+            WRITER.flush()
+
+    return samples, result
+
+
+@contextmanager
+def working_directory(directory: Path) -> Iterator[None]:
+    """
+    Run the enclosed code from a different working directory.
+
+    The pipeline reads the corpus from `../reuters21578` and saves to `output/`, relative to the working directory, so
+    running it from a scratch directory points it at the synthetic corpus and leaves the real outputs untouched.
+
+    :param directory: The directory to run from
+    """
+
+    previous = Path.cwd()
+    os.chdir(directory)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def run_benchmarks(scale: float = 1.0, repeat: int = 3, corpus_root: Optional[Path] = None, seed: int = 0) -> dict:
+    """
+    Benchmark the whole pipeline on a synthetic corpus: ingestion, sorting the (term, docID) pairs, `create_index()`,
+    every lossy compression stage of subproject 3, and single-term and batched `_search_query()` latency on the naive
+    and stemmed indexes.
+
+    Every pipeline benchmark is run `repeat` times, on the same input. The stemming stage's first run stems every word,
+    later runs look them up in the memo table, as reruns of the real pipeline do. Query benchmarks time each query, or
+    batch of queries, once, after the indexes are read. Peak RSS is the high-water mark of the process, so it includes
+    everything benchmarked before.
+
+    :param scale: The scale of the synthetic corpus, see `generate_corpus()`
+    :param repeat: How many times to time each pipeline benchmark
+    :param corpus_root: A directory to keep the generated corpus in, and reuse it from if it is already there. None
+                        means generate it into a temporary directory, removed afterwards
+    :param seed: The seed of the synthetic corpus
+    :return: The results, with the corpus's size, the environment, and a summary of every benchmark by name
+    """
+
+    temporary = None
+    if corpus_root is None:
+        temporary = tempfile.TemporaryDirectory()
+        corpus_root = Path(temporary.name)
+
+    base = corpus_root / f"{scale:g}x"
+    corpus = base / 'reuters21578'
+    work = base / 'work'
+
+    try:
+        if not list(corpus.glob('*.sgm')):
+            print(f"\nGenerating a {scale:g}x synthetic corpus in {corpus}...")
+            tick = time.perf_counter()
+            generate_corpus(corpus, scale, seed)
+            print(f"Generated in {time.perf_counter() - tick:0.2f} seconds")
+
+        shutil.rmtree(work, ignore_errors=True)
+        work.mkdir(parents=True)
+
+        with working_directory(work):
+            results = _benchmark_pipeline(repeat)
+
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+        if temporary is not None:
+            temporary.cleanup()
+
+    results['scale'] = scale
+    results['seed'] = seed
+    results['repeat'] = repeat
+    results['python'] = platform.python_version()
+    results['platform'] = platform.platform()
+    results['time'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+
+    return results
+
+
+def _benchmark_pipeline(repeat: int) -> dict:
+    """
+    Run every benchmark, from the working directory of a synthetic corpus. See `run_benchmarks()`.
+
+    :param repeat: How many times to time each pipeline benchmark
+    :return: The results
+    """
+
+    benchmarks: Dict[str, dict] = {}
+
+    with redirect_stdout(io.StringIO()):
+        CORPUS_FILES = subproject1.get_corpus_files()
+    CORPUS_BYTES = sum(file.stat().st_size for file in CORPUS_FILES)
+
+    # Ingestion: parse, clean and tokenize every article into its (term, docID) pairs
+    def ingest() -> list:
+        pairs = []
+        for article in subproject1.get_texts():
+            pairs.extend(subproject1.create_pairs(subproject1.process_document(article.text), article.newid))
+        return pairs
+
+    print("\nBenchmarking ingestion...")
+    samples, pairs = time_runs(ingest, repeat)
+    ARTICLES = len({doc_id for _, doc_id in pairs})
+    benchmarks['ingestion'] = summarize(samples, ARTICLES, 'articles/s')
+    benchmarks['ingestion']['megabytes_per_second'] = CORPUS_BYTES / 2 ** 20 / percentile(samples, 50)
+
+    print("Benchmarking sorting the (term, docID) pairs...")
+    samples, sorted_pairs = time_runs(lambda: sorted(pairs), repeat)
+    benchmarks['sort_pairs'] = summarize(samples, len(pairs), 'pairs/s')
+    del pairs
+
+    print("Benchmarking create_index...")
+    samples, index = time_runs(lambda: subproject1.create_index(sorted_pairs), repeat)
+    benchmarks['create_index'] = summarize(samples, len(sorted_pairs), 'pairs/s')
+    del sorted_pairs
+
+    Path('output/').mkdir(exist_ok=True)
+    write_index(index, 'output/1. naive_index.txt')
+
+    # Every lossy compression stage of subproject 3, each on the output of the one before, as the pipeline runs them
+    stages = [('remove_numbers', subproject3.remove_numbers),
+              ('case_folding', subproject3.case_folding),
+              ('create_stopwords', subproject3.create_stopwords),
+              ('stopwords30', lambda previous: subproject3.stopwords30(previous, STOPWORDS[:30])),
+              ('stopwords150', lambda previous: subproject3.stopwords150(previous, STOPWORDS)),
+              ('stem', subproject3.stem)]
+
+    STOPWORDS: List[str] = []
+    for name, stage in stages:
+        print(f"Benchmarking {name}...")
+        samples, output = time_runs(lambda: stage(index), repeat)
+        benchmarks[name] = summarize(samples, len(index), 'terms/s')
+
+        if name == 'create_stopwords':
+            STOPWORDS = output
+        elif name != 'stopwords30':
+            index = output
+
+    # Query latency, once each index has been read
+    crossovers: Dict[str, dict] = {}
+    for name, file in [('naive', Path('output/1. naive_index.txt')), ('stemmed', Path('output/5. stemmed_index.txt'))]:
+        print(f"Benchmarking {name} index queries...")
+        benchmarks.update(_benchmark_queries(name, file))
+        crossovers[name] = _benchmark_batch_crossover(file)
+        print(f"Batch search beats searching one query at a time from {crossovers[name]['crossover']} queries "
+              f"(subproject2.MIN_BATCH is {subproject2.MIN_BATCH})")
+
+    return {'articles': ARTICLES, 'corpus_files': len(CORPUS_FILES), 'corpus_bytes': CORPUS_BYTES,
+            'benchmarks': benchmarks, 'batch_crossover': crossovers}
+
+
+def _benchmark_queries(name: str, file: Path) -> Dict[str, dict]:
+    """
+    Time single-term `_search_query()` calls, and `batch_query()` calls of `BATCH_SIZE` terms at a time, on an index.
+
+    The queries are terms of the index, picked at random from the most to the least common, so they match postings
+    lists of every length.
+
+    :param name: The name of the index, to name the benchmarks with
+    :param file: The file of the index
+    :return: The summaries of the single-term and batch benchmarks, by name
+    """
+
+    # Read the index and build its k-gram index before timing anything
+    inverted_index = subproject2.ENGINE.index(file)
+    subproject2.ENGINE.kgrams(file)
+
+    terms = random.Random(0).sample(sorted(inverted_index.keys()), min(QUERY_COUNT, len(inverted_index)))
+
+    # Every query is timed on a cold result cache, as the batches ask for the same terms again
+    subproject2.ENGINE.clear_caches()
+    singles = []
+    for term in terms:
+        tick = time.perf_counter()
+        subproject2._search_query(term, file, 1, show_results=False)
+        singles.append(time.perf_counter() - tick)
+
+    subproject2.ENGINE.clear_caches()
+    batches = []
+    for start in range(0, len(terms), BATCH_SIZE):
+        tick = time.perf_counter()
+        subproject2.batch_query(terms[start:start + BATCH_SIZE], file)
+        batches.append(time.perf_counter() - tick)
+
+    return {f'{name}_single_query': summarize(singles, 1, 'queries/s'),
+            f'{name}_batch_query': summarize(batches, BATCH_SIZE, 'queries/s')}
+
+
+def _benchmark_batch_crossover(file: Path) -> dict:
+    """
+    Time searching batches of queries one query at a time, through the k-gram index, against searching them with an
+    automaton, at every batch size of `CROSSOVER_SIZES`, to find the smallest batch the automaton is faster for.
+
+    Every batch size searches the same `QUERY_COUNT` terms of the index, on a cold result cache.
+
+    :param file: The file of the index
+    :return: The batch sizes, the throughput in queries per second of both ways at each, and the smallest batch size
+             batch searching is faster at, or None if it never is
+    """
+
+    engine = subproject2.ENGINE
+    inverted_index = engine.index(file)
+    engine.kgrams(file)
+
+    terms = random.Random(1).sample(sorted(inverted_index.keys()), min(QUERY_COUNT, len(inverted_index)))
+
+    singles, batches = [], []
+    for size in CROSSOVER_SIZES:
+        engine.clear_caches()
+        tick = time.perf_counter()
+        for term in terms:
+            engine.search(term, file)
+        singles.append(len(terms) / (time.perf_counter() - tick))
+
+        # Always through the automaton, however small the batch
+        engine.clear_caches()
+        tick = time.perf_counter()
+        for start in range(0, len(terms), size):
+            engine.batch_search(terms[start:start + size], file, min_batch=1)
+        batches.append(len(terms) / (time.perf_counter() - tick))
+
+    crossover = next((size for size, single, batch in zip(CROSSOVER_SIZES, singles, batches) if batch > single), None)
+
+    return {'batch_sizes': list(CROSSOVER_SIZES), 'single_queries_per_second': singles,
+            'batch_queries_per_second': batches, 'crossover': crossover}
+
+
+def save_results(results: dict, directory: Path = RESULTS_DIR) -> Path:
+    """
+    Save benchmark results to a JSON file named after their scale and time, so runs can be compared later.
+
+    :param results: The results, from `run_benchmarks()`
+    :param directory: The directory to save them to
+    :return: The file they were saved to
+    """
+
+    directory.mkdir(exist_ok=True, parents=True)
+    file = directory / f"benchmark-{results['scale']:g}x-{results['time'].replace(':', '')}.json"
+
+    print(f"\nSaving to file: {file}")
+    with open(file, 'wt') as f:
+        json.dump(results, f, indent=2)
+
+    return file
+
+
+def benchmark_suite(scales: Sequence[float] = (1.0,), repeat: int = 3, corpus_root: Optional[Path] = None,
+                    baseline: Optional[Path] = None) -> List[Path]:
+    """
+    Run the benchmarks at every scale, save the results of each, and show them in a table.
+
+    :param scales: The scales of synthetic corpus to benchmark on
+    :param repeat: How many times to time each pipeline benchmark
+    :param corpus_root: A directory to keep the generated corpora in. None means generate them into temporary
+                        directories
+    :param baseline: The results file of an earlier run, to compare the results at the same scale to
+    :return: The files the results were saved to, by scale
+    """
+
+    previous = None
+    if baseline is not None:
+        with open(baseline, 'rt') as f:
+            previous = json.load(f)
+
+    files = []
+    for scale in scales:
+        results = run_benchmarks(scale, repeat, corpus_root)
+        files.append(save_results(results))
+
+        compared = previous if previous is not None and previous['scale'] == scale else None
+        render_benchmark_table(results, compared)
+
+    return files
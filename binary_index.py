@@ -0,0 +1,265 @@
+import json
+import mmap
+import os
+import struct
+import time
+from collections.abc import Mapping
+from glob import glob
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+from index_writer import atomic_file
+
+# Identifies a dictionary file, and the version of the format
+MAGIC = b'RIDX'
+VERSION = 2
+
+# Identifies a postings file
+POSTINGS_MAGIC = b'RPST'
+
+# Header of the dictionary file: magic, version, number of terms, generation, number of postings
+_HEADER = struct.Struct('<4sIIQQ')
+
+# Header of the postings file: magic, generation
+_POSTINGS_HEADER = struct.Struct('<4sQ')
+
+# Every offset and docID
+_UINT = struct.Struct('<I')
+
+# How many times to try opening an index whose two files are from different writes, as it is being written
+_OPEN_ATTEMPTS = 5
+_OPEN_RETRY_SECONDS = 0.01
+
+
+def dictionary_path(file: Path) -> Path:
+    """
+    Get the path of the binary dictionary file that goes with the given index file.
+
+    :param file: The JSON index file, i.e. `output/1. naive_index.txt`
+    :return: The path of its binary dictionary file, i.e. `output/1. naive_index.dict`
+    """
+
+    return file.with_suffix('.dict')
+
+
+def postings_path(file: Path) -> Path:
+    """
+    Get the path of the binary postings file that goes with the given index file.
+
+    :param file: The JSON index file, or its binary dictionary file
+    :return: The path of its binary postings file, i.e. `output/1. naive_index.postings`
+    """
+
+    return file.with_suffix('.postings')
+
+
+def write_binary_index(index: Dict[str, list], file: Path) -> Path:
+    """
+    Write an index in the binary format, as a dictionary file and a postings file.
+
+    The dictionary file has a header, then two arrays of `number of terms + 1` offsets: where each term starts in the
+    term string, and where each terms postings start in the postings file (counted in docIDs). Then comes the string
+    of all the sorted terms, concatenated, in UTF-8.
+
+    The postings file has a header, then all the postings lists, in the same order as the terms, packed as 32-bit
+    docIDs.
+
+    Both headers hold the same random generation, so a reader can tell the two files were written together. Both files
+    are written in full before either replaces the old one, and then they replace them back to back.
+
+    Offsets and docIDs are fixed-width unsigned 32-bit integers, little-endian.
+
+    :param index: The index to write
+    :param file: The file to base the names of the binary files on. Its suffix is replaced
+    :return: The path of the written dictionary file
+    """
+
+    terms = sorted(index)
+    generation = int.from_bytes(os.urandom(8), 'little')
+
+    term_offsets = [0]
+    postings_offsets = [0]
+    term_string = bytearray()
+
+    # Both files are written in full first. The postings file, opened last, is closed and replaces the old one first.
+    # The dictionary is replaced last, as readers tell whether the index has changed by its modification time
+    with atomic_file(dictionary_path(file), 'wb') as dictionary_file, \
+            atomic_file(postings_path(file), 'wb') as postings_file:
+        postings_file.write(_POSTINGS_HEADER.pack(POSTINGS_MAGIC, generation))
+        for term in terms:
+            postings = index[term]
+            postings_file.write(_pack(postings))
+
+            term_string += term.encode()
+            term_offsets.append(len(term_string))
+            postings_offsets.append(postings_offsets[-1] + len(postings))
+
+        dictionary_file.write(_HEADER.pack(MAGIC, VERSION, len(terms), generation, postings_offsets[-1]))
+        dictionary_file.write(_pack(term_offsets))
+        dictionary_file.write(_pack(postings_offsets))
+        dictionary_file.write(term_string)
+
+    return dictionary_path(file)
+
+
+def _pack(numbers: List[int]) -> bytes:
+    """
+    Pack numbers as little-endian unsigned 32-bit integers.
+
+    :param numbers: The numbers to pack
+    :return: The packed bytes
+    """
+
+    return struct.pack(f'<{len(numbers)}I', *numbers)
+
+
+def convert(file: Path) -> Path:
+    """
+    Convert a JSON index file, as written by the other subprojects, to the binary format.
+
+    :param file: The JSON index file to convert
+    :return: The path of the written dictionary file
+    """
+
+    with open(file, 'rt') as f:
+        index = json.load(f)
+
+    print(f"Converting to binary: {file} -> {dictionary_path(file).name}, {postings_path(file).name}")
+
+    return write_binary_index(index, file)
+
+
+def convert_outputs() -> List[Path]:
+    """
+    Convert every JSON index file in the `output/` directory to the binary format.
+
+    :return: The paths of the written dictionary files
+    """
+
+    return [convert(Path(p)) for p in sorted(glob("output/*.txt"))]
+
+
+class BinaryIndex(Mapping):
+    """
+    A read-only, memory-mapped index in the binary format.
+
+    Behaves like the `{term: [list, of, docIDs]}` dictionary `json.load()` gives, so it can be used in its place.
+    Nothing is read up front: looking up a term binary searches the memory-mapped dictionary, and only the pages of the
+    postings file that hold that terms postings are touched.
+    """
+
+    def __init__(self, file: Path):
+        """
+        Open a binary index.
+
+        If its dictionary and postings files are from different writes, as they are while it is being written, try
+        again, until they are from the same one.
+
+        :param file: The dictionary file of the index, or any file with the same name but a different suffix
+        """
+
+        for _ in range(_OPEN_ATTEMPTS):
+            if self._open(file):
+                break
+            time.sleep(_OPEN_RETRY_SECONDS)
+        else:
+            raise ValueError(f"{dictionary_path(file)} and {postings_path(file)} are from different writes")
+
+        # Where the arrays of offsets, and the terms, start in the dictionary file. Nothing is copied
+        self._term_offsets_start = _HEADER.size
+        self._postings_offsets_start = self._term_offsets_start + (self._size + 1) * _UINT.size
+        self._terms_start = self._postings_offsets_start + (self._size + 1) * _UINT.size
+
+    def _open(self, file: Path) -> bool:
+        """
+        Memory-map the dictionary and postings files of the index.
+
+        :param file: The dictionary file of the index, or any file with the same name but a different suffix
+        :return: Whether both files are from the same write
+        """
+
+        with open(dictionary_path(file), 'rb') as f:
+            self._dictionary = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self._size, generation, count = _HEADER.unpack_from(self._dictionary)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{dictionary_path(file)} is not a version {VERSION} binary index dictionary")
+
+        with open(postings_path(file), 'rb') as f:
+            self._postings = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        postings_magic, postings_generation = _POSTINGS_HEADER.unpack_from(self._postings)
+        if postings_magic != POSTINGS_MAGIC:
+            raise ValueError(f"{postings_path(file)} is not a binary index postings file")
+
+        return postings_generation == generation and len(self._postings) == _POSTINGS_HEADER.size + count * _UINT.size
+
+    def _offset(self, start: int, position: int) -> int:
+        """
+        Get an offset from one of the arrays of offsets of the dictionary.
+
+        :param start: Where the array starts in the dictionary file
+        :param position: The position of the offset in the array
+        :return: The offset
+        """
+
+        return _UINT.unpack_from(self._dictionary, start + position * _UINT.size)[0]
+
+    def _term(self, position: int) -> str:
+        """
+        Get the term at the given position in the sorted dictionary.
+
+        :param position: The position of the term
+        :return: The term
+        """
+
+        start = self._terms_start + self._offset(self._term_offsets_start, position)
+        end = self._terms_start + self._offset(self._term_offsets_start, position + 1)
+        return self._dictionary[start:end].decode()
+
+    def _find(self, term: str) -> int:
+        """
+        Binary search the sorted dictionary for a term.
+
+        :param term: The term to find
+        :return: The position of the term, or -1 if it is not in the dictionary
+        """
+
+        low, high = 0, self._size
+        while low < high:
+            middle = (low + high) // 2
+            if self._term(middle) < term:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low < self._size and self._term(low) == term:
+            return low
+        return -1
+
+    def postings(self, position: int) -> list:
+        """
+        Get the postings list of the term at the given position in the sorted dictionary.
+
+        :param position: The position of the term
+        :return: The postings list of the term
+        """
+
+        start = self._offset(self._postings_offsets_start, position)
+        end = self._offset(self._postings_offsets_start, position + 1)
+        return list(struct.unpack_from(f'<{end - start}I', self._postings, _POSTINGS_HEADER.size + start * _UINT.size))
+
+    def __getitem__(self, term: str) -> list:
+        position = self._find(term)
+        if position == -1:
+            raise KeyError(term)
+        return self.postings(position)
+
+    def __contains__(self, term: object) -> bool:
+        return isinstance(term, str) and self._find(term) != -1
+
+    def __iter__(self) -> Iterator[str]:
+        return (self._term(position) for position in range(self._size))
+
+    def __len__(self) -> int:
+        return self._size
@@ -0,0 +1,216 @@
+import heapq
+import json
+import math
+from bisect import bisect_left
+from pathlib import Path
+from typing import Dict, List, Mapping, Tuple
+
+# Default BM25 parameters: how quickly term frequency saturates, and how much document length normalizes scores
+K1 = 1.2
+B = 0.75
+
+# Upper bounds are padded by this fraction, so float rounding never makes a bound lower than a score it bounds
+_BOUND_SLACK = 1e-9
+
+
+def frequencies_path(file: Path) -> Path:
+    """
+    Get the path the term frequencies and document lengths of the given index file are saved to.
+
+    :param file: The index file, i.e. `output/5. stemmed_index.txt`
+    :return: The path of its frequencies, i.e. `output/5. stemmed_index.tf`
+    """
+
+    return file.with_suffix('.tf')
+
+
+def read_frequencies(file: Path) -> Tuple[Dict[str, list], Dict[int, int]]:
+    """
+    Read term frequencies and document lengths saved with `subproject1.save_frequencies()`.
+
+    :param file: The frequencies file
+    :return: The term frequencies, of form `{term: [frequency in each document of its postings list]}`, and the length
+             of each document in tokens, by docID
+    """
+
+    with open(file, 'rt') as f:
+        saved = json.load(f)
+
+    return saved['frequencies'], {int(doc_id): length for doc_id, length in saved['lengths'].items()}
+
+
+class BM25:
+    """
+    Ranks the documents of an index for a query of terms with Okapi BM25.
+
+    Needs the term frequencies of every postings list, and the length of every document. `top_k()` evaluates queries
+    document-at-a-time with WAND: documents whose score can't reach the top k, going by an upper bound of each term's
+    score, are skipped without scoring. `exhaustive()` scores every matching document, and gives the same results.
+    """
+
+    def __init__(self, index: Mapping, frequencies: Mapping[str, list], lengths: Dict[int, int],
+                 k1: float = K1, b: float = B):
+        """
+        Create a scorer for an index.
+
+        :param index: The index to rank documents of
+        :param frequencies: The frequency of each term in each document of its postings list, in the same order
+        :param lengths: The length of each document in tokens, by docID
+        :param k1: How quickly term frequency saturates
+        :param b: How much document length normalizes scores, from 0 to 1
+        """
+
+        self.index = index
+        self.frequencies = frequencies
+        self.lengths = lengths
+        self.k1 = k1
+        self.b = b
+
+        self.documents = len(lengths)
+        self.average_length = sum(lengths.values()) / max(self.documents, 1)
+
+        self._upper_bounds: Dict[str, float] = {}
+
+        # The number of documents fully scored by the last query, to compare evaluation strategies
+        self.documents_scored = 0
+
+    def idf(self, term: str) -> float:
+        """
+        Get the inverse document frequency of a term, never negative even for terms in most documents.
+
+        :param term: A term in the index
+        :return: Its inverse document frequency
+        """
+
+        df = len(self.index[term])
+        return math.log(1 + (self.documents - df + 0.5) / (df + 0.5))
+
+    def _weight(self, idf: float, tf: int, doc_id: int) -> float:
+        """
+        Get the score a term adds to a document.
+
+        :param idf: The inverse document frequency of the term
+        :param tf: The frequency of the term in the document
+        :param doc_id: The document
+        :return: The score of the term in the document
+        """
+
+        norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / self.average_length)
+        return idf * tf * (self.k1 + 1) / (tf + norm)
+
+    def upper_bound(self, term: str) -> float:
+        """
+        Get the highest score a term adds to any document. Computed the first time it is needed, then remembered.
+
+        :param term: A term in the index
+        :return: Its highest score
+        """
+
+        bound = self._upper_bounds.get(term)
+        if bound is None:
+            idf = self.idf(term)
+            bound = max(self._weight(idf, tf, doc_id) for doc_id, tf in zip(self.index[term], self.frequencies[term]))
+            bound *= 1 + _BOUND_SLACK
+            self._upper_bounds[term] = bound
+
+        return bound
+
+    def _query_terms(self, terms: List[str]) -> List[str]:
+        """
+        Get the distinct query terms that are in the index, in query order. A document's score always sums its terms
+        in this order, so both evaluation strategies round scores the same way.
+
+        :param terms: The query terms
+        :return: The distinct terms in the index
+        """
+
+        return [term for term in dict.fromkeys(terms) if term in self.index]
+
+    def exhaustive(self, terms: List[str], k: int = 10) -> List[Tuple[int, float]]:
+        """
+        Rank documents by scoring every document matching any query term, term-at-a-time.
+
+        :param terms: The query terms, normalized like the index
+        :param k: How many documents to return
+        :return: The top k (docID, score) pairs, by highest score, then lowest docID
+        """
+
+        scores: Dict[int, float] = {}
+        for term in self._query_terms(terms):
+            idf = self.idf(term)
+            for doc_id, tf in zip(self.index[term], self.frequencies[term]):
+                scores[doc_id] = scores.get(doc_id, 0.0) + self._weight(idf, tf, doc_id)
+
+        self.documents_scored = len(scores)
+
+        top = heapq.nlargest(k, ((score, -doc_id) for doc_id, score in scores.items()))
+        return [(-negated, score) for score, negated in top]
+
+    def top_k(self, terms: List[str], k: int = 10) -> List[Tuple[int, float]]:
+        """
+        Rank documents document-at-a-time with WAND, keeping the best k so far in a heap.
+
+        Each query term has a cursor into its postings list. The cursors are kept sorted by their current docID. Going
+        through them in that order, the first one at which the upper bounds add up to more than the lowest score in
+        the heap is the pivot: no document before the pivot's can make it into the top k. If every cursor before the
+        pivot is already at its document, it is scored. Otherwise, they skip ahead to it, by binary search.
+
+        :param terms: The query terms, normalized like the index
+        :param k: How many documents to return
+        :return: The top k (docID, score) pairs, by highest score, then lowest docID. The same as `exhaustive()`
+        """
+
+        if k < 1:
+            return []
+
+        # Each cursor: [position, postings, frequencies, idf, upper bound, place in the query]
+        cursors = [[0, self.index[term], self.frequencies[term], self.idf(term), self.upper_bound(term), order]
+                   for order, term in enumerate(self._query_terms(terms))]
+
+        heap: List[Tuple[float, int]] = []
+        threshold = -math.inf
+        self.documents_scored = 0
+
+        while True:
+            cursors = [cursor for cursor in cursors if cursor[0] < len(cursor[1])]
+            if not cursors:
+                break
+            cursors.sort(key=lambda cursor: cursor[1][cursor[0]])
+
+            # Find the pivot
+            pivot, bound = None, 0.0
+            for number, cursor in enumerate(cursors):
+                bound += cursor[4]
+                if bound > threshold:
+                    pivot = number
+                    break
+            if pivot is None:
+                break
+
+            pivot_doc = cursors[pivot][1][cursors[pivot][0]]
+
+            if cursors[0][1][cursors[0][0]] == pivot_doc:
+                # Score the document, summing its terms in query order
+                matching = sorted((cursor for cursor in cursors if cursor[1][cursor[0]] == pivot_doc),
+                                  key=lambda cursor: cursor[5])
+                score = 0.0
+                for cursor in matching:
+                    score += self._weight(cursor[3], cursor[2][cursor[0]], pivot_doc)
+                    cursor[0] += 1
+                self.documents_scored += 1
+
+                # Ties go to the lower docID, which was scored first
+                entry = (score, -pivot_doc)
+                if len(heap) < k:
+                    heapq.heappush(heap, entry)
+                elif entry > heap[0]:
+                    heapq.heapreplace(heap, entry)
+                if len(heap) == k:
+                    threshold = heap[0][0]
+
+            else:
+                # Nothing before the pivot's document can make it into the top k
+                for cursor in cursors[:pivot]:
+                    cursor[0] = bisect_left(cursor[1], pivot_doc, cursor[0])
+
+        return [(-negated, score) for score, negated in sorted(heap, reverse=True)]
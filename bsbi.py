@@ -0,0 +1,146 @@
+import heapq
+import json
+import tempfile
+from pathlib import Path
+from typing import Iterable, Iterator, List, Tuple
+
+from index_writer import atomic_file
+from metrics import METRICS
+
+# Default number of (term, docID) pairs sorted in memory at a time
+BLOCK_SIZE = 1_000_000
+
+
+def build_index_file(documents: Iterable[Tuple[int, Iterable[str]]], file: Path, block_size: int = BLOCK_SIZE) -> None:
+    """
+    Create an inverted index with blocked sort-based indexing, streaming it straight to a file.
+
+    The (term, docID) pairs of the documents are collected in blocks of at most `block_size` pairs. Each block is
+    sorted and written to a temporary directory as a run. The runs are then merged with a heap, and the index is
+    written out term by term as it comes out of the merge. Memory use is bounded by the block size, not by the size of
+    the corpus.
+
+    The file is the same as `json.dump()` of the whole index would write.
+
+    :param documents: (docID, tokens) tuples of every document
+    :param file: The file to write the index to
+    :param block_size: The number of (term, docID) pairs to sort in memory at a time
+    """
+
+    with tempfile.TemporaryDirectory(prefix='bsbi-') as run_dir:
+        runs = write_runs(documents, Path(run_dir), block_size)
+
+        print(f"Merging {len(runs)} runs into: {file}")
+        write_index(merge_runs(runs), file)
+
+
+def write_runs(documents: Iterable[Tuple[int, Iterable[str]]], run_dir: Path, block_size: int) -> List[Path]:
+    """
+    Write the (term, docID) pairs of the documents to disk as sorted runs of at most `block_size` pairs each.
+
+    :param documents: (docID, tokens) tuples of every document
+    :param run_dir: The directory to write the runs to
+    :param block_size: The number of (term, docID) pairs to sort in memory at a time
+    :return: The files of the runs, in the order they were written
+    """
+
+    runs: List[Path] = []
+    block: List[Tuple[str, int]] = []
+
+    for doc_id, tokens in documents:
+        block.extend((token, doc_id) for token in tokens)
+
+        if len(block) >= block_size:
+            runs.append(_write_run(block, run_dir / f'run{len(runs)}.txt'))
+            block = []
+
+    if block:
+        runs.append(_write_run(block, run_dir / f'run{len(runs)}.txt'))
+
+    return runs
+
+
+def _write_run(block: List[Tuple[str, int]], file: Path) -> Path:
+    """
+    Sort a block of (term, docID) pairs and write it to disk, one tab-separated pair per line.
+
+    Tokens never contain whitespace, so a tab safely separates the term from the docID.
+
+    :param block: The block of pairs to write
+    :param file: The file to write the run to
+    :return: The file the run was written to
+    """
+
+    with METRICS.timer('sort_pairs'):
+        block.sort()
+
+    with open(file, 'wt') as f:
+        f.writelines(f'{term}\t{doc_id}\n' for term, doc_id in block)
+
+    return file
+
+
+def _read_run(file: Path) -> Iterator[Tuple[str, int]]:
+    """
+    Stream the (term, docID) pairs of a run, one at a time.
+
+    :param file: The run file to read
+    :return: A generator of (term, docID) tuples, sorted
+    """
+
+    with open(file, 'rt') as f:
+        for line in f:
+            term, doc_id = line.rstrip('\n').split('\t')
+            yield term, int(doc_id)
+
+
+def merge_runs(runs: List[Path]) -> Iterator[Tuple[str, list]]:
+    """
+    Merge sorted runs into a single stream of (term, postings) entries, sorted by term.
+
+    The runs are merged with a heap, so only the current pair of each run, and the postings list of the current term,
+    are held in memory.
+
+    :param runs: The run files to merge
+    :return: A generator of (term, postings) tuples, sorted by term, with sorted postings without duplicates
+    """
+
+    current_term = None
+    current_postings: list = []
+
+    for term, doc_id in heapq.merge(*(_read_run(run) for run in runs)):
+        if term != current_term:
+            if current_term is not None:
+                yield current_term, current_postings
+            current_term = term
+            current_postings = []
+
+        # Pairs come out sorted, so a duplicate would be right after the original
+        if not current_postings or current_postings[-1] != doc_id:
+            current_postings.append(doc_id)
+
+    if current_term is not None:
+        yield current_term, current_postings
+
+
+def write_index(entries: Iterable[Tuple[str, list]], file: Path) -> None:
+    """
+    Write (term, postings) entries to a file as a JSON object, one entry at a time.
+
+    Gives the same file as `json.dump()` of a dictionary of the same entries. The file is written atomically.
+
+    :param entries: The (term, postings) entries to write, in order
+    :param file: The file to write the index to
+    """
+
+    file.parent.mkdir(exist_ok=True, parents=True)
+
+    with atomic_file(file) as f:
+        f.write('{')
+
+        for number, (term, postings) in enumerate(entries):
+            if number:
+                f.write(', ')
+            f.write(f'{json.dumps(term)}: {json.dumps(postings)}')
+
+        f.write('}')
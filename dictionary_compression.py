@@ -0,0 +1,308 @@
+import struct
+from array import array
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from index_writer import atomic_file
+from postings_compression import gaps, iter_postings, vb_decode, vb_encode
+
+# Identifies a front-coded index file, and the version of the format
+MAGIC = b'RIFC'
+VERSION = 1
+
+# Default number of terms in each front-coded block
+BLOCK_SIZE = 8
+
+# Header of a front-coded index file: magic, version, number of terms, block size, size of the front-coded terms
+_HEADER = struct.Struct('=4sIIII')
+
+
+class DictionaryString:
+    """
+    A sorted dictionary stored as one long string of all the terms, concatenated, with an array of where each term
+    starts. Saves the per-object overhead of holding every term as its own Python string.
+    """
+
+    def __init__(self, terms: Iterable[str]):
+        """
+        Create a dictionary string out of the given terms.
+
+        :param terms: The terms of the dictionary, in any order
+        """
+
+        terms = sorted(terms)
+        self.string = ''.join(terms)
+        self.offsets = array('I', [0])
+        for term in terms:
+            self.offsets.append(self.offsets[-1] + len(term))
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def term(self, position: int) -> str:
+        """
+        Get the term at the given position in the sorted dictionary.
+
+        :param position: The position of the term
+        :return: The term
+        """
+
+        return self.string[self.offsets[position]:self.offsets[position + 1]]
+
+    def find(self, term: str) -> int:
+        """
+        Binary search the dictionary for a term.
+
+        :param term: The term to find
+        :return: The position of the term, or -1 if it is not in the dictionary
+        """
+
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self.term(middle) < term:
+                low = middle + 1
+            else:
+                high = middle
+
+        return low if low < len(self) and self.term(low) == term else -1
+
+    def size_bytes(self) -> int:
+        """
+        Get the size of the dictionary, as stored: the string in UTF-8, and the array of offsets.
+
+        :return: The size in bytes
+        """
+
+        return len(self.string.encode()) + self.offsets.itemsize * len(self.offsets)
+
+
+def front_code(terms: List[str], block_size: int = BLOCK_SIZE) -> Tuple[bytes, array]:
+    """
+    Store sorted terms with blocked front coding.
+
+    Terms are grouped in blocks of `block_size`. The first term of each block is stored in full, every other term only
+    as the length of the prefix it shares with the term before it, and the rest of the term. Lengths are variable-byte
+    encoded, and terms are stored in UTF-8.
+
+    :param terms: The sorted terms
+    :param block_size: How many terms go in each block
+    :return: The front-coded terms, and the offset of the start of each block in them
+    """
+
+    coded = bytearray()
+    block_offsets = array('I')
+    previous = b''
+
+    for position, term in enumerate(terms):
+        term = term.encode()
+
+        if position % block_size == 0:
+            block_offsets.append(len(coded))
+            prefix = 0
+        else:
+            prefix = _common_prefix(previous, term)
+
+        coded += vb_encode([prefix, len(term) - prefix])
+        coded += term[prefix:]
+        previous = term
+
+    return bytes(coded), block_offsets
+
+
+def _common_prefix(first: bytes, second: bytes) -> int:
+    """
+    Get the length of the prefix two terms share.
+
+    :param first: A term
+    :param second: Another term
+    :return: The length of their common prefix
+    """
+
+    length = 0
+    for a, b in zip(first, second):
+        if a != b:
+            break
+        length += 1
+    return length
+
+
+class FrontCodedIndex(Mapping):
+    """
+    A read-only index with a blocked front-coded dictionary and compressed postings, held compactly in memory.
+
+    Behaves like the `{term: [list, of, docIDs]}` dictionary `json.load()` gives, so it can be used in its place.
+    Looking up a term binary searches the first terms of the blocks, then decodes only the one block it can be in.
+    """
+
+    def __init__(self, file: Path):
+        """
+        Read a front-coded index written by `write_front_coded_index()`.
+
+        :param file: The file to read
+        """
+
+        with open(file, 'rb') as f:
+            data = f.read()
+
+        magic, version, self._size, self.block_size, coded_size = _HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{file} is not a version {VERSION} front-coded index")
+
+        blocks = -(-self._size // self.block_size)
+        position = _HEADER.size
+
+        self._block_offsets = array('I')
+        self._block_offsets.frombytes(data[position:position + 4 * blocks])
+        position += 4 * blocks
+
+        self._postings_offsets = array('I')
+        self._postings_offsets.frombytes(data[position:position + 4 * (self._size + 1)])
+        position += 4 * (self._size + 1)
+
+        self._counts = array('I')
+        self._counts.frombytes(data[position:position + 4 * self._size])
+        position += 4 * self._size
+
+        self._coded = data[position:position + coded_size]
+        self._postings = data[position + coded_size:]
+
+    def _block(self, block: int) -> List[str]:
+        """
+        Decode all terms of a block.
+
+        :param block: The number of the block
+        :return: The terms of the block, in order
+        """
+
+        start = self._block_offsets[block]
+        end = self._block_offsets[block + 1] if block + 1 < len(self._block_offsets) else len(self._coded)
+
+        terms = []
+        previous = b''
+        position = start
+        while position < end:
+            prefix, position = _read_vb(self._coded, position)
+            suffix, position = _read_vb(self._coded, position)
+            previous = previous[:prefix] + self._coded[position:position + suffix]
+            position += suffix
+            terms.append(previous.decode())
+
+        return terms
+
+    def _first_term(self, block: int) -> str:
+        """
+        Decode only the first term of a block, which is stored in full.
+
+        :param block: The number of the block
+        :return: The first term of the block
+        """
+
+        position = self._block_offsets[block]
+        _, position = _read_vb(self._coded, position)
+        length, position = _read_vb(self._coded, position)
+        return self._coded[position:position + length].decode()
+
+    def _find(self, term: str) -> int:
+        """
+        Find the position of a term, by binary searching the first terms of the blocks, then scanning its block.
+
+        :param term: The term to find
+        :return: The position of the term, or -1 if it is not in the dictionary
+        """
+
+        # Find the last block whose first term is not after the term
+        low, high = 0, len(self._block_offsets)
+        while low < high:
+            middle = (low + high) // 2
+            if self._first_term(middle) <= term:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low == 0:
+            return -1
+
+        block = low - 1
+        terms = self._block(block)
+        if term in terms:
+            return block * self.block_size + terms.index(term)
+        return -1
+
+    def postings(self, position: int) -> list:
+        """
+        Decode the postings list of the term at the given position in the sorted dictionary.
+
+        :param position: The position of the term
+        :return: The postings list of the term
+        """
+
+        data = self._postings[self._postings_offsets[position]:self._postings_offsets[position + 1]]
+        return list(iter_postings(data, self._counts[position], 'vb'))
+
+    def __getitem__(self, term: str) -> list:
+        position = self._find(term)
+        if position == -1:
+            raise KeyError(term)
+        return self.postings(position)
+
+    def __contains__(self, term: object) -> bool:
+        return isinstance(term, str) and self._find(term) != -1
+
+    def __iter__(self) -> Iterator[str]:
+        for block in range(len(self._block_offsets)):
+            yield from self._block(block)
+
+    def __len__(self) -> int:
+        return self._size
+
+
+def _read_vb(data: bytes, position: int) -> Tuple[int, int]:
+    """
+    Read a single variable-byte encoded number.
+
+    :param data: The bytes to read from
+    :param position: Where the number starts
+    :return: The number, and the position right after it
+    """
+
+    end = position
+    while not data[end] & 0x80:
+        end += 1
+    return next(vb_decode(data[position:end + 1])), end + 1
+
+
+def write_front_coded_index(index: Dict[str, list], file: Path, block_size: int = BLOCK_SIZE) -> int:
+    """
+    Write an index with a blocked front-coded dictionary, and gap-encoded, variable-byte compressed postings.
+
+    The file has a header, the offsets of the blocks in the front-coded terms, the offsets of each terms postings,
+    the number of postings of each term, the front-coded terms, then the compressed postings.
+
+    :param index: The index to write
+    :param file: The file to write the index to
+    :param block_size: How many terms go in each front-coded block
+    :return: The size of the front-coded dictionary, with its block offsets, in bytes
+    """
+
+    terms = sorted(index)
+    coded, block_offsets = front_code(terms, block_size)
+
+    postings_offsets = array('I', [0])
+    counts = array('I')
+    postings = bytearray()
+    for term in terms:
+        postings += vb_encode(gaps(index[term]))
+        postings_offsets.append(len(postings))
+        counts.append(len(index[term]))
+
+    with atomic_file(file, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(terms), block_size, len(coded)))
+        f.write(block_offsets.tobytes())
+        f.write(postings_offsets.tobytes())
+        f.write(counts.tobytes())
+        f.write(coded)
+        f.write(postings)
+
+    return len(coded) + block_offsets.itemsize * len(block_offsets)
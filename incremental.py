@@ -0,0 +1,184 @@
+import hashlib
+import json
+from pathlib import Path
+from typing import Dict, Iterable, List, Set, Tuple
+
+from index_writer import atomic_file
+from postings import merge_many
+
+# Where the content hash and docIDs of every indexed corpus file are saved, next to the naive index
+MANIFEST_FILE = Path('output/1. naive_index.manifest')
+
+# Where the index of only the new and changed documents of the last update is saved
+DELTA_FILE = Path('output/1. naive_index.delta.txt')
+
+# How many bytes of a corpus file are hashed at a time
+CHUNK_SIZE = 1 << 20
+
+
+class DocIDBitmap:
+    """
+    A set of docIDs stored as a bitmap, one bit per docID up to the largest one. NEWIDs are small and dense, so this is
+    far more compact than a set of Python ints, and checking a docID is a single byte lookup.
+    """
+
+    def __init__(self, doc_ids: Iterable[int] = ()):
+        """
+        Create a bitmap holding the given docIDs.
+
+        :param doc_ids: The docIDs to hold
+        """
+
+        self.bits = bytearray()
+        self._count = 0
+        for doc_id in doc_ids:
+            self.add(doc_id)
+
+    def add(self, doc_id: int) -> None:
+        """
+        Add a docID to the bitmap.
+
+        :param doc_id: The docID to add
+        """
+
+        byte = doc_id >> 3
+        if byte >= len(self.bits):
+            self.bits.extend(bytes(byte + 1 - len(self.bits)))
+
+        mask = 1 << (doc_id & 7)
+        if not self.bits[byte] & mask:
+            self.bits[byte] |= mask
+            self._count += 1
+
+    def __contains__(self, doc_id: int) -> bool:
+        byte = doc_id >> 3
+        return byte < len(self.bits) and bool(self.bits[byte] & 1 << (doc_id & 7))
+
+    def __len__(self) -> int:
+        return self._count
+
+
+def file_hash(file: Path) -> str:
+    """
+    Hash the content of a corpus file, to tell whether it changed since it was indexed.
+
+    :param file: The corpus file
+    :return: The SHA-256 hex digest of the file
+    """
+
+    digest = hashlib.sha256()
+    with open(file, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def load_manifest(file: Path = MANIFEST_FILE) -> Dict[str, dict]:
+    """
+    Load the manifest of the indexed corpus files.
+
+    :param file: The manifest file
+    :return: A dictionary of form `{file name: {'hash': content hash, 'newids': [list, of, docIDs]}}`, empty if nothing
+             has been indexed incrementally before
+    """
+
+    if not file.exists():
+        return {}
+
+    with open(file, 'rt') as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: Dict[str, dict], file: Path = MANIFEST_FILE) -> None:
+    """
+    Save the manifest of the indexed corpus files, atomically.
+
+    :param manifest: The manifest, as given by `load_manifest()`
+    :param file: The manifest file
+    """
+
+    print(f"Saving to file: {file}")
+
+    with atomic_file(file) as f:
+        json.dump(manifest, f)
+
+
+def forget() -> None:
+    """
+    Forget what the last incremental update indexed, once the naive index is built some other way, so the next update
+    starts from scratch rather than patching an index, and the indexes of subproject 3, it didn't build.
+    """
+
+    MANIFEST_FILE.unlink(missing_ok=True)
+    DELTA_FILE.unlink(missing_ok=True)
+
+
+def find_changes(files: List[Path], manifest: Dict[str, dict]) -> Tuple[Dict[Path, str], List[str], DocIDBitmap]:
+    """
+    Compare the corpus files to the manifest of the last time they were indexed.
+
+    The documents of changed and removed files are deleted. Changed files are then indexed again in full, alongside the
+    new files.
+
+    :param files: The corpus files
+    :param manifest: The manifest of the indexed corpus files
+    :return: The new and changed files, with their content hashes, the names of the removed files, and the docIDs to
+             delete from the index
+    """
+
+    to_index: Dict[Path, str] = {}
+    deleted = DocIDBitmap()
+
+    for file in files:
+        content_hash = file_hash(file)
+        indexed = manifest.get(file.name)
+
+        if indexed is None or indexed['hash'] != content_hash:
+            to_index[file] = content_hash
+        if indexed is not None and indexed['hash'] != content_hash:
+            for doc_id in indexed['newids']:
+                deleted.add(doc_id)
+
+    names = {file.name for file in files}
+    removed = [name for name in manifest if name not in names]
+    for name in removed:
+        for doc_id in manifest[name]['newids']:
+            deleted.add(doc_id)
+
+    return to_index, removed, deleted
+
+
+def apply_delta(index: Dict[str, list], delta: Dict[str, list],
+                deleted: DocIDBitmap) -> Tuple[Dict[str, list], Set[str]]:
+    """
+    Merge a delta segment into the main index, deleting docIDs along the way.
+
+    Postings lists are only copied for terms that actually change. Terms left with no postings are removed.
+
+    :param index: The main index
+    :param delta: The index of only the new and changed documents
+    :param deleted: The docIDs to delete from the main index. The delta is never filtered, so changed documents keep
+                    their docIDs
+    :return: The merged index, sorted by key, and the terms whose postings lists changed
+    """
+
+    affected = set(delta)
+    merged: Dict[str, list] = {}
+
+    for term in sorted(index.keys() | delta.keys()):
+        postings = index.get(term, [])
+
+        if len(deleted) and postings:
+            kept = [doc_id for doc_id in postings if doc_id not in deleted]
+            if len(kept) != len(postings):
+                affected.add(term)
+                postings = kept
+
+        if term in delta:
+            postings = merge_many([postings, delta[term]]) if postings else delta[term]
+
+        if postings:
+            merged[term] = postings
+
+    return merged, affected
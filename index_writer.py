@@ -0,0 +1,188 @@
+import atexit
+import json
+import os
+import stat
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from queue import Queue
+from typing import IO, Iterator, Optional, Union
+
+from metrics import METRICS
+
+# Default most index snapshots waiting to be saved, before handing over another one blocks
+MAX_PENDING = 2
+
+# The permissions new files get, read once, as the umask can only be read by setting it, which isn't thread-safe
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+@contextmanager
+def atomic_file(file: Union[str, Path], mode: str = 'wt', fsync: bool = True) -> Iterator[IO]:
+    """
+    Open a file for writing atomically: everything is written to a temporary file next to it, which only replaces the
+    file once it has been written in full. If writing fails, the temporary file is removed and the file is untouched,
+    so readers never see a half-written file.
+
+    The temporary file is flushed to disk before it replaces the file, and the directory after, so even after a power
+    loss the file is either the old one or the new one in full, never empty.
+
+    The file keeps the permissions it had, or gets those of a new file if it didn't exist.
+
+    :param file: The file to write
+    :param mode: The mode to open the file in, 'wt' or 'wb'
+    :param fsync: Whether to flush the file and its directory to disk. Without it, writing is faster, and still atomic
+                  for readers, but not after a power loss
+    :return: A context manager giving the open temporary file
+    """
+
+    file = Path(file)
+    descriptor, temporary = tempfile.mkstemp(dir=file.parent, prefix=f'.{file.name}.', suffix='.tmp')
+
+    try:
+        with os.fdopen(descriptor, mode) as f:
+            yield f
+
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+
+        # The temporary file is only readable by its owner
+        try:
+            permissions = stat.S_IMODE(file.stat().st_mode)
+        except FileNotFoundError:
+            permissions = 0o666 & ~_UMASK
+        os.chmod(temporary, permissions)
+
+        os.replace(temporary, file)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+    if fsync:
+        _fsync_directory(file.parent)
+
+    if METRICS.enabled:
+        METRICS.count('bytes_written', file.stat().st_size)
+
+
+def _fsync_directory(directory: Path) -> None:
+    """
+    Flush a directory to disk, so a file just renamed into it stays renamed after a power loss.
+
+    Directories can't be opened on Windows, where renames don't need this.
+
+    :param directory: The directory
+    """
+
+    if os.name == 'nt':
+        return
+
+    descriptor = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+@METRICS.timed()
+def write_index(index: dict, file: Union[str, Path]) -> None:
+    """
+    Save an index to file as JSON, atomically.
+
+    :param index: The index to save. Either a dictionary, or an index with a `dump()` method writing the same JSON,
+                  like `postings_store.PostingsStore`
+    :param file: The file to save it to
+    """
+
+    with atomic_file(file) as f:
+        if isinstance(index, dict):
+            json.dump(index, f)
+        else:
+            index.dump(f)
+
+
+class IndexWriter:
+    """
+    Saves index snapshots to file on a background thread, so serializing and writing one stage's index overlaps with
+    computing the next stage.
+
+    Snapshots wait in a bounded queue, so at most `max_pending` indexes are held in memory waiting to be saved. An
+    index handed over must not be changed afterwards, as it is saved as it is when its turn comes. Every file is
+    written atomically.
+    """
+
+    def __init__(self, max_pending: int = MAX_PENDING):
+        """
+        Create a writer. Its thread is only started when the first snapshot is handed over.
+
+        :param max_pending: The most snapshots waiting to be saved at once
+        """
+
+        self._queue: Queue = Queue(max_pending)
+        self._thread: Optional[threading.Thread] = None
+        self._error: Optional[BaseException] = None
+
+    def save(self, index: dict, file: Union[str, Path]) -> None:
+        """
+        Hand an index over to be saved to file in the background. Blocks while the queue is full.
+
+        :param index: The index to save. Must not be changed afterwards
+        :param file: The file to save it to
+        """
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='index-writer', daemon=True)
+            self._thread.start()
+
+        self._queue.put((index, file))
+
+    def _run(self) -> None:
+        """
+        Save the snapshots in the queue, in order, until the writer is closed.
+        """
+
+        while True:
+            snapshot = self._queue.get()
+            try:
+                if snapshot is None:
+                    return
+                if self._error is None:
+                    write_index(*snapshot)
+            except BaseException as error:
+                self._error = error
+            finally:
+                self._queue.task_done()
+
+    def flush(self) -> None:
+        """
+        Wait until every snapshot handed over so far has been saved.
+
+        Raises the first error the writer thread ran into, if any. Snapshots handed over after an error aren't saved.
+        """
+
+        self._queue.join()
+
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def close(self) -> None:
+        """
+        Save every snapshot handed over so far, then stop the writer thread.
+        """
+
+        if self._thread is None:
+            return
+
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        self.flush()
+
+
+# The writer shared by all subprojects. Anything still waiting is saved before the program exits
+WRITER = IndexWriter()
+atexit.register(WRITER.close)
@@ -0,0 +1,116 @@
+import json
+from pathlib import Path
+from typing import Dict, Iterable, List, Set
+
+from index_writer import atomic_file
+
+# Default length of the longest k-grams indexed
+K = 3
+
+
+class KGramIndex:
+    """
+    A character k-gram index over the terms of an inverted index's dictionary, for fast substring matching.
+
+    Every substring of every term up to `k` characters long is mapped to the sorted positions of the terms containing
+    it. To find the terms containing a query, only the terms containing all of the query's k-grams are checked, rather
+    than the whole dictionary. Every candidate is still checked with `query in term`, so the results are exactly the
+    same as a full scan.
+    """
+
+    def __init__(self, terms: Iterable[str], k: int = K, grams: Dict[str, List[int]] = None):
+        """
+        Create a k-gram index over the given terms.
+
+        :param terms: The terms of the dictionary
+        :param k: The length of the longest k-grams to index
+        :param grams: Already built k-grams of these terms, i.e. from `load()`. Built from the terms if not given
+        """
+
+        self.terms: List[str] = list(terms)
+        self.k = k
+
+        if grams is None:
+            grams = {}
+            for position, term in enumerate(self.terms):
+                # Every distinct substring of up to k characters, so shorter queries can be looked up too
+                for gram in {term[start:start + n] for n in range(1, k + 1) for start in range(len(term) - n + 1)}:
+                    grams.setdefault(gram, []).append(position)
+
+        self.grams = grams
+
+    def matches(self, query: str) -> List[str]:
+        """
+        Find all terms that contain the query.
+
+        :param query: The query to find in the terms
+        :return: The terms containing the query, in dictionary order
+        """
+
+        # Every term contains the empty string
+        if not query:
+            return list(self.terms)
+
+        # Candidates contain every k-gram of the query, but not necessarily the query itself
+        return [self.terms[position] for position in sorted(self.candidates(query)) if query in self.terms[position]]
+
+    def candidates(self, query: str) -> Set[int]:
+        """
+        Find the terms that contain every k-gram of the query. Every term containing the query is among them.
+
+        :param query: The query to find in the terms
+        :return: The positions of the candidate terms, in no particular order
+        """
+
+        # Every term contains the empty string
+        if not query:
+            return set(range(len(self.terms)))
+
+        # All k-grams of the query, or the query itself if it is shorter than k
+        n = min(len(query), self.k)
+        query_grams = {query[start:start + n] for start in range(len(query) - n + 1)}
+
+        # Intersect the term lists of the query's k-grams, rarest first
+        gram_positions = sorted((self.grams.get(gram, []) for gram in query_grams), key=len)
+        candidates = set(gram_positions[0])
+        for positions in gram_positions[1:]:
+            if not candidates:
+                break
+            candidates.intersection_update(positions)
+
+        return candidates
+
+    def save(self, file: Path) -> None:
+        """
+        Save the k-gram index to file, so it doesn't need to be built again.
+
+        :param file: The file to save the k-gram index to
+        """
+
+        with atomic_file(file) as f:
+            json.dump({'k': self.k, 'terms': self.terms, 'grams': self.grams}, f)
+
+    @classmethod
+    def load(cls, file: Path) -> 'KGramIndex':
+        """
+        Load a k-gram index saved with `save()`.
+
+        :param file: The file to load the k-gram index from
+        :return: The loaded k-gram index
+        """
+
+        with open(file, 'rt') as f:
+            saved = json.load(f)
+
+        return cls(saved['terms'], saved['k'], saved['grams'])
+
+
+def kgram_path(file: Path) -> Path:
+    """
+    Get the path a k-gram index of the given index file is saved to.
+
+    :param file: The index file, i.e. `output/1. naive_index.txt`
+    :return: The path of its k-gram index, i.e. `output/1. naive_index.kgrams`
+    """
+
+    return file.with_suffix('.kgrams')
@@ -1,29 +1,193 @@
+from argparse import ArgumentParser
 from pathlib import Path
 
+import benchmark
+import binary_index
+import query_server
+import segments
 import subproject1
 import subproject2
 import subproject3
+from metrics import METRICS
 
 
 if __name__ == '__main__':
     """Run the whole project"""
 
+    # Read the command line options
+    parser = ArgumentParser(description="Index and query the Reuters21578 corpus")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of worker processes to ingest the corpus with (default: 1, serial)")
+    parser.add_argument('--memory-budget', type=float, default=None, metavar='MB',
+                        help="Megabytes the serial indexer may hold in memory before flushing blocks to disk "
+                             "(default: no limit)")
+    parser.add_argument('--block-size', type=int, default=None, metavar='PAIRS',
+                        help="Build the index with blocked sort-based indexing, sorting this many (term, docID) pairs "
+                             "in memory at a time")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only index new or changed corpus files, and update the indexes of the last run")
+    parser.add_argument('--frequencies', action='store_true',
+                        help="Also record term frequencies and document lengths of the naive and stemmed indexes, "
+                             "for ranked queries")
+    parser.add_argument('--positions', action='store_true',
+                        help="Also build a positional index of the naive index, for phrase and proximity queries, "
+                             "and report its overhead")
+    parser.add_argument('--array-postings', action='store_true',
+                        help="Run the lossy compression stages of subproject 3 on an array-backed postings store, and "
+                             "report how much memory it saves")
+    parser.add_argument('--fused', action='store_true',
+                        help="Run the lossy compression stages of subproject 3 as a single streaming pass")
+    parser.add_argument('--write-intermediate', action='store_true',
+                        help="With --fused, also save the index after every stage, not only the stemmed one")
+    parser.add_argument('--binary', action='store_true',
+                        help="Convert the output indexes to the binary format, and run the sample queries on those")
+    parser.add_argument('--metrics', action='store_true',
+                        help="Time every stage and count documents, pairs and bytes written, saving the metrics of "
+                             "the run to output/metrics/ (also enabled by the REUTERS_METRICS environment variable)")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="With --metrics, also track the peak memory of every stage with tracemalloc, which "
+                             "slows the run down")
+    parser.add_argument('--metrics-summary', action='store_true',
+                        help="With --metrics, also show a table of the metrics at the end of the run")
+    parser.add_argument('--benchmark-boolean', action='store_true',
+                        help="Only benchmark Boolean AND queries on the existing indexes, then exit")
+    parser.add_argument('--benchmark-ranked', action='store_true',
+                        help="Only benchmark exhaustive against WAND-pruned BM25 ranking on the existing stemmed "
+                             "index, then exit")
+    parser.add_argument('--segments', action='store_true',
+                        help="Only ingest the corpus into a segmented index, one segment per corpus file, and run the "
+                             "sample queries on it, then exit")
+    parser.add_argument('--benchmark-segments', action='store_true',
+                        help="Only benchmark query latency on the existing naive index split into more and more "
+                             "segments, then exit")
+    parser.add_argument('--benchmark-suite', action='store_true',
+                        help="Only benchmark the whole pipeline and query latency on synthetic corpora, save the "
+                             "results as JSON to output/benchmarks/, then exit")
+    parser.add_argument('--benchmark-scales', type=float, nargs='+', default=[1.0], metavar='SCALE',
+                        help="With --benchmark-suite, the sizes of synthetic corpus to benchmark on, relative to "
+                             "Reuters-21578, i.e. 1 10 100 (default: 1)")
+    parser.add_argument('--benchmark-repeat', type=int, default=3,
+                        help="With --benchmark-suite, how many times to time each pipeline benchmark (default: 3)")
+    parser.add_argument('--benchmark-corpus', type=Path, default=None, metavar='DIR',
+                        help="With --benchmark-suite, keep the synthetic corpora in this directory and reuse them "
+                             "(default: generate them into temporary directories)")
+    parser.add_argument('--benchmark-baseline', type=Path, default=None, metavar='FILE',
+                        help="With --benchmark-suite, compare the results to those of an earlier run")
+    parser.add_argument('--batch-queries', type=Path, default=None, metavar='FILE',
+                        help="Only search the existing naive and stemmed indexes for every query in a file, one per "
+                             "line, in a single pass over each, saving the results to query_results/batch_queries/, "
+                             "then exit")
+    parser.add_argument('--raw-queries', action='store_true',
+                        help="With --batch-queries, search for the queries as they are, without case-folding and "
+                             "stemming them first")
+    parser.add_argument('--serve', action='store_true',
+                        help="Only serve queries on the naive and stemmed indexes over a local TCP socket, with a "
+                             "newline-delimited JSON protocol, until interrupted")
+    parser.add_argument('--load-test', action='store_true',
+                        help="Only send load to a running query server at increasing concurrency, report throughput "
+                             "and tail latency, then exit")
+    parser.add_argument('--host', default=query_server.HOST,
+                        help=f"With --serve or --load-test, the address of the query server (default: "
+                             f"{query_server.HOST})")
+    parser.add_argument('--port', type=int, default=query_server.PORT,
+                        help=f"With --serve or --load-test, the port of the query server (default: "
+                             f"{query_server.PORT})")
+    parser.add_argument('--cache-size', type=int, default=subproject2.RESULT_CACHE_SIZE, metavar='QUERIES',
+                        help=f"The most search results the query engine caches, 0 to disable the result cache "
+                             f"(default: {subproject2.RESULT_CACHE_SIZE})")
+    parser.add_argument('--postings-cache-size', type=int, default=subproject2.POSTINGS_CACHE_SIZE, metavar='TERMS',
+                        help=f"The most decoded postings lists of binary, front-coded and segmented indexes the query "
+                             f"engine caches, 0 to disable the postings cache "
+                             f"(default: {subproject2.POSTINGS_CACHE_SIZE})")
+    parser.add_argument('--cache-policy', choices=subproject2.CACHE_POLICIES, default='lru',
+                        help="How the query engine's caches evict entries: the least recently or the least frequently "
+                             "used first (default: lru)")
+    parser.add_argument('--check-parallel', action='store_true',
+                        help="Only check that the parallel index is byte-identical to the serial index, then exit")
+    parser.add_argument('--check-tokenizer', action='store_true',
+                        help="Only check that the tokenizer gives the same tokens as clean() and word_tokenize(), "
+                             "then exit")
+    args = parser.parse_args()
+
+    if args.metrics or args.trace_memory or args.metrics_summary:
+        METRICS.enable(args.trace_memory, args.metrics_summary)
+
+    subproject2.ENGINE.set_caches(args.cache_size, args.postings_cache_size, args.cache_policy)
+
+    if args.check_parallel:
+        identical = subproject1.check_parallel_index(max(args.workers, 2))
+        raise SystemExit(0 if identical else 1)
+
+    if args.check_tokenizer:
+        raise SystemExit(0 if subproject1.check_tokenizer_parity() else 1)
+
+    if args.benchmark_boolean:
+        subproject2.boolean_benchmark(Path('output/1. naive_index.txt'))
+        subproject2.boolean_benchmark(Path('output/5. stemmed_index.txt'))
+        raise SystemExit(0)
+
+    if args.benchmark_ranked:
+        subproject2.ranked_benchmark(Path('output/5. stemmed_index.txt'))
+        raise SystemExit(0)
+
+    if args.segments:
+        subproject1.ingest_segments(args.workers)
+        subproject2.sample_query_processor(segments.SEGMENTS_DIR / segments.MANIFEST_NAME, subproject=1)
+        raise SystemExit(0)
+
+    if args.benchmark_segments:
+        subproject2.segment_benchmark(Path('output/1. naive_index.txt'))
+        raise SystemExit(0)
+
+    if args.batch_queries is not None:
+        subproject2.batch_query_processor(args.batch_queries, not args.raw_queries)
+        raise SystemExit(0)
+
+    if args.serve:
+        query_server.serve(args.host, args.port)
+        raise SystemExit(0)
+
+    if args.load_test:
+        query_server.load_test(args.host, args.port)
+        raise SystemExit(0)
+
+    if args.benchmark_suite:
+        benchmark.benchmark_suite(args.benchmark_scales, args.benchmark_repeat, args.benchmark_corpus,
+                                  args.benchmark_baseline)
+        raise SystemExit(0)
+
     # Run subproject 1
     print("\nRUNNING SUBPROJECT 1...")
-    subproject1.subproject_1()
+    memory_budget = None if args.memory_budget is None else int(args.memory_budget * 1024 * 1024)
+    affected = subproject1.subproject_1(args.workers, memory_budget, args.block_size, args.incremental,
+                                        args.frequencies, args.positions)
 
     # Run subproject 3
     print("\n-----------------\n\nRUNNING SUBPROJECT 3...")
-    subproject3.subproject_3()
+    subproject3.subproject_3(args.workers, args.fused, not args.fused or args.write_intermediate, affected,
+                             args.frequencies, args.array_postings)
+
+    # Convert the indexes to the binary format, if asked to
+    suffix = '.txt'
+    if args.binary:
+        print("\n-----------------\n\nCONVERTING INDEXES TO BINARY FORMAT...")
+        binary_index.convert_outputs()
+        suffix = '.dict'
 
     # Run the subproject 2 query processor on the uncompressed naive index
     print("\n-----------------\n\nRUNNING SUBPROJECT 2 (on uncompressed index)")
-    subproject2.sample_query_processor(Path('output/1. naive_index.txt'), subproject=1)
+    subproject2.sample_query_processor(Path('output/1. naive_index' + suffix), subproject=1)
 
     # Run the subproject 2 query processor on the compressed naive index
     print("\n-----------------\n\nRUNNING SUBPROJECT 2 (on compressed index)")
-    subproject2.sample_query_processor(Path('output/5. stemmed_index.txt'), subproject=3)
+    subproject2.sample_query_processor(Path('output/5. stemmed_index' + suffix), subproject=3)
 
     # Run the subproject 2 query processor on challenge queries
     print("\n-----------------\n\nRUNNING SUBPROJECT 2 (on challenge queries)")
     subproject2.challenge_query_processor(['pineapple', 'Chrysler', 'Bundesbank'])
+
+    # Run phrase and proximity queries on the positional index, if there is one
+    if args.positions:
+        print("\n-----------------\n\nRUNNING SUBPROJECT 2 (on positional index)")
+        subproject2._positional_query("Bundesbank president", Path('output/1. naive_index.txt'), 1)
+        subproject2._positional_query("Bundesbank NEAR/5 president", Path('output/1. naive_index.txt'), 1)
@@ -0,0 +1,386 @@
+import atexit
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from utilities import render_metrics_table
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, where peak RSS isn't reported
+    resource = None
+
+# The environment variable enabling metrics. Any value enables them; 'memory' and 'summary' in it turn on tracemalloc
+# peak tracking and the summary table too, i.e. `REUTERS_METRICS=memory,summary`
+ENVIRONMENT_VARIABLE = 'REUTERS_METRICS'
+
+# Where the metrics file of each run is saved
+METRICS_DIR = Path('output/metrics')
+
+# What a timer gives when metrics are disabled: a shared context manager that does nothing
+_DISABLED = nullcontext()
+
+
+def peak_rss() -> Optional[int]:
+    """
+    Get the peak resident set size of this process so far.
+
+    :return: The peak RSS in bytes, or None where it can't be measured
+    """
+
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class _Timer:
+    """
+    Times a single span of code for `Metrics.timer()`, and, if tracked, the peak memory allocated during it.
+    """
+
+    __slots__ = ('metrics', 'name', 'tick', 'memory')
+
+    def __init__(self, metrics: 'Metrics', name: str):
+        self.metrics = metrics
+        self.name = name
+        self.memory = metrics.trace_memory and threading.current_thread() is threading.main_thread()
+
+    def __enter__(self) -> '_Timer':
+        if self.memory:
+            self.metrics._enter_memory()
+        self.tick = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        seconds = time.perf_counter() - self.tick
+        peak = self.metrics._exit_memory() if self.memory else None
+        self.metrics._record(self.name, seconds, 1, peak)
+
+
+class Metrics:
+    """
+    Lightweight instrumentation: named timers, used as context managers or decorators, and named counters. Optionally,
+    the peak memory allocated during each timer is tracked with `tracemalloc`.
+
+    Disabled by default, in which case a timer is a shared no-op context manager, a decorated function only checks a
+    flag before being called, and a counter only checks the flag. Once enabled, a metrics file is saved when the program
+    exits, and a summary table shown if asked for.
+
+    Timers are inclusive: a timer running inside another counts towards both. A decorated generator is timed across
+    every item it yields, not counting the time its consumer takes, and each item counts as a call.
+
+    Work handed to worker processes is only recorded if the function run there is wrapped with `collect()`, and its
+    results passed through `gather()`, i.e. `METRICS.gather(executor.map(METRICS.collect(function), items))`.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.trace_memory = False
+        self.summary = False
+        self.timers: Dict[str, dict] = {}
+        self.counters: Dict[str, int] = {}
+
+        self._lock = threading.Lock()
+        self._started = 0.0
+        self._registered = False
+
+        # Per memory-tracked timer under way, the memory allocated when it started, and the highest peak seen in it
+        self._memory_stack: List[List[int]] = []
+
+    def enable(self, trace_memory: bool = False, summary: bool = False) -> None:
+        """
+        Start recording metrics, and save them when the program exits.
+
+        :param trace_memory: Whether to track the peak memory allocated during each timer, with `tracemalloc`. Slows
+                             down everything that allocates
+        :param summary: Whether to also show a summary table when the program exits
+        """
+
+        self.enabled = True
+        self.trace_memory = trace_memory
+        self.summary = summary
+        self._started = time.perf_counter()
+
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+        if not self._registered:
+            atexit.register(self.finish)
+            self._registered = True
+
+    def timer(self, name: str):
+        """
+        Time the enclosed code, i.e. `with METRICS.timer('sort_pairs'): ...`.
+
+        :param name: The name of the timer. Every span with the same name adds up
+        :return: A context manager timing its block
+        """
+
+        if not self.enabled:
+            return _DISABLED
+
+        return _Timer(self, name)
+
+    def timed(self, name: Optional[str] = None) -> Callable[[Callable], Callable]:
+        """
+        Time every call of the decorated function, i.e. `@METRICS.timed('create_index')`.
+
+        :param name: The name of the timer. Defaults to the function's name
+        :return: The decorator
+        """
+
+        def decorate(function: Callable) -> Callable:
+            label = name or function.__name__
+
+            if inspect.isgeneratorfunction(function):
+                @functools.wraps(function)
+                def timed_generator(*args, **kwargs):
+                    if not self.enabled:
+                        return (yield from function(*args, **kwargs))
+                    return (yield from self._time_items(label, function(*args, **kwargs)))
+
+                return timed_generator
+
+            @functools.wraps(function)
+            def timed_function(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with _Timer(self, label):
+                    return function(*args, **kwargs)
+
+            return timed_function
+
+        return decorate
+
+    def _time_items(self, name: str, generator):
+        """
+        Pass the items of a generator through, timing how long it takes to give each one.
+
+        :param name: The name of the timer
+        :param generator: The generator to time
+        :return: A generator of the same items, returning what the generator returns
+        """
+
+        while True:
+            tick = time.perf_counter()
+            try:
+                item = next(generator)
+            except StopIteration as stop:
+                self._record(name, time.perf_counter() - tick, 0, None)
+                return stop.value
+            self._record(name, time.perf_counter() - tick, 1, None)
+            yield item
+
+    def collect(self, function: Callable) -> Callable:
+        """
+        Wrap a function to run in worker processes, so each call hands what it recorded back with its result, for
+        `gather()` to add to this process's metrics.
+
+        :param function: The function to run in the workers. Must be picklable, i.e. defined at the top of a module
+        :return: A picklable function giving (result, recorded) tuples
+        """
+
+        return functools.partial(_collect_call, function, self.enabled)
+
+    def gather(self, results: Iterable[Tuple[object, Optional[dict]]]) -> Iterator[object]:
+        """
+        Add what the calls of a function wrapped with `collect()` recorded to this process's metrics.
+
+        :param results: The (result, recorded) tuples of the calls
+        :return: A generator of the results of the calls, in order
+        """
+
+        for result, recorded in results:
+            if recorded is not None:
+                self._merge(recorded)
+            yield result
+
+    def _merge(self, recorded: dict) -> None:
+        """
+        Add the timers and counters recorded elsewhere to this process's metrics.
+
+        :param recorded: The raw timers and counters, as `_collect_call()` gives them
+        """
+
+        with self._lock:
+            for name, other in recorded['timers'].items():
+                stats = self.timers.get(name)
+                if stats is None:
+                    stats = self.timers[name] = {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'peak_bytes': None}
+
+                stats['calls'] += other['calls']
+                stats['seconds'] += other['seconds']
+                stats['max_seconds'] = max(stats['max_seconds'], other['max_seconds'])
+                if other['peak_bytes'] is not None:
+                    stats['peak_bytes'] = max(stats['peak_bytes'] or 0, other['peak_bytes'])
+
+            for name, total in recorded['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + total
+
+    def count(self, name: str, amount: int = 1) -> None:
+        """
+        Add to a counter, i.e. `METRICS.count('bytes_written', size)`.
+
+        :param name: The name of the counter
+        :param amount: How much to add
+        """
+
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def _record(self, name: str, seconds: float, calls: int, peak: Optional[int]) -> None:
+        """
+        Add a timed span to its timer.
+
+        :param name: The name of the timer
+        :param seconds: How long the span took
+        :param calls: How many calls, or items, the span counts as
+        :param peak: The peak memory allocated during the span, in bytes, if tracked
+        """
+
+        with self._lock:
+            stats = self.timers.get(name)
+            if stats is None:
+                stats = self.timers[name] = {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'peak_bytes': None}
+
+            stats['calls'] += calls
+            stats['seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+            if peak is not None:
+                stats['peak_bytes'] = max(stats['peak_bytes'] or 0, peak)
+
+    def _enter_memory(self) -> None:
+        """
+        Start tracking the peak memory of a timer. `tracemalloc` only keeps a single peak, so it is reset for the new
+        timer, after handing the peak so far to the timer it runs in, if any.
+        """
+
+        current, peak = tracemalloc.get_traced_memory()
+        if self._memory_stack:
+            self._memory_stack[-1][1] = max(self._memory_stack[-1][1], peak)
+
+        tracemalloc.reset_peak()
+        self._memory_stack.append([current, current])
+
+    def _exit_memory(self) -> int:
+        """
+        Stop tracking the peak memory of a timer, and hand it to the timer it runs in, if any.
+
+        :return: The most memory allocated during the timer, over what was allocated when it started, in bytes
+        """
+
+        start, highest = self._memory_stack.pop()
+        peak = max(highest, tracemalloc.get_traced_memory()[1])
+
+        if self._memory_stack:
+            self._memory_stack[-1][1] = max(self._memory_stack[-1][1], peak)
+
+        return peak - start
+
+    def report(self) -> dict:
+        """
+        Get everything recorded so far.
+
+        :return: A dictionary of the run's wall time and peak RSS, every timer's calls, total, mean and max time, calls
+                 per second and peak memory, and every counter's total and rate per second of the run
+        """
+
+        wall = time.perf_counter() - self._started
+
+        with self._lock:
+            timers = {name: {'calls': stats['calls'], 'seconds': stats['seconds'],
+                             'mean_ms': stats['seconds'] / stats['calls'] * 1000 if stats['calls'] else None,
+                             'max_ms': stats['max_seconds'] * 1000,
+                             'per_second': stats['calls'] / stats['seconds'] if stats['seconds'] else None,
+                             'peak_bytes': stats['peak_bytes']}
+                      for name, stats in self.timers.items()}
+            counters = {name: {'total': total, 'per_second': total / wall if wall else None}
+                        for name, total in self.counters.items()}
+
+        return {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'argv': sys.argv, 'wall_seconds': wall,
+                'peak_rss_bytes': peak_rss(), 'trace_memory': self.trace_memory, 'timers': timers,
+                'counters': counters}
+
+    def save(self, report: Optional[dict] = None, directory: Path = METRICS_DIR) -> Path:
+        """
+        Save everything recorded so far to a JSON file named after the time.
+
+        :param report: What to save, from `report()`. Defaults to everything recorded so far
+        :param directory: The directory to save the metrics file to
+        :return: The file the metrics were saved to
+        """
+
+        if report is None:
+            report = self.report()
+
+        directory.mkdir(exist_ok=True, parents=True)
+        file = directory / f"metrics-{report['time'].replace(':', '')}.json"
+
+        print(f"\nSaving to file: {file}")
+        with open(file, 'wt') as f:
+            json.dump(report, f, indent=2)
+
+        return file
+
+    def finish(self) -> None:
+        """
+        Save the metrics file of the run, and show the summary table if asked for. Run when the program exits.
+        """
+
+        if not self.enabled:
+            return
+
+        # Only what the program itself did is part of the run
+        self.enabled = False
+
+        report = self.report()
+        self.save(report)
+
+        if self.summary:
+            render_metrics_table(report)
+
+
+def _collect_call(function: Callable, enabled: bool, *args) -> Tuple[object, Optional[dict]]:
+    """
+    Call a function in a worker process, recording only what this call does. See `Metrics.collect()`.
+
+    :param function: The function to call
+    :param enabled: Whether metrics are enabled in the process that handed the call over
+    :param args: The arguments to call it with
+    :return: Its result, and the raw timers and counters it recorded, or None if metrics are disabled
+    """
+
+    if not enabled:
+        return function(*args), None
+
+    # Start afresh, as a worker runs many calls, and a forked one starts with a copy of its parent's metrics. Never
+    # saved when the worker exits, they are handed back instead
+    METRICS.enabled = True
+    METRICS.timers, METRICS.counters = {}, {}
+
+    result = function(*args)
+    return result, {'timers': METRICS.timers, 'counters': METRICS.counters}
+
+
+# The metrics shared by every module, enabled by the environment variable or the `--metrics` flag of main.py
+METRICS = Metrics()
+
+_options = os.environ.get(ENVIRONMENT_VARIABLE, '')
+if _options:
+    METRICS.enable(trace_memory='memory' in _options, summary='summary' in _options)
@@ -0,0 +1,220 @@
+import json
+import struct
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+from index_writer import atomic_file
+from postings import gallop, intersect_galloping
+from postings_compression import gaps, vb_decode, vb_encode
+
+# Header of a positional index file: the length of its JSON dictionary, in bytes
+_HEADER = struct.Struct('<Q')
+
+# The postings of a term with their positions: (docID, [sorted positions of the term in the document])
+Positions = List[Tuple[int, List[int]]]
+
+
+def positions_path(file: Path) -> Path:
+    """
+    Get the path the positional index of the given index file is saved to.
+
+    :param file: The index file, i.e. `output/1. naive_index.txt`
+    :return: The path of its positional index, i.e. `output/1. naive_index.positions`
+    """
+
+    return file.with_suffix('.positions')
+
+
+def encode_positions(postings: Positions) -> bytes:
+    """
+    Encode the postings of a term with their positions.
+
+    The docIDs are gap-encoded. Each is followed by the number of its positions, then the positions, gap-encoded too.
+    Everything is variable-byte encoded. Positions start at 0, so their gaps are never negative.
+
+    :param postings: The (docID, positions) pairs of the term, sorted by docID
+    :return: The encoded bytes
+    """
+
+    numbers = []
+    previous = 0
+    for doc_id, positions in postings:
+        numbers.append(doc_id - previous)
+        numbers.append(len(positions))
+        numbers.extend(gaps(positions))
+        previous = doc_id
+
+    return vb_encode(numbers)
+
+
+def decode_positions(data: bytes) -> Positions:
+    """
+    Decode the postings of a term with their positions, encoded with `encode_positions()`.
+
+    :param data: The encoded bytes
+    :return: The (docID, positions) pairs of the term, sorted by docID
+    """
+
+    numbers = vb_decode(data)
+    postings = []
+    doc_id = 0
+
+    for gap in numbers:
+        doc_id += gap
+        positions = []
+        position = 0
+        for _ in range(next(numbers)):
+            position += next(numbers)
+            positions.append(position)
+        postings.append((doc_id, positions))
+
+    return postings
+
+
+def write_positional_index(entries: Iterable[Tuple[str, Positions]], file: Path) -> int:
+    """
+    Write a positional index to file, atomically.
+
+    The file starts with the length of its dictionary, then the dictionary as JSON, of form
+    `{term: [offset, length, count]}`, with the offset and length in bytes of each terms encoded postings, and the
+    number of documents it is in. Then come all the encoded postings, as given by `encode_positions()`.
+
+    :param entries: The (term, postings with positions) entries of the index, in order
+    :param file: The file to write the positional index to
+    :return: The total size of the encoded postings, in bytes
+    """
+
+    dictionary: Dict[str, List[int]] = {}
+    blobs: List[bytes] = []
+    offset = 0
+
+    for term, postings in entries:
+        blob = encode_positions(postings)
+        dictionary[term] = [offset, len(blob), len(postings)]
+        blobs.append(blob)
+        offset += len(blob)
+
+    encoded_dictionary = json.dumps(dictionary).encode()
+
+    with atomic_file(file, 'wb') as f:
+        f.write(_HEADER.pack(len(encoded_dictionary)))
+        f.write(encoded_dictionary)
+        for blob in blobs:
+            f.write(blob)
+
+    return offset
+
+
+class PositionalIndex:
+    """
+    A positional index read from file. Each terms postings are kept encoded in memory, and only decoded when the term
+    is queried.
+    """
+
+    def __init__(self, file: Path):
+        """
+        Read a positional index written by `write_positional_index()`.
+
+        :param file: The positional index file
+        """
+
+        with open(file, 'rb') as f:
+            (length,) = _HEADER.unpack(f.read(_HEADER.size))
+            self.dictionary: Dict[str, List[int]] = json.loads(f.read(length))
+            self.data = f.read()
+
+    def __contains__(self, term: str) -> bool:
+        return term in self.dictionary
+
+    def document_frequency(self, term: str) -> int:
+        """
+        Get the number of documents a term is in, without decoding its positions.
+
+        :param term: The term
+        :return: The number of documents it is in, 0 if it isn't in the index
+        """
+
+        if term not in self.dictionary:
+            return 0
+
+        return self.dictionary[term][2]
+
+    def postings(self, term: str) -> Positions:
+        """
+        Decode the postings of a term with their positions.
+
+        :param term: The term
+        :return: The (docID, positions) pairs of the term, sorted by docID, empty if it isn't in the index
+        """
+
+        if term not in self.dictionary:
+            return []
+
+        offset, length, _ = self.dictionary[term]
+        return decode_positions(self.data[offset:offset + length])
+
+
+def phrase_match(postings: List[Positions], offsets: List[int]) -> List[int]:
+    """
+    Find the documents where the terms of a phrase occur at the given offsets from each other.
+
+    The terms should be given rarest first. The documents of the rarest term are intersected with each other terms by
+    galloping, then, in each document left, the start positions the rarest term allows are intersected with the start
+    positions each other term allows, again by galloping.
+
+    :param postings: The (docID, positions) pairs of each term of the phrase, rarest first
+    :param offsets: The position of each term in the phrase, in the same order
+    :return: The sorted docIDs containing the phrase
+    """
+
+    # Documents containing every term
+    doc_ids = [doc_id for doc_id, _ in postings[0]]
+    for term_postings in postings[1:]:
+        if not doc_ids:
+            return []
+        doc_ids = intersect_galloping(doc_ids, [doc_id for doc_id, _ in term_postings])
+
+    # Look up the positions of each term in those documents
+    by_doc = [dict(term_postings) for term_postings in postings]
+
+    answer = []
+    for doc_id in doc_ids:
+        # Where the phrase could start, going by the rarest term
+        starts = [position - offsets[0] for position in by_doc[0][doc_id]]
+        for positions, offset in zip(by_doc[1:], offsets[1:]):
+            starts = intersect_galloping(starts, [position - offset for position in positions[doc_id]])
+            if not starts:
+                break
+        if starts:
+            answer.append(doc_id)
+
+    return answer
+
+
+def proximity_match(first: Positions, second: Positions, distance: int) -> List[int]:
+    """
+    Find the documents where two terms occur within the given distance of each other, in either order.
+
+    :param first: The (docID, positions) pairs of the rarer term
+    :param second: The (docID, positions) pairs of the other term
+    :param distance: The most positions apart the terms may be
+    :return: The sorted docIDs where the terms are close enough
+    """
+
+    first_positions, second_positions = dict(first), dict(second)
+    doc_ids = intersect_galloping([doc_id for doc_id, _ in first], [doc_id for doc_id, _ in second])
+
+    answer = []
+    for doc_id in doc_ids:
+        positions = second_positions[doc_id]
+        start = 0
+        for position in first_positions[doc_id]:
+            # Skip ahead to the first position of the other term that is close enough from below
+            start = gallop(positions, position - distance, start)
+            if start == len(positions):
+                break
+            if positions[start] <= position + distance:
+                answer.append(doc_id)
+                break
+
+    return answer
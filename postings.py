@@ -0,0 +1,170 @@
+from bisect import bisect_left
+from math import isqrt
+from typing import List
+
+
+def skip_length(postings: List[int]) -> int:
+    """
+    Get the distance between skip pointers for a postings list.
+
+    Skip pointers are implicit: every `skip_length()`th position of the list is a skip pointer to the position that
+    many places further on. Evenly spacing sqrt(length) of them works well in practice.
+
+    :param postings: The postings list
+    :return: The distance between skip pointers, at least 1
+    """
+
+    return max(isqrt(len(postings)), 1)
+
+
+def intersect(first: List[int], second: List[int]) -> List[int]:
+    """
+    Intersect two sorted postings lists with a linear merge, following skip pointers where they don't overshoot.
+
+    :param first: A sorted postings list
+    :param second: Another sorted postings list
+    :return: The sorted docIDs in both lists
+    """
+
+    answer = []
+    first_skip, second_skip = skip_length(first), skip_length(second)
+    first_length, second_length = len(first), len(second)
+    i = j = 0
+
+    while i < first_length and j < second_length:
+        if first[i] == second[j]:
+            answer.append(first[i])
+            i += 1
+            j += 1
+
+        elif first[i] < second[j]:
+            # Follow the skip pointer in the first list, if there is one and it doesn't skip past the second docID
+            if i % first_skip == 0 and i + first_skip < first_length and first[i + first_skip] <= second[j]:
+                i += first_skip
+            else:
+                i += 1
+
+        else:
+            # Likewise for the second list
+            if j % second_skip == 0 and j + second_skip < second_length and second[j + second_skip] <= first[i]:
+                j += second_skip
+            else:
+                j += 1
+
+    return answer
+
+
+def gallop(postings: List[int], target: int, start: int = 0) -> int:
+    """
+    Find the first position at or after `start` holding a docID of at least `target`, by galloping: stepping ahead 1,
+    2, 4, 8... places until overshooting, then binary searching the last step. Takes time logarithmic in how far
+    ahead the position is, rather than in the length of the list.
+
+    :param postings: A sorted postings list
+    :param target: The docID to find
+    :param start: Where to start looking
+    :return: The position of the first docID at least `target`, or the length of the list if there is none
+    """
+
+    step = 1
+    low, high = start, start
+    while high < len(postings) and postings[high] < target:
+        low = high + 1
+        high += step
+        step *= 2
+
+    return bisect_left(postings, target, low, min(high, len(postings)))
+
+
+def intersect_galloping(first: List[int], second: List[int]) -> List[int]:
+    """
+    Intersect two sorted postings lists by galloping through the longer one for each docID of the shorter one. Much
+    faster than a linear merge when one list is far shorter than the other.
+
+    :param first: A sorted postings list
+    :param second: Another sorted postings list
+    :return: The sorted docIDs in both lists
+    """
+
+    if len(first) > len(second):
+        first, second = second, first
+
+    answer = []
+    position = 0
+    for doc_id in first:
+        position = gallop(second, doc_id, position)
+        if position == len(second):
+            break
+        if second[position] == doc_id:
+            answer.append(doc_id)
+
+    return answer
+
+
+def union(first: List[int], second: List[int]) -> List[int]:
+    """
+    Union two sorted postings lists with a linear merge.
+
+    :param first: A sorted postings list
+    :param second: Another sorted postings list
+    :return: The sorted docIDs in either list, without duplicates
+    """
+
+    answer = []
+    i = j = 0
+
+    while i < len(first) and j < len(second):
+        if first[i] == second[j]:
+            answer.append(first[i])
+            i += 1
+            j += 1
+        elif first[i] < second[j]:
+            answer.append(first[i])
+            i += 1
+        else:
+            answer.append(second[j])
+            j += 1
+
+    answer.extend(first[i:])
+    answer.extend(second[j:])
+
+    return answer
+
+
+def difference(first: List[int], second: List[int]) -> List[int]:
+    """
+    Remove the docIDs of one sorted postings list from another, with a linear merge.
+
+    :param first: The sorted postings list to remove docIDs from
+    :param second: The sorted postings list of docIDs to remove
+    :return: The sorted docIDs in the first list but not the second
+    """
+
+    answer = []
+    j = 0
+
+    for doc_id in first:
+        while j < len(second) and second[j] < doc_id:
+            j += 1
+        if j == len(second) or second[j] != doc_id:
+            answer.append(doc_id)
+
+    return answer
+
+
+def merge_many(postings_lists: List[List[int]]) -> List[int]:
+    """
+    Union any number of sorted postings lists at once.
+
+    A single set union and sort over all the lists runs in C, and beats a k-way merge with `heapq.merge()`, which
+    steps through every docID in Python.
+
+    :param postings_lists: The sorted postings lists
+    :return: The sorted docIDs in any of the lists, without duplicates
+    """
+
+    # Nothing to merge. The list is already sorted and unique
+    if len(postings_lists) == 1:
+        return postings_lists[0]
+
+    return sorted(set().union(*postings_lists))
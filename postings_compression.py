@@ -0,0 +1,190 @@
+import json
+import struct
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from index_writer import atomic_file
+
+# Header of a compressed index file: the length of its JSON dictionary, in bytes
+_HEADER = struct.Struct('<Q')
+
+
+def gaps(postings: Iterable[int]) -> Iterator[int]:
+    """
+    Gap-encode a sorted postings list: keep the first docID, then the differences between consecutive docIDs.
+
+    :param postings: The sorted postings list
+    :return: A generator of the gaps
+    """
+
+    previous = 0
+    for doc_id in postings:
+        yield doc_id - previous
+        previous = doc_id
+
+
+def vb_encode(numbers: Iterable[int]) -> bytes:
+    """
+    Variable-byte encode non-negative numbers.
+
+    Each number is split into 7-bit chunks, most significant first. The last byte of each number has its high bit set.
+
+    :param numbers: The numbers to encode
+    :return: The encoded bytes
+    """
+
+    encoded = bytearray()
+
+    for number in numbers:
+        chunks = [number & 0x7F | 0x80]
+        number >>= 7
+        while number:
+            chunks.append(number & 0x7F)
+            number >>= 7
+        encoded.extend(reversed(chunks))
+
+    return bytes(encoded)
+
+
+def vb_decode(data: bytes) -> Iterator[int]:
+    """
+    Decode variable-byte encoded numbers, one at a time.
+
+    :param data: The encoded bytes
+    :return: A generator of the decoded numbers
+    """
+
+    number = 0
+    for byte in data:
+        if byte & 0x80:
+            yield number << 7 | byte & 0x7F
+            number = 0
+        else:
+            number = number << 7 | byte
+
+
+def gamma_encode(numbers: Iterable[int]) -> bytes:
+    """
+    Elias-gamma encode positive numbers.
+
+    Each number is written as the length of its binary offset (its binary form without the leading 1) in unary, as
+    that many 1s followed by a 0, then the offset itself. The bits are padded with 0s to a whole number of bytes.
+
+    :param numbers: The numbers to encode. All must be at least 1
+    :return: The encoded bytes
+    """
+
+    bits = []
+    for number in numbers:
+        if number < 1:
+            raise ValueError(f"Elias-gamma can only encode positive numbers, not {number}")
+
+        offset = bin(number)[3:]
+        bits.append('1' * len(offset) + '0' + offset)
+
+    bit_string = ''.join(bits)
+    if not bit_string:
+        return b''
+
+    # Pad to a whole number of bytes
+    bit_string += '0' * (-len(bit_string) % 8)
+    return int(bit_string, 2).to_bytes(len(bit_string) // 8, 'big')
+
+
+def gamma_decode(data: bytes, count: int) -> Iterator[int]:
+    """
+    Decode Elias-gamma encoded numbers, one at a time.
+
+    The padding at the end can't be told apart from more numbers, so the count of numbers has to be known.
+
+    :param data: The encoded bytes
+    :param count: How many numbers were encoded
+    :return: A generator of the decoded numbers
+    """
+
+    bit_string = ''.join(f'{byte:08b}' for byte in data)
+    position = 0
+
+    for _ in range(count):
+        length = bit_string.index('0', position) - position
+        start = position + length + 1
+        position = start + length
+        yield int('1' + bit_string[start:position], 2)
+
+
+# Every codec by name: an encoder of gaps, and a decoder of (data, count) back into gaps
+CODECS = {
+    'vb': (vb_encode, lambda data, count: vb_decode(data)),
+    'gamma': (gamma_encode, gamma_decode),
+}
+
+
+def iter_postings(data: bytes, count: int, codec: str) -> Iterator[int]:
+    """
+    Decode a compressed postings list one docID at a time, without materializing the whole list.
+
+    :param data: The compressed gaps of the postings list
+    :param count: How many docIDs are in the postings list
+    :param codec: The name of the codec the gaps were compressed with, from `CODECS`
+    :return: A generator of the docIDs
+    """
+
+    doc_id = 0
+    for gap in CODECS[codec][1](data, count):
+        doc_id += gap
+        yield doc_id
+
+
+def write_compressed_index(index: Dict[str, list], file: Path, codec: str) -> int:
+    """
+    Write an index to file, with its postings lists gap-encoded and compressed with the given codec.
+
+    The file starts with the length of its dictionary, then the dictionary as JSON, of form
+    `{term: [offset, length, count]}`, with the offset and length in bytes of each terms compressed postings. Then
+    come all the compressed postings lists.
+
+    :param index: The index to compress
+    :param file: The file to write the compressed index to
+    :param codec: The name of the codec to compress the gaps with, from `CODECS`
+    :return: The total size of the compressed postings lists, in bytes
+    """
+
+    encode = CODECS[codec][0]
+
+    dictionary: Dict[str, List[int]] = {}
+    blobs: List[bytes] = []
+    offset = 0
+
+    for term, postings in index.items():
+        blob = encode(gaps(postings))
+        dictionary[term] = [offset, len(blob), len(postings)]
+        blobs.append(blob)
+        offset += len(blob)
+
+    encoded_dictionary = json.dumps(dictionary).encode()
+
+    with atomic_file(file, 'wb') as f:
+        f.write(_HEADER.pack(len(encoded_dictionary)))
+        f.write(encoded_dictionary)
+        for blob in blobs:
+            f.write(blob)
+
+    return offset
+
+
+def read_compressed_index(file: Path, codec: str) -> Iterator[Tuple[str, Iterator[int]]]:
+    """
+    Read an index written by `write_compressed_index()`, decoding each postings list lazily.
+
+    :param file: The compressed index file
+    :param codec: The name of the codec the index was compressed with, from `CODECS`
+    :return: A generator of (term, postings) tuples, where each postings is a generator of docIDs
+    """
+
+    with open(file, 'rb') as f:
+        (length,) = _HEADER.unpack(f.read(_HEADER.size))
+        dictionary = json.loads(f.read(length))
+        data = f.read()
+
+    for term, (offset, size, count) in dictionary.items():
+        yield term, iter_postings(data[offset:offset + size], count, codec)
@@ -0,0 +1,251 @@
+import json
+import sys
+from collections import defaultdict
+from collections.abc import Mapping
+from typing import IO, Callable, Dict, Iterator, List
+
+import numpy as np
+
+# The type every docID is stored as
+DOC_ID = np.int32
+
+# How many times longer one postings list must be than the other to intersect by binary searching it
+SEARCH_RATIO = 32
+
+
+def union(first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    """
+    Union two sorted postings arrays.
+
+    :param first: A sorted postings array
+    :param second: Another sorted postings array
+    :return: The sorted docIDs in either array, without duplicates
+    """
+
+    return np.union1d(first, second)
+
+
+def intersect(first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    """
+    Intersect two sorted postings arrays.
+
+    If one is far shorter than the other, each of its docIDs is binary searched for in the longer one, all at once with
+    `np.searchsorted()`. Otherwise they are intersected with `np.intersect1d()`.
+
+    :param first: A sorted postings array
+    :param second: Another sorted postings array
+    :return: The sorted docIDs in both arrays
+    """
+
+    if len(first) > len(second):
+        first, second = second, first
+
+    if len(first) * SEARCH_RATIO < len(second):
+        found = np.searchsorted(second, first)
+        inside = found < len(second)
+        return first[inside][second[found[inside]] == first[inside]]
+
+    return np.intersect1d(first, second, assume_unique=True)
+
+
+def difference(first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    """
+    Remove the docIDs of one sorted postings array from another.
+
+    :param first: The sorted postings array to remove docIDs from
+    :param second: The sorted postings array of docIDs to remove
+    :return: The sorted docIDs in the first array but not the second
+    """
+
+    return np.setdiff1d(first, second, assume_unique=True)
+
+
+def merge_many(postings_arrays: List[np.ndarray]) -> np.ndarray:
+    """
+    Union any number of sorted postings arrays at once.
+
+    :param postings_arrays: The sorted postings arrays
+    :return: The sorted docIDs in any of the arrays, without duplicates
+    """
+
+    # Nothing to merge. The array is already sorted and unique
+    if len(postings_arrays) == 1:
+        return postings_arrays[0]
+
+    return np.unique(np.concatenate(postings_arrays))
+
+
+class PostingsStore(Mapping):
+    """
+    An index whose postings lists are all stored in one contiguous array of 32-bit docIDs, with the offset of each
+    term's postings in it.
+
+    A Python list of docIDs takes 8 bytes per slot and 28 bytes per boxed int. Here, each docID takes 4 bytes. Looking up
+    a term gives a NumPy view of its postings, without copying them. Sizes, stopwords and merges are computed with
+    vectorized NumPy routines rather than Python loops.
+
+    Behaves like the `{term: [list, of, docIDs]}` dictionary `json.load()` gives, except that postings are arrays.
+    """
+
+    def __init__(self, terms: List[str], doc_ids: np.ndarray, offsets: np.ndarray):
+        """
+        Create a postings store.
+
+        :param terms: The terms, in the order their postings are stored
+        :param doc_ids: All postings, one term's after the other
+        :param offsets: Where each term's postings start in `doc_ids`, and, last, where they all end
+        """
+
+        self.terms = terms
+        self.doc_ids = doc_ids
+        self.offsets = offsets
+        self._positions: Dict[str, int] = {term: position for position, term in enumerate(terms)}
+
+    @classmethod
+    def from_index(cls, index: Mapping) -> 'PostingsStore':
+        """
+        Store an index of postings lists, keeping its order of terms.
+
+        :param index: The index, i.e. as given by `json.load()`
+        :return: The postings store of the index
+        """
+
+        terms = list(index.keys())
+        lengths = np.fromiter((len(index[term]) for term in terms), dtype=np.int64, count=len(terms))
+
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+
+        doc_ids = np.fromiter((doc_id for term in terms for doc_id in index[term]), dtype=DOC_ID,
+                              count=int(offsets[-1]))
+
+        return cls(terms, doc_ids, offsets)
+
+    @classmethod
+    def from_arrays(cls, terms: List[str], postings_arrays: List[np.ndarray]) -> 'PostingsStore':
+        """
+        Store the given postings arrays, one after the other.
+
+        :param terms: The terms, in order
+        :param postings_arrays: The postings array of each term, in the same order
+        :return: The postings store
+        """
+
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum([len(postings) for postings in postings_arrays], out=offsets[1:])
+
+        doc_ids = np.concatenate(postings_arrays) if postings_arrays else np.empty(0, dtype=DOC_ID)
+        return cls(terms, doc_ids.astype(DOC_ID, copy=False), offsets)
+
+    def __getitem__(self, term: str) -> np.ndarray:
+        position = self._positions[term]
+        return self.doc_ids[self.offsets[position]:self.offsets[position + 1]]
+
+    def __contains__(self, term: object) -> bool:
+        return term in self._positions
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.terms)
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def lengths(self) -> np.ndarray:
+        """
+        Get the length of every postings list, in term order.
+
+        :return: The lengths
+        """
+
+        return np.diff(self.offsets)
+
+    def postings_size(self) -> int:
+        """
+        Get the number of total postings, without looking at any postings list.
+
+        :return: The number of total postings
+        """
+
+        return len(self.doc_ids)
+
+    def most_common(self, count: int) -> List[str]:
+        """
+        Get the terms with the longest postings lists. Ties keep their order in the store.
+
+        :param count: How many terms to get
+        :return: The most common terms, most common first
+        """
+
+        order = np.argsort(-self.lengths(), kind='stable')[:count]
+        return [self.terms[position] for position in order]
+
+    def select(self, keep: Callable[[str], bool]) -> 'PostingsStore':
+        """
+        Create a new store with only the terms that pass the test, gathering their postings in one vectorized step.
+
+        :param keep: Whether to keep a term
+        :return: The new store
+        """
+
+        kept = np.fromiter((keep(term) for term in self.terms), dtype=bool, count=len(self.terms))
+        positions = np.flatnonzero(kept)
+
+        lengths = self.lengths()[positions]
+        offsets = np.zeros(len(positions) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+
+        # The index in the old array of every kept docID: the old start of its term, plus its place in the term
+        gather = np.repeat(self.offsets[positions] - offsets[:-1], lengths) + np.arange(offsets[-1])
+
+        return PostingsStore([self.terms[position] for position in positions], self.doc_ids[gather], offsets)
+
+    def normalize(self, normalize: Callable[[str], str]) -> 'PostingsStore':
+        """
+        Create a new store with normalized terms, merging the postings of terms that normalize to the same new term.
+
+        :param normalize: The function giving the normalized form of a term
+        :return: The new store, sorted by term, alphabetically
+        """
+
+        groups = defaultdict(list)
+        for term in self.terms:
+            groups[normalize(term)].append(self[term])
+
+        terms = sorted(groups)
+        return PostingsStore.from_arrays(terms, [merge_many(groups[term]) for term in terms])
+
+    def to_dict(self) -> Dict[str, list]:
+        """
+        Convert the store back to a dictionary of Python lists.
+
+        :return: A dictionary of form `{term: [list, of, docIDs]}`
+        """
+
+        return {term: self[term].tolist() for term in self.terms}
+
+    def dump(self, f: IO) -> None:
+        """
+        Write the store to a file as JSON, the same as `json.dump()` of `to_dict()` would.
+
+        :param f: The open file to write to
+        """
+
+        f.write('{')
+        for number, term in enumerate(self.terms):
+            if number:
+                f.write(', ')
+            f.write(f'{json.dumps(term)}: {json.dumps(self[term].tolist())}')
+        f.write('}')
+
+    def memory_size(self) -> int:
+        """
+        Get the memory taken by the store: the arrays, and the terms with their lookup table.
+
+        :return: The size in bytes
+        """
+
+        size = self.doc_ids.nbytes + self.offsets.nbytes
+        size += sys.getsizeof(self.terms) + sum(map(sys.getsizeof, self.terms))
+        size += sys.getsizeof(self._positions) + sum(map(sys.getsizeof, range(len(self.terms))))
+
+        return size
@@ -0,0 +1,328 @@
+import asyncio
+import json
+import random
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from benchmark import RESULTS_DIR, percentile
+from subproject2 import ENGINE, _search_query, batch_query, normalize_query
+
+# Where the query server listens by default
+HOST = '127.0.0.1'
+PORT = 8765
+
+# The indexes the server keeps resident, by name, with the subproject each belongs to
+INDEX_FILES: Dict[str, Tuple[Path, int]] = {'naive': (Path('output/1. naive_index.txt'), 1),
+                                            'stemmed': (Path('output/5. stemmed_index.txt'), 3)}
+
+# The longest request line the server reads, in bytes, so large batches fit
+MAX_LINE = 1 << 24
+
+# Default queries of the load generator: the sample and challenge queries, and terms production traffic asks for a lot
+LOAD_QUERIES = ["abnormally", "017", "Zweig", "males", "CORRECTED", "texts", "pineapple", "Chrysler", "Bundesbank",
+                "dollar", "yen", "mark", "sterling", "OPEC", "Texaco", "IBM", "gold", "oil", "bank", "rate"]
+
+# Default concurrency levels of the load generator, and how many queries each batch request of it holds
+LOAD_CONCURRENCY = (1, 2, 4, 8, 16, 32)
+LOAD_BATCH_SIZE = 10
+
+
+class QueryServer:
+    """
+    Answers queries over a local TCP socket, with the naive and stemmed indexes loaded once, at startup, and kept
+    resident in the shared query engine.
+
+    The protocol is newline-delimited JSON: each request is a single line holding a JSON object, answered by a single
+    line holding a JSON object, in order, on the same connection. A request has:
+
+     - `type`: `"search"` to find every term containing the query, like `_search_query()`, `"term"` to look up a single
+       term exactly, `"batch"` to search a list of queries in a single pass, like `batch_query()`, or `"stats"` to get
+       the hit and miss counts of the query engine's result and postings caches. Defaults to `"search"`
+     - `query`, or `queries` for a batch
+     - `index`: `"naive"` or `"stemmed"`. Defaults to both
+     - `normalize`: whether to case-fold and stem queries first, like `challenge_query_processor()`. Defaults to true
+     - `id`: anything, sent back with the answer
+
+    The answer has `results`, by index, holding the postings list of a single query, or `{query: postings}` for a
+    batch, the same shape as the files in `query_results/`. Queries are answered with their normalized form, as
+    `query`. A stats request is answered with `stats` instead, and a bad request with an `error`.
+
+    Queries are CPU-bound and quick, so they are answered on the event loop itself. Waiting on clients never blocks.
+    """
+
+    def __init__(self, files: Dict[str, Tuple[Path, int]] = None):
+        """
+        Create a query server. Its indexes are loaded by `load()`.
+
+        :param files: The index files to serve, by name, with the subproject each belongs to
+        """
+
+        self.files = INDEX_FILES if files is None else files
+
+    def load(self) -> None:
+        """
+        Load every index and build its k-gram index, so the first queries don't pay for it.
+        """
+
+        for name, (file, _) in self.files.items():
+            print(f"Loading the {name} index: {file}")
+            ENGINE.index(file)
+            ENGINE.kgrams(file)
+
+    def answer(self, request: dict) -> dict:
+        """
+        Answer a single request.
+
+        :param request: The request, see the class description
+        :return: The answer
+        """
+
+        if not isinstance(request, dict):
+            raise ValueError("A request must be a JSON object")
+
+        kind = request.get('type', 'search')
+        if kind == 'stats':
+            return {'id': request.get('id'), 'stats': ENGINE.cache_stats()}
+
+        names = [request['index']] if 'index' in request else list(self.files)
+        for name in names:
+            if name not in self.files:
+                raise ValueError(f"Unknown index \"{name}\"")
+
+        if kind == 'batch':
+            queries = request['queries']
+        elif kind in ('search', 'term'):
+            queries = [request['query']]
+        else:
+            raise ValueError(f"Unknown request type \"{kind}\"")
+
+        if not all(isinstance(query, str) for query in queries):
+            raise ValueError("Queries must be strings")
+        if request.get('normalize', True):
+            queries = [normalize_query(query) for query in queries]
+
+        results = {}
+        for name in names:
+            file, subproject = self.files[name]
+            if kind == 'term':
+                results[name] = ENGINE.postings(queries[0], file)
+            elif kind == 'search':
+                results[name] = _search_query(queries[0], file, subproject, show_results=False)
+            else:
+                results[name] = batch_query(queries, file)
+
+        answer = {'id': request.get('id'), 'results': results}
+        if kind != 'batch':
+            answer['query'] = queries[0]
+
+        return answer
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Answer every request of a single connection, until the client closes it.
+
+        :param reader: The connection's incoming stream
+        :param writer: The connection's outgoing stream
+        """
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+
+                request = None
+                try:
+                    request = json.loads(line)
+                    answer = self.answer(request)
+                except (ValueError, KeyError, TypeError) as error:
+                    answer = {'id': request.get('id') if isinstance(request, dict) else None, 'error': repr(error)}
+
+                writer.write(json.dumps(answer).encode() + b'\n')
+                await writer.drain()
+
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            # The client went away, or sent a line too long to read
+            pass
+
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = HOST, port: int = PORT) -> None:
+        """
+        Load the indexes, then answer queries until cancelled.
+
+        :param host: The address to listen on
+        :param port: The port to listen on
+        """
+
+        self.load()
+
+        server = await asyncio.start_server(self._handle, host, port, limit=MAX_LINE)
+        print(f"\nServing queries on {host}:{port}")
+
+        async with server:
+            await server.serve_forever()
+
+
+def serve(host: str = HOST, port: int = PORT) -> None:
+    """
+    Run a query server until interrupted.
+
+    :param host: The address to listen on
+    :param port: The port to listen on
+    """
+
+    try:
+        asyncio.run(QueryServer().serve(host, port))
+    except KeyboardInterrupt:
+        print("\nStopped serving queries")
+
+
+async def _client(host: str, port: int, requests: List[dict], latencies: List[float]) -> int:
+    """
+    Send requests over a single connection, one after the other, each once the last one is answered.
+
+    :param host: The address of the query server
+    :param port: The port of the query server
+    :param requests: The requests to send
+    :param latencies: Where to add the seconds each request took
+    :return: The number of requests answered with an error
+    """
+
+    reader, writer = await asyncio.open_connection(host, port, limit=MAX_LINE)
+    errors = 0
+
+    try:
+        for request in requests:
+            tick = time.perf_counter()
+            writer.write(json.dumps(request).encode() + b'\n')
+            await writer.drain()
+            answer = json.loads(await reader.readline())
+            latencies.append(time.perf_counter() - tick)
+
+            if 'error' in answer:
+                errors += 1
+
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+    return errors
+
+
+async def _cache_stats(host: str, port: int) -> dict:
+    """
+    Ask a query server for the stats of its caches.
+
+    :param host: The address of the query server
+    :param port: The port of the query server
+    :return: The stats of its result and postings caches, by name
+    """
+
+    reader, writer = await asyncio.open_connection(host, port, limit=MAX_LINE)
+
+    try:
+        writer.write(json.dumps({'type': 'stats'}).encode() + b'\n')
+        await writer.drain()
+        return json.loads(await reader.readline())['stats']
+
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+def _load_requests(rng: random.Random, count: int, queries: Sequence[str]) -> List[dict]:
+    """
+    Make up a mix of requests: mostly substring searches, some exact term lookups, and some batches.
+
+    :param rng: The random number generator to pick requests with
+    :param count: How many requests to make up
+    :param queries: The queries to pick from
+    :return: The requests
+    """
+
+    requests = []
+    for number in range(count):
+        roll = rng.random()
+        if roll < 0.6:
+            requests.append({'id': number, 'type': 'search', 'query': rng.choice(queries)})
+        elif roll < 0.9:
+            requests.append({'id': number, 'type': 'term', 'query': rng.choice(queries)})
+        else:
+            requests.append({'id': number, 'type': 'batch', 'queries': rng.choices(queries, k=LOAD_BATCH_SIZE)})
+
+    return requests
+
+
+async def _load_level(host: str, port: int, concurrency: int, requests: List[dict]) -> dict:
+    """
+    Send requests with a number of concurrent clients, each on its own connection.
+
+    :param host: The address of the query server
+    :param port: The port of the query server
+    :param concurrency: How many clients to send requests at once
+    :param requests: The requests, shared out between the clients
+    :return: The throughput and latencies at this concurrency
+    """
+
+    latencies: List[float] = []
+
+    tick = time.perf_counter()
+    errors = await asyncio.gather(*(_client(host, port, requests[number::concurrency], latencies)
+                                    for number in range(concurrency)))
+    seconds = time.perf_counter() - tick
+
+    return {'concurrency': concurrency, 'requests': len(latencies), 'errors': sum(errors), 'seconds': seconds,
+            'throughput': len(latencies) / seconds, 'p50_ms': percentile(latencies, 50) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000, 'p999_ms': percentile(latencies, 99.9) * 1000,
+            'max_ms': max(latencies) * 1000}
+
+
+def load_test(host: str = HOST, port: int = PORT, concurrency_levels: Sequence[int] = LOAD_CONCURRENCY,
+              requests: int = 2000, queries: Optional[Sequence[str]] = None, seed: int = 0) -> Path:
+    """
+    Generate load on a running query server at increasing concurrency, and report the throughput and tail latency at
+    each level. The results are saved as JSON next to the benchmark results, so runs can be compared.
+
+    Every level sends the same requests: a mix of substring searches, exact term lookups and batches, picked at
+    random from the queries. Each client sends its next request as soon as its last one is answered.
+
+    :param host: The address of the query server
+    :param port: The port of the query server
+    :param concurrency_levels: The numbers of concurrent clients to send requests with
+    :param requests: How many requests to send at each level
+    :param queries: The queries to pick from. Defaults to the sample and challenge queries, and common terms
+    :param seed: The seed to pick requests with
+    :return: The file the results were saved to
+    """
+
+    load = _load_requests(random.Random(seed), requests, LOAD_QUERIES if queries is None else queries)
+    print(f"\nSending {requests:,} requests to {host}:{port} at concurrency {', '.join(map(str, concurrency_levels))}"
+          f"...")
+
+    levels = []
+    for concurrency in concurrency_levels:
+        level = asyncio.run(_load_level(host, port, concurrency, load))
+        levels.append(level)
+        print(f"{concurrency} clients: {level['throughput']:,.0f} requests/s, p50 {level['p50_ms']:0.3f} ms, "
+              f"p99 {level['p99_ms']:0.3f} ms, p99.9 {level['p999_ms']:0.3f} ms, max {level['max_ms']:0.3f} ms, "
+              f"{level['errors']} errors")
+
+    # The queries are skewed towards a few, so most should be answered from the server's caches
+    caches = asyncio.run(_cache_stats(host, port))
+    for name, stats in caches.items():
+        hit_rate = 'n/a' if stats['hit_rate'] is None else f"{stats['hit_rate']:0.1%}"
+        print(f"{name.capitalize()} cache ({stats['policy'].upper()}, {stats['size']:,}/{stats['max_size']:,} "
+              f"entries): {stats['hits']:,} hits, {stats['misses']:,} misses, hit rate {hit_rate}")
+
+    RESULTS_DIR.mkdir(exist_ok=True, parents=True)
+    file = RESULTS_DIR / f"load-test-{time.strftime('%Y-%m-%dT%H%M%S')}.json"
+
+    print(f"\nSaving to file: {file}")
+    with open(file, 'wt') as f:
+        json.dump({'host': host, 'port': port, 'requests': requests, 'seed': seed, 'levels': levels,
+                   'caches': caches}, f, indent=2)
+
+    return file
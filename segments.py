@@ -0,0 +1,352 @@
+import json
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from index_writer import atomic_file, write_index
+from postings import merge_many
+
+# Where the segmented index is kept by default
+SEGMENTS_DIR = Path('output/segments')
+
+# The file listing the live segments of a segmented index, in its directory
+MANIFEST_NAME = 'manifest.json'
+
+# Default number of segments of a tier merged together at once, and the size of each tier relative to the one below
+MERGE_FACTOR = 4
+
+# Default number of postings below which a segment is in the lowest tier
+MIN_SEGMENT_SIZE = 10_000
+
+# The most loaded segments kept in memory, shared by all segmented indexes
+MAX_CACHED_SEGMENTS = 64
+
+# Segments are immutable, so once loaded they can be shared by every snapshot listing them
+_SEGMENT_CACHE: OrderedDict[Path, Dict[str, list]] = OrderedDict()
+_CACHE_LOCK = threading.Lock()
+
+
+def read_manifest(directory: Path) -> dict:
+    """
+    Read the manifest of a segmented index.
+
+    :param directory: The directory of the segmented index
+    :return: A dictionary of form `{'next': number of the next segment, 'segments': [{'name': file name,
+             'terms': dictionary size, 'postings': postings size}]}`, with no segments if there is no manifest yet
+    """
+
+    file = directory / MANIFEST_NAME
+    if not file.exists():
+        return {'next': 0, 'segments': []}
+
+    with open(file, 'rt') as f:
+        return json.load(f)
+
+
+def load_segment(file: Path) -> Dict[str, list]:
+    """
+    Load a segment, or get it from the cache of loaded segments.
+
+    :param file: The segment file
+    :return: The index of the segment
+    """
+
+    file = file.resolve()
+
+    with _CACHE_LOCK:
+        segment = _SEGMENT_CACHE.get(file)
+        if segment is not None:
+            _SEGMENT_CACHE.move_to_end(file)
+            return segment
+
+    with open(file, 'rt') as f:
+        segment = json.load(f)
+
+    with _CACHE_LOCK:
+        _SEGMENT_CACHE[file] = segment
+        while len(_SEGMENT_CACHE) > MAX_CACHED_SEGMENTS:
+            _SEGMENT_CACHE.popitem(last=False)
+
+    return segment
+
+
+def tier(postings: int, merge_factor: int = MERGE_FACTOR, min_size: int = MIN_SEGMENT_SIZE) -> int:
+    """
+    Get the tier of a segment of the given size. Each tier holds segments `merge_factor` times larger than the one
+    below, so merging `merge_factor` segments of a tier gives a segment of the next tier up.
+
+    :param postings: The postings size of the segment
+    :param merge_factor: How many times larger each tier is than the one below
+    :param min_size: The postings size below which a segment is in the lowest tier
+    :return: The tier, 0 for the smallest segments
+    """
+
+    level, size = 0, min_size
+    while postings >= size:
+        level += 1
+        size *= merge_factor
+
+    return level
+
+
+class SegmentedIndex(Mapping):
+    """
+    A read-only snapshot of a segmented index: the segments its manifest listed when it was opened.
+
+    Behaves like the `{term: [list, of, docIDs]}` dictionary `json.load()` gives, so it can be used in its place.
+    Looking up a term fans out across all segments and unions the postings lists found. Segments merged away after the
+    snapshot was opened stay loaded in it, so a background merge never changes the results of a query under way.
+    """
+
+    def __init__(self, manifest_file: Path):
+        """
+        Open a snapshot of the segmented index of the given manifest.
+
+        :param manifest_file: The manifest of the segmented index
+        """
+
+        directory = manifest_file.parent
+
+        # A merge may remove a listed segment before it is loaded, in which case the newer manifest lists its
+        # replacement
+        manifest = read_manifest(directory)
+        while True:
+            try:
+                self.segments: List[Dict[str, list]] = [load_segment(directory / segment['name'])
+                                                        for segment in manifest['segments']]
+                break
+            except FileNotFoundError:
+                latest = read_manifest(directory)
+                if latest == manifest:
+                    raise
+                manifest = latest
+
+        self._terms: Optional[List[str]] = None
+
+    def __getitem__(self, term: str) -> list:
+        postings_lists = [segment[term] for segment in self.segments if term in segment]
+        if not postings_lists:
+            raise KeyError(term)
+        return merge_many(postings_lists)
+
+    def __contains__(self, term: object) -> bool:
+        return any(term in segment for segment in self.segments)
+
+    def __iter__(self) -> Iterator[str]:
+        if self._terms is None:
+            self._terms = sorted(set().union(*self.segments))
+        return iter(self._terms)
+
+    def __len__(self) -> int:
+        if self._terms is None:
+            self._terms = sorted(set().union(*self.segments))
+        return len(self._terms)
+
+
+class SegmentStore:
+    """
+    Writes a segmented index: every ingestion batch is written as its own immutable segment, and listed in a manifest.
+
+    A tiered merge policy keeps the number of segments down. Whenever a tier holds `merge_factor` segments, they are
+    merged into one segment of the next tier up, by a background thread, so ingestion never waits for merges. The
+    manifest is replaced atomically, so readers always see either the merged segments or their merge, never both.
+    """
+
+    def __init__(self, directory: Path = SEGMENTS_DIR, merge_factor: Optional[int] = MERGE_FACTOR,
+                 min_size: int = MIN_SEGMENT_SIZE, background: bool = True):
+        """
+        Open a segmented index for writing, creating it if it doesn't exist.
+
+        :param directory: The directory of the segmented index
+        :param merge_factor: How many segments of a tier to merge together. None means never merge
+        :param min_size: The postings size below which a segment is in the lowest tier
+        :param background: Whether to merge in a background thread, or right after adding each segment
+        """
+
+        self.directory = directory
+        self.merge_factor = merge_factor
+        self.min_size = min_size
+        self.background = background
+
+        self.directory.mkdir(exist_ok=True, parents=True)
+        self.manifest_file = directory / MANIFEST_NAME
+
+        # Guards reading and replacing the manifest
+        self._lock = threading.Lock()
+
+        self._wake = threading.Condition()
+        self._pending = False
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self._error: Optional[BaseException] = None
+
+    def add_segment(self, index: Dict[str, list]) -> str:
+        """
+        Write an index as a new segment, and list it in the manifest.
+
+        :param index: The index of the ingestion batch
+        :return: The file name of the new segment
+        """
+
+        name = self._reserve_name()
+        write_index(index, self.directory / name)
+
+        with self._lock:
+            manifest = read_manifest(self.directory)
+            manifest['segments'].append(_describe(name, index))
+            self._save_manifest(manifest)
+
+        self._schedule_merge()
+        return name
+
+    def _reserve_name(self) -> str:
+        """
+        Take the next free segment file name.
+
+        :return: The file name
+        """
+
+        with self._lock:
+            manifest = read_manifest(self.directory)
+            name = f"segment-{manifest['next']:06d}.txt"
+            manifest['next'] += 1
+            self._save_manifest(manifest)
+
+        return name
+
+    def _save_manifest(self, manifest: dict) -> None:
+        """
+        Replace the manifest, atomically. Must be called holding the lock.
+
+        :param manifest: The new manifest
+        """
+
+        with atomic_file(self.manifest_file) as f:
+            json.dump(manifest, f)
+
+    def _pick(self, segments: List[dict]) -> List[dict]:
+        """
+        Pick the segments to merge next: the oldest `merge_factor` segments of the lowest tier holding that many.
+
+        :param segments: The live segments, from the manifest
+        :return: The segments to merge, or an empty list if there is nothing to merge
+        """
+
+        if self.merge_factor is None:
+            return []
+
+        tiers: Dict[int, List[dict]] = {}
+        for segment in segments:
+            tiers.setdefault(tier(segment['postings'], self.merge_factor, self.min_size), []).append(segment)
+
+        for level in sorted(tiers):
+            if len(tiers[level]) >= self.merge_factor:
+                return tiers[level][:self.merge_factor]
+
+        return []
+
+    def merge(self) -> int:
+        """
+        Merge segments until no tier holds `merge_factor` segments.
+
+        :return: The number of merges done
+        """
+
+        merges = 0
+
+        while True:
+            with self._lock:
+                picked = self._pick(read_manifest(self.directory)['segments'])
+            if not picked:
+                return merges
+
+            # Only merges remove segments, and only one merge runs at a time, so the picked segments stay live
+            loaded = [load_segment(self.directory / segment['name']) for segment in picked]
+            merged = {term: merge_many([segment[term] for segment in loaded if term in segment])
+                      for term in sorted(set().union(*loaded))}
+
+            name = self._reserve_name()
+            write_index(merged, self.directory / name)
+
+            # Replace the picked segments with their merge, where the first of them was
+            names = {segment['name'] for segment in picked}
+            with self._lock:
+                manifest = read_manifest(self.directory)
+                position = next(i for i, segment in enumerate(manifest['segments']) if segment['name'] in names)
+                manifest['segments'] = [segment for segment in manifest['segments'] if segment['name'] not in names]
+                manifest['segments'].insert(position, _describe(name, merged))
+                self._save_manifest(manifest)
+
+            # Snapshots already holding the merged segments keep them in memory
+            for segment in picked:
+                (self.directory / segment['name']).unlink()
+
+            merges += 1
+
+    def _schedule_merge(self) -> None:
+        """
+        Have the merge policy run, in the background thread if there is one.
+        """
+
+        if not self.background:
+            self.merge()
+            return
+
+        with self._wake:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='segment-merger', daemon=True)
+                self._thread.start()
+            self._pending = True
+            self._wake.notify()
+
+    def _run(self) -> None:
+        """
+        Run the merge policy whenever a segment is added, until the store is closed.
+        """
+
+        while True:
+            with self._wake:
+                self._wake.wait_for(lambda: self._pending or self._stopping)
+                if not self._pending:
+                    return
+                self._pending = False
+
+            try:
+                self.merge()
+            except BaseException as error:
+                self._error = error
+
+    def close(self) -> None:
+        """
+        Finish every merge still to do, then stop the background thread. Adding another segment starts it again.
+
+        Raises the first error the background thread ran into, if any.
+        """
+
+        if self._thread is not None:
+            # The thread only stops once no merge is pending
+            with self._wake:
+                self._stopping = True
+                self._wake.notify()
+            self._thread.join()
+
+            self._thread = None
+            self._stopping = False
+
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+
+def _describe(name: str, index: Dict[str, list]) -> dict:
+    """
+    Describe a segment for the manifest.
+
+    :param name: The file name of the segment
+    :param index: The index of the segment
+    :return: Its manifest entry
+    """
+
+    return {'name': name, 'terms': len(index), 'postings': sum(len(postings) for postings in index.values())}
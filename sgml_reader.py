@@ -0,0 +1,146 @@
+import html
+import re
+from pathlib import Path
+from typing import Iterator, NamedTuple, Optional
+
+# How many bytes of a corpus file to read at a time
+CHUNK_SIZE = 1 << 20
+
+# Patterns used to pick apart the raw SGML, compiled once
+_ARTICLE_END = b'</REUTERS>'
+_NEWID = re.compile(rb'<REUTERS[^>]*\sNEWID="(\d+)"')
+_TEXT = re.compile(r'<TEXT[^>]*>(.*?)</TEXT>', re.S | re.I)
+_ELEMENT = re.compile(r'<([A-Za-z]+)[^>]*>(.*?)</\1\s*>', re.S)
+_TAG = re.compile(r'</?[A-Za-z][^>]*>')
+_REFERENCE = re.compile(r'&(#[0-9]+|#[xX][0-9a-fA-F]+|[A-Za-z][A-Za-z0-9]*);?')
+
+# Elements of an articles text that add clutter, and are left out of the article text
+SKIPPED_ELEMENTS = ('dateline', 'title')
+
+
+class Article(NamedTuple):
+    """A lightweight record of a single Reuters article"""
+
+    newid: int
+    text: str
+
+
+def read_articles(file: Path) -> Iterator[Article]:
+    """
+    Stream the articles of a single corpus file, one at a time.
+
+    The file is read as raw bytes in chunks and split on `</REUTERS>` boundaries, so only the current chunk and the
+    current article are ever held in memory. No document tree is built.
+
+    :param file: The corpus file to read
+    :return: A generator of the articles in the file, in order
+    """
+
+    buffer = b''
+
+    with open(file, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            buffer += chunk
+
+            # Yield every complete article in the buffer, and keep the incomplete remainder for the next chunk
+            start = 0
+            end = buffer.find(_ARTICLE_END, start)
+            while end != -1:
+                article = _parse_article(buffer[start:end])
+                if article is not None:
+                    yield article
+                start = end + len(_ARTICLE_END)
+                end = buffer.find(_ARTICLE_END, start)
+
+            buffer = buffer[start:]
+
+
+def _parse_article(raw: bytes) -> Optional[Article]:
+    """
+    Create an Article record out of the raw bytes of a single `<REUTERS>` element.
+
+    :param raw: The raw bytes, from anywhere before the `<REUTERS ...>` opening tag up to the closing tag
+    :return: The Article, or None if there is no `<REUTERS ...>` opening tag in the given bytes
+    """
+
+    match = _NEWID.search(raw)
+    if match is None:
+        return None
+
+    # The corpus is not valid UTF-8. Decoding as Latin-1 never fails and keeps every byte as a single character
+    return Article(int(match.group(1)), article_text(raw[match.end():].decode('latin-1')))
+
+
+def article_text(sgml: str) -> str:
+    """
+    Get the text of an article without the 'dateline' or 'title' elements, as these add clutter.
+
+    Mirrors what `html.parser` gives for the children of the articles `<TEXT>` element: every top-level piece of text
+    and every element (other than the skipped ones) contribute their text, joined by newlines.
+
+    :param sgml: The SGML of the article
+    :return: The text of the article
+    """
+
+    # Only the first 'text' element of the article is used
+    match = _TEXT.search(sgml)
+    if match is None:
+        return ''
+    text = match.group(1)
+
+    pieces = []
+    position = 0
+    for element in _ELEMENT.finditer(text):
+        # Text between two elements
+        if element.start() > position:
+            pieces.append(text[position:element.start()])
+
+        if element.group(1).lower() not in SKIPPED_ELEMENTS:
+            pieces.append(_TAG.sub('', element.group(2)))
+
+        position = element.end()
+
+    # Text after the last element
+    if position < len(text):
+        pieces.append(text[position:])
+
+    return unescape('\n'.join(pieces))
+
+
+def unescape(text: str) -> str:
+    """
+    Replace character and entity references in the text with the characters they refer to.
+
+    Numeric references are always kept as the character they refer to, even for control characters, like `&#3;`,
+    the same as the `html.parser` BeautifulSoup builder does.
+
+    :param text: The text to unescape
+    :return: The unescaped text
+    """
+
+    if '&' not in text:
+        return text
+
+    return _REFERENCE.sub(_replace_reference, text)
+
+
+def _replace_reference(match: re.Match) -> str:
+    """
+    Get the character(s) a single character or entity reference refers to.
+
+    :param match: The match of the reference
+    :return: The character(s) it refers to
+    """
+
+    name = match.group(1)
+
+    if name[0] != '#':
+        return html.unescape(match.group(0))
+
+    number = int(name[2:], 16) if name[1] in 'xX' else int(name[1:])
+
+    # Like html.parser, references in the 128-159 range mean Windows-1252 characters
+    if 128 <= number <= 159:
+        return bytes([number]).decode('cp1252', errors='replace')
+
+    return chr(number)
@@ -0,0 +1,175 @@
+import heapq
+import json
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import bsbi
+from metrics import METRICS
+
+# Rough number of bytes a new dictionary term and a single posting cost in memory, used to keep to a memory budget
+TERM_COST = 120
+POSTING_COST = 36
+
+
+@METRICS.timed()
+def invert(documents: Iterable[Tuple[int, Iterable[str]]]) -> Dict[str, list]:
+    """
+    Create an inverted index in memory in a single pass, SPIMI-style.
+
+    Each docID is appended straight into the postings list of each of its terms as the documents stream in, so no
+    (term, docID) pairs are ever collected or sorted. Since the docIDs arrive in order, the postings lists are sorted
+    for free. Only the dictionary terms are sorted, once, at the end.
+
+    :param documents: (docID, tokens) tuples of every document, in order of docID
+    :return: A dictionary of form `{term: [list, of, docIDs]}`, sorted by term
+    """
+
+    index, in_order = next(_invert_blocks(documents, None))
+    return {term: index[term] if in_order else sorted(index[term]) for term in sorted(index)}
+
+
+@METRICS.timed()
+def invert_to_file(documents: Iterable[Tuple[int, Iterable[str]]], file: Path, memory_budget: int) -> None:
+    """
+    Create an inverted index SPIMI-style, like `invert()`, within a memory budget, streaming it straight to a file.
+
+    Whenever the index being built grows past the budget, it is flushed to disk as a block of sorted terms, and a new
+    one is started. At the end, the blocks are merged with a heap and the index is written out term by term as it comes
+    out of the merge, like `bsbi.build_index_file()` does, so the whole index is never held in memory.
+
+    The file is the same as `json.dump()` of the whole index would write.
+
+    :param documents: (docID, tokens) tuples of every document, in order of docID
+    :param file: The file to write the index to
+    :param memory_budget: The rough number of bytes the index being built may take up before it is flushed to disk
+    """
+
+    with tempfile.TemporaryDirectory(prefix='spimi-') as block_dir:
+        blocks: List[Path] = []
+        in_order = True
+
+        for index, in_order in _invert_blocks(documents, memory_budget):
+            if index:
+                blocks.append(write_block(index, Path(block_dir) / f'block{len(blocks)}.txt'))
+
+            # Let go of the block before the next one is built
+            del index
+
+        print(f"Merging {len(blocks)} blocks into: {file}")
+        entries = merge_blocks(blocks)
+        bsbi.write_index(((term, postings if in_order else sorted(postings)) for term, postings in entries), file)
+
+
+def _invert_blocks(documents: Iterable[Tuple[int, Iterable[str]]],
+                   memory_budget: Optional[int]) -> Iterator[Tuple[Dict[str, list], bool]]:
+    """
+    Invert the documents into partial indexes, starting a new one whenever the last grows past the memory budget.
+
+    :param documents: (docID, tokens) tuples of every document, in order of docID
+    :param memory_budget: The rough number of bytes a partial index may take up. None means a single index
+    :return: A generator of partial indexes, with unsorted terms, each with whether every docID so far arrived in order.
+             The last one may be empty
+    """
+
+    index: Dict[str, list] = {}
+    used = 0
+    last_doc_id = 0
+    in_order = True
+
+    for doc_id, tokens in documents:
+        # Postings are only sorted for free if the docIDs arrive in order. Remember if they don't
+        if doc_id < last_doc_id:
+            in_order = False
+        last_doc_id = doc_id
+
+        for token in tokens:
+            postings = index.get(token)
+            if postings is None:
+                index[token] = [doc_id]
+                used += TERM_COST + POSTING_COST
+            else:
+                postings.append(doc_id)
+                used += POSTING_COST
+
+        # Hand the index over once it takes up too much memory
+        if memory_budget is not None and used > memory_budget:
+            yield index, in_order
+            index = {}
+            used = 0
+
+    yield index, in_order
+
+
+def write_block(index: Dict[str, list], file: Path) -> Path:
+    """
+    Write a partial index to disk as a block, one `[term, [list, of, docIDs]]` JSON line per term, sorted by term.
+
+    :param index: The partial index to write
+    :param file: The file to write the block to
+    :return: The file the block was written to
+    """
+
+    with open(file, 'wt') as f:
+        for term in sorted(index):
+            f.write(json.dumps([term, index[term]]))
+            f.write('\n')
+
+    return file
+
+
+def read_block(file: Path) -> Iterator[Tuple[str, list]]:
+    """
+    Stream the (term, postings) entries of a block written by `write_block()`, one at a time.
+
+    :param file: The block file to read
+    :return: A generator of (term, postings) tuples, sorted by term
+    """
+
+    with open(file, 'rt') as f:
+        for line in f:
+            term, postings = json.loads(line)
+            yield term, postings
+
+
+def merge_blocks(blocks: List[Path]) -> Iterator[Tuple[str, list]]:
+    """
+    Merge blocks into a single stream of (term, postings) entries, sorted by term.
+
+    Blocks are merged with a heap, so only one entry of each block is held in memory at a time. When a term is in more
+    than one block, its postings lists are joined in the order of the blocks.
+
+    :param blocks: The block files to merge, in the order they were written
+    :return: A generator of (term, postings) tuples, sorted by term
+    """
+
+    # Tag every entry with the number of its block, so entries of the same term come out in block order
+    streams = [_tag_entries(read_block(block), number) for number, block in enumerate(blocks)]
+
+    current_term = None
+    current_postings: list = []
+
+    for term, _, postings in heapq.merge(*streams, key=lambda entry: entry[:2]):
+        if term != current_term:
+            if current_term is not None:
+                yield current_term, current_postings
+            current_term = term
+            current_postings = []
+
+        current_postings.extend(postings)
+
+    if current_term is not None:
+        yield current_term, current_postings
+
+
+def _tag_entries(entries: Iterator[Tuple[str, list]], number: int) -> Iterator[Tuple[str, int, list]]:
+    """
+    Tag every (term, postings) entry of a block with the number of the block.
+
+    :param entries: The entries of the block
+    :param number: The number of the block
+    :return: A generator of (term, number, postings) tuples
+    """
+
+    for term, postings in entries:
+        yield term, number, postings
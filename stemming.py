@@ -0,0 +1,151 @@
+import json
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from nltk.stem import PorterStemmer
+
+from index_writer import atomic_file
+
+# Where the memo table is saved, next to the stemmed index
+MEMO_FILE = Path('output/5. stemmed_index.stems')
+
+# Default most words to remember the stems of
+MAX_SIZE = 500_000
+
+# How many words each worker process stems at a time
+CHUNK_SIZE = 5_000
+
+
+class Stemmer:
+    """
+    A Porter stemmer that remembers the stems it has computed, in a bounded LRU memo table.
+
+    NLTK's Porter stemmer is slow, pure Python, and the same words get stemmed over and over: by the stemming stage of
+    subproject 3 on every run, and at query time. The memo table can be saved to disk and is loaded back the first
+    time a stem is needed, so reruns and queries look stems up instead of computing them.
+    """
+
+    def __init__(self, max_size: int = MAX_SIZE, file: Optional[Path] = MEMO_FILE):
+        """
+        Create a stemmer with an empty memo table.
+
+        :param max_size: The most words to remember the stems of. The least recently used one is forgotten first
+        :param file: The file to load the memo table from, and save it to. None means never load or save it
+        """
+
+        self.max_size = max_size
+        self.file = file
+        self._stems: OrderedDict[str, str] = OrderedDict()
+        self._stemmer = PorterStemmer()
+        self._loaded = file is None
+
+    def _load(self) -> None:
+        """
+        Load the saved memo table, if there is one. Only done once, the first time a stem is needed.
+        """
+
+        self._loaded = True
+
+        if self.file.exists():
+            with open(self.file, 'rt') as f:
+                self._remember(json.load(f))
+
+    def _remember(self, stems: Dict[str, str]) -> None:
+        """
+        Add stems to the memo table, forgetting the least recently used ones if it grows too large.
+
+        :param stems: The stems to add, by word
+        """
+
+        self._stems.update(stems)
+        while len(self._stems) > self.max_size:
+            self._stems.popitem(last=False)
+
+    def stem(self, word: str) -> str:
+        """
+        Stem a single word, looking it up in the memo table first.
+
+        :param word: The word to stem
+        :return: The stem of the word
+        """
+
+        if not self._loaded:
+            self._load()
+
+        stemmed = self._stems.get(word)
+        if stemmed is not None:
+            self._stems.move_to_end(word)
+            return stemmed
+
+        stemmed = self._stemmer.stem(word)
+        self._remember({word: stemmed})
+        return stemmed
+
+    def stem_many(self, words: Iterable[str], workers: int = 1) -> Dict[str, str]:
+        """
+        Stem a whole batch of words, i.e. the dictionary of an index.
+
+        Words already in the memo table are looked up. The rest are split into chunks and stemmed by a pool of worker
+        processes, if more than 1 worker is asked for.
+
+        :param words: The words to stem
+        :param workers: The number of worker processes to stem with. 1 means stem in this process
+        :return: The stem of each word, by word
+        """
+
+        if not self._loaded:
+            self._load()
+
+        stems: Dict[str, str] = {}
+        missing: List[str] = []
+        for word in words:
+            stemmed = self._stems.get(word)
+            if stemmed is None:
+                missing.append(word)
+            else:
+                stems[word] = stemmed
+
+        if workers > 1 and len(missing) > CHUNK_SIZE:
+            chunks = [missing[start:start + CHUNK_SIZE] for start in range(0, len(missing), CHUNK_SIZE)]
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                computed = [stemmed for chunk in executor.map(_stem_chunk, chunks) for stemmed in chunk]
+        else:
+            computed = _stem_chunk(missing)
+
+        new_stems = dict(zip(missing, computed))
+        self._remember(new_stems)
+        stems.update(new_stems)
+
+        return stems
+
+    def save(self) -> None:
+        """
+        Save the memo table to its file, if it has one.
+        """
+
+        if self.file is None:
+            return
+
+        print(f"Saving to file: {self.file}")
+
+        self.file.parent.mkdir(exist_ok=True, parents=True)
+        with atomic_file(self.file) as f:
+            json.dump(self._stems, f)
+
+
+def _stem_chunk(words: List[str]) -> List[str]:
+    """
+    Stem a chunk of words with a fresh Porter stemmer. Used by the worker processes.
+
+    :param words: The words to stem
+    :return: The stems of the words, in the same order
+    """
+
+    stemmer = PorterStemmer()
+    return [stemmer.stem(word) for word in words]
+
+
+# The stemmer shared by indexing and query time
+STEMMER = Stemmer()
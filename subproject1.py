@@ -1,61 +1,414 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from glob import glob
 from pathlib import Path
 from re import sub
-from typing import List, Tuple, Dict
-from collections import defaultdict
+from typing import Callable, List, Tuple, Dict, Iterable, Iterator, Optional, Set
+from collections import Counter, defaultdict
+import heapq
 import json
+import shutil
+import sys
 import time
 
-from bs4 import BeautifulSoup
-from bs4.element import Tag
 from nltk import word_tokenize
 
-
-def subproject_1():
+import bsbi
+import incremental
+import segments
+import spimi
+from bm25 import frequencies_path, read_frequencies
+from index_writer import WRITER, write_index
+from metrics import METRICS
+from positional_index import Positions, PositionalIndex, positions_path, write_positional_index
+from sgml_reader import Article, read_articles
+from tokenizer import tokenize
+from utilities import calc_memory_size, render_storage_table
+
+
+@METRICS.timed()
+def subproject_1(workers: int = 1, memory_budget: Optional[int] = None, block_size: Optional[int] = None,
+                 incremental_update: bool = False, frequencies: bool = False,
+                 positions: bool = False) -> Optional[Set[str]]:
     """
     Main function. Runs the whole subproject1 module. Finally, run the query processor on the selected three queries.
+
+    :param workers: The number of worker processes to ingest the corpus with. 1 means ingest serially
+    :param memory_budget: The rough number of bytes the serial indexer may hold in memory before flushing blocks to
+                          disk, which are then merged straight into the index file. None means no limit
+    :param block_size: If given, build the index with blocked sort-based indexing instead, sorting this many
+                       (term, docID) pairs in memory at a time and streaming the merged index to file
+    :param incremental_update: Whether to only index the new and changed corpus files, and merge them into the index of
+                               the last run. See `update_index()`
+    :param frequencies: Whether to also record term frequencies and document lengths, for ranked queries, counted from
+                        the same tokens the index is built from. See `TermStatistics`
+    :param positions: Whether to also build a positional index, for phrase and proximity queries, and report its
+                      overhead, from the same tokens the index is built from. See `TermStatistics`
+    :return: With an incremental update, the terms whose postings lists changed, or None if every term should be
+             treated as changed. Always None otherwise
     """
 
     tick = time.time()
+    affected = None
+
+    # Term frequencies, document lengths and positions are gathered from the tokens of the ingestion pass
+    statistics = TermStatistics(frequencies, positions) if frequencies or positions else None
+
+    # An index built from scratch isn't the one the last incremental update built, so the next update starts over
+    if not incremental_update:
+        incremental.forget()
+
+    if incremental_update:
+        affected = update_index(workers, statistics)
+
+    elif block_size is not None:
+        # Never hold the whole index in memory, write it to file as it is merged
+        print(f"\nCreating inverted index for all articles, in sorted runs of {block_size:,} pairs...")
+        documents = ((article.newid, process_document(article.text, article.newid, statistics))
+                     for article in get_texts())
+        bsbi.build_index_file(documents, Path("output/1. naive_index.txt"), block_size)
+
+    elif memory_budget is not None and workers == 1:
+        # Only hold as much of the index in memory as the budget allows, write it to file as its blocks are merged
+        print(f"\nCreating inverted index for all articles, in blocks of at most {memory_budget:,} bytes...")
+        documents = ((article.newid, process_document(article.text, article.newid, statistics))
+                     for article in get_texts())
+        spimi.invert_to_file(documents, Path("output/1. naive_index.txt"), memory_budget)
+
+    else:
+        # Build the index, either serially or by handing each corpus file to a worker process
+        index = build_index(workers, statistics)
+
+        # Save results to file
+        print("\nSaving to file: output/1. naive_index.txt")
+        save_to_file(index)
+
+        # Subproject 3 reads the index back from file, so it must be saved in full first
+        WRITER.flush()
+
+    if frequencies:
+        print("\nMerging term frequencies and document lengths for all articles...")
+        save_frequencies(statistics.frequencies(), statistics.lengths)
+
+    if positions:
+        print("\nMerging positional index for all articles...")
+        positional = statistics.positional()
+        print(f"Saving to file: {positions_path(Path('output/1. naive_index.txt'))}")
+        write_positional_index(positional.items(), positions_path(Path("output/1. naive_index.txt")))
+        report_positional_overhead(positional)
+
+    tock = time.time()
+
+    print(f"\nTime taken: {(tock - tick):0.2f} seconds")
+
+    return affected
+
+
+@METRICS.timed()
+def build_index(workers: int = 1, statistics: Optional['TermStatistics'] = None) -> Dict[str, list]:
+    """
+    Read the corpus and create the naive inverted index from it.
+
+    Serially, the articles are inverted in a single pass, as they stream in. With more than 1 worker, each corpus file
+    is parsed, cleaned and tokenized in its own process. Each worker sends back the sorted (term, docID) pairs of its
+    file, which are then merged together. Either way, the resulting index is the same.
 
-    # Get all reuters objects in the corpus
-    ALL_TEXTS: List[Tag] = get_texts()
+    :param workers: The number of worker processes to ingest the corpus with. 1 means ingest serially
+    :param statistics: If given, also gather the statistics of every article into it
+    :return: A dictionary of form `{term: [list, of, docIDs]}`
+    """
+
+    if workers > 1:
+        return _build_index_parallel(workers, statistics)
 
-    # Create a list of (term, docID) pairs
-    F: List[Tuple] = []
+    # Stream all reuters articles in the corpus, one at a time
+    ALL_TEXTS: Iterator[Article] = get_texts()
 
-    print(f"\nCreating (term, docID) pairs for all articles. This will take about 30 seconds...")
+    print(f"\nCreating inverted index for all articles...")
 
-    # Go through each text in the corpus and create (term, docID) pairs, and add them to the existing list
-    for text in ALL_TEXTS:
-        # Find the docID for this document
-        DOC_ID = int(text.attrs['newid'])
+    # Append the docID of each article straight into the postings lists of its tokens
+    return spimi.invert(((article.newid, process_document(article.text, article.newid, statistics))
+                         for article in ALL_TEXTS))
 
-        # Create list of tokens
-        tokens = process_document(text)
 
-        # Create (term, docID) pairs from those tokens, and add to existing list
-        F.extend(create_pairs(tokens, DOC_ID))
+def _build_index_parallel(workers: int, statistics: Optional['TermStatistics'] = None) -> Dict[str, list]:
+    """
+    Create the naive inverted index by ingesting each corpus file in a separate worker process.
 
-    # Sort the list of tuples by term
-    F = sorted(F)
+    :param workers: The number of worker processes to use
+    :param statistics: If given, also gather the statistics of every article into it
+    :return: A dictionary of form `{term: [list, of, docIDs]}`
+    """
 
-    # Create an index for the list of (term, docID) pairs
+    CORPUS_FILES: List[Path] = get_corpus_files()
+
+    print(f"\nCreating (term, docID) pairs for all articles using {workers} worker processes...")
+
+    # Each worker returns the sorted (term, docID) pairs of one file, and its statistics if asked for
+    file_pairs = partial(_file_pairs, statistics=None if statistics is None else statistics.empty())
+    with METRICS.timer('ingest_files'):
+        per_file = _map_files(file_pairs, CORPUS_FILES, workers)
+
+    for _, file_statistics in per_file:
+        if statistics is not None:
+            statistics.update(file_statistics)
+
+    # Every file's pairs are already sorted, so merge them rather than sorting everything again
     print("\nCreating inverted index")
-    index = create_index(F)
+    return create_index(heapq.merge(*(pairs for pairs, _ in per_file)))
+
+
+def _map_files(function: Callable, files: List[Path], workers: int) -> list:
+    """
+    Call a function on every one of some corpus files, handing each file to a worker process if there are several
+    workers, and gathering the metrics they record.
+
+    :param function: The function to call on each file. Must be picklable, i.e. defined at the top of this module
+    :param files: The corpus files
+    :param workers: The number of worker processes to use. 1 means call it serially
+    :return: The results of every call, in the order of the files
+    """
+
+    if workers > 1 and len(files) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(METRICS.gather(executor.map(METRICS.collect(function), files)))
+
+    return [function(file) for file in files]
+
+
+def _file_pairs(file: Path, statistics: Optional['TermStatistics'] = None
+                ) -> Tuple[List[Tuple[str, int]], Optional['TermStatistics']]:
+    """
+    Parse, clean and tokenize every article in a single corpus file. Used by the worker processes.
+
+    :param file: The corpus file to ingest
+    :param statistics: If given, empty statistics saying what to also gather of its articles
+    :return: The sorted list of (term, docID) pairs for all articles in the file, and their statistics, if gathered
+    """
+
+    print(f"Reading file: {file.name}")
+
+    file_statistics = statistics.empty() if statistics is not None else None
+
+    pairs: List[Tuple[str, int]] = []
+    for article in read_articles(file):
+        pairs.extend(create_pairs(process_document(article.text, article.newid, file_statistics), article.newid))
+
+    # Sort the statistics here, in the worker, too
+    if file_statistics is not None:
+        file_statistics.seal()
+
+    with METRICS.timer('sort_pairs'):
+        return sorted(pairs), file_statistics
+
+
+@METRICS.timed()
+def update_index(workers: int = 1, statistics: Optional['TermStatistics'] = None) -> Optional[Set[str]]:
+    """
+    Update the naive index incrementally, only indexing the corpus files that are new or changed since the last update.
+
+    Files are compared by content hash to the manifest saved by the last update. The documents of new and changed files
+    are indexed into a delta segment, saved to `output/1. naive_index.delta.txt`. The documents of changed and removed
+    files are marked in a deleted-docID bitmap, filtered out of the main index as the delta is merged into it.
+
+    Without a manifest, or an index to update, every file is new, so the index is built from scratch.
+
+    Term frequencies, document lengths and positions are likewise only gathered for the new and changed files. Those
+    of the documents kept are taken from the ones saved with the index. See `_keep_statistics()`.
 
-    # Save results to file
-    print("\nSaving to file: output/1. naive_index.txt")
+    :param workers: The number of worker processes to index the new and changed files with
+    :param statistics: If given, also gather the statistics of every document of the updated index into it. Saved
+                       statistics it doesn't gather are removed, as they would no longer match the index
+    :return: The terms whose postings lists changed, or None if the index was built from scratch
+    """
+
+    CORPUS_FILES: List[Path] = get_corpus_files()
+    INDEX_FILE = Path("output/1. naive_index.txt")
+
+    # Start from scratch if there is nothing to update
+    manifest = incremental.load_manifest()
+    if not INDEX_FILE.exists():
+        manifest = {}
+
+    to_index, removed, deleted = incremental.find_changes(CORPUS_FILES, manifest)
+    print(f"\n{len(to_index)} new or changed files, {len(removed)} removed files, {len(deleted)} documents to delete")
+
+    # Index the documents of the new and changed files into a delta segment
+    files = list(to_index)
+    file_segment = partial(_file_segment, statistics=None if statistics is None else statistics.empty())
+    deltas = _map_files(file_segment, files, workers)
+
+    delta = create_index(heapq.merge(*(pairs for pairs, _, _ in deltas)))
+    print(f"Saving to file: {incremental.DELTA_FILE}")
+    Path('output/').mkdir(exist_ok=True, parents=True)
+    WRITER.save(delta, incremental.DELTA_FILE)
+
+    # Merge the delta into the main index
+    if manifest:
+        with open(INDEX_FILE, 'rt') as f:
+            index = json.load(f)
+        if statistics is not None:
+            unchanged = [file for file in CORPUS_FILES if file not in to_index]
+            _keep_statistics(statistics, index, deleted, unchanged, workers)
+        print("\nMerging the delta segment into the index")
+        index, affected = incremental.apply_delta(index, delta, deleted)
+    else:
+        index, affected = delta, None
+
+    if statistics is not None:
+        for _, _, file_statistics in deltas:
+            statistics.update(file_statistics)
+
+    if statistics is None or not statistics.with_frequencies:
+        frequencies_path(INDEX_FILE).unlink(missing_ok=True)
+    if statistics is None or not statistics.with_positions:
+        positions_path(INDEX_FILE).unlink(missing_ok=True)
+
+    print(f"\nSaving to file: {INDEX_FILE}")
     save_to_file(index)
 
-    tock = time.time()
+    # Record what the index now holds
+    for name in removed:
+        del manifest[name]
+    for file, (_, newids, _) in zip(files, deltas):
+        manifest[file.name] = {'hash': to_index[file], 'newids': newids}
 
-    print(f"\nTime taken: {(tock - tick):0.2f} seconds")
+    WRITER.flush()
+    incremental.save_manifest(manifest)
+
+    return affected
+
+
+def _file_segment(file: Path, statistics: Optional['TermStatistics'] = None
+                  ) -> Tuple[List[Tuple[str, int]], List[int], Optional['TermStatistics']]:
+    """
+    Parse, clean and tokenize every article in a single corpus file, for an incremental update.
+
+    :param file: The corpus file to ingest
+    :param statistics: If given, empty statistics saying what to also gather of its articles
+    :return: The sorted list of (term, docID) pairs for all articles in the file, the docIDs of all its articles, and
+             their statistics, if gathered
+    """
+
+    print(f"Reading file: {file.name}")
+
+    file_statistics = statistics.empty() if statistics is not None else None
+
+    pairs: List[Tuple[str, int]] = []
+    newids: List[int] = []
+    for article in read_articles(file):
+        pairs.extend(create_pairs(process_document(article.text, article.newid, file_statistics), article.newid))
+        newids.append(article.newid)
+
+    if file_statistics is not None:
+        file_statistics.seal()
+
+    return sorted(pairs), newids, file_statistics
+
+
+def _keep_statistics(statistics: 'TermStatistics', index: Dict[str, list], deleted: incremental.DocIDBitmap,
+                     unchanged: List[Path], workers: int) -> None:
+    """
+    Add the statistics of the documents an incremental update keeps to those of the updated index, from the term
+    frequencies, document lengths and positional index saved with the index it updates.
+
+    If any of them weren't saved, or don't match the index, the unchanged files are read again instead.
+
+    :param statistics: The statistics of the updated index
+    :param index: The index being updated
+    :param deleted: The docIDs deleted from the index
+    :param unchanged: The corpus files that are neither new nor changed
+    :param workers: The number of worker processes to read the unchanged files with, if needed
+    """
+
+    INDEX_FILE = Path("output/1. naive_index.txt")
+    FREQUENCIES_FILE = frequencies_path(INDEX_FILE)
+    POSITIONS_FILE = positions_path(INDEX_FILE)
+
+    frequencies, lengths, positional = None, None, None
+
+    if statistics.with_frequencies and FREQUENCIES_FILE.exists():
+        frequencies, lengths = read_frequencies(FREQUENCIES_FILE)
+        if frequencies.keys() != index.keys() or any(len(frequencies[term]) != len(index[term]) for term in index):
+            frequencies = None
+
+    if statistics.with_positions and POSITIONS_FILE.exists():
+        positional = PositionalIndex(POSITIONS_FILE)
+        if positional.dictionary.keys() != index.keys() or \
+                any(positional.document_frequency(term) != len(index[term]) for term in index):
+            positional = None
+
+    if (frequencies is not None or not statistics.with_frequencies) and \
+            (positional is not None or not statistics.with_positions):
+        if frequencies is not None:
+            statistics.add_saved(index, frequencies, lengths, deleted)
+        if positional is not None:
+            statistics.add_saved_positions(positional, deleted)
+        return
+
+    print("\nNo statistics saved for the index, reading the unchanged files again")
+    for _, _, file_statistics in _map_files(partial(_file_segment, statistics=statistics.empty()), unchanged, workers):
+        statistics.update(file_statistics)
+
+
+@METRICS.timed()
+def ingest_segments(workers: int = 1, directory: Path = segments.SEGMENTS_DIR) -> None:
+    """
+    Ingest the corpus into a segmented index, each corpus file as its own immutable segment. Small segments are merged
+    together in the background as ingestion goes on. See `segments.SegmentStore`.
+
+    :param workers: The number of worker processes to ingest the corpus files with
+    :param directory: The directory of the segmented index
+    """
+
+    CORPUS_FILES: List[Path] = get_corpus_files()
+
+    # The whole corpus is ingested again, so start a new segmented index
+    shutil.rmtree(directory, ignore_errors=True)
+    store = segments.SegmentStore(directory)
+
+    print(f"\nIngesting the corpus into segments in {directory}...")
+
+    # Each segment is written as soon as its file is ingested, while the next files are still being ingested
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        per_file_pairs = (METRICS.gather(executor.map(METRICS.collect(_file_pairs), CORPUS_FILES)) if workers > 1
+                          else map(_file_pairs, CORPUS_FILES))
+        for pairs, _ in per_file_pairs:
+            store.add_segment(create_index(pairs))
+
+    # Wait for the merges still under way
+    store.close()
+
+    SEGMENTS = segments.read_manifest(directory)['segments']
+    print(f"\n{len(SEGMENTS)} segments after merging:")
+    for segment in SEGMENTS:
+        print(f"{segment['name']}: {segment['terms']:,} terms, {segment['postings']:,} postings")
 
 
+def check_parallel_index(workers: int) -> bool:
+    """
+    Check that ingesting the corpus in parallel creates exactly the same index file as ingesting it serially.
+
+    :param workers: The number of worker processes to build the parallel index with
+    :return: Whether the serialized parallel index is byte-identical to the serialized serial index
+    """
+
+    serial = json.dumps(build_index(1)).encode()
+    parallel = json.dumps(build_index(workers)).encode()
+
+    identical = serial == parallel
+    if identical:
+        print(f"\nThe parallel index ({workers} workers) is byte-identical to the serial index")
+    else:
+        print(f"\nThe parallel index ({workers} workers) differs from the serial index")
+
+    return identical
+
+
+@METRICS.timed()
 def save_to_file(index: dict) -> None:
     """
-    Save the computed index to an output file.
+    Save the computed index to an output file, atomically, in the background. See `index_writer.IndexWriter`.
 
     Always saves to `output/naive_indexer.txt`.
 
@@ -64,15 +417,200 @@ def save_to_file(index: dict) -> None:
 
     Path('output/').mkdir(exist_ok=True, parents=True)
 
-    with open("output/1. naive_index.txt", "wt") as f:
-        json.dump(index, f)
+    WRITER.save(index, "output/1. naive_index.txt")
 
 
-def create_index(pairs: List[Tuple[str, int]]) -> Dict[str, list]:
+class TermStatistics:
+    """
+    The term frequencies, document lengths and term positions of the articles being indexed, gathered from the same
+    tokens their (term, docID) pairs are made of, so the corpus is only read and tokenized once.
+
+    The index itself keeps only whether a term is in an article. Frequencies are kept alongside it, in the same order
+    as its postings lists, so the index and its file format stay the same. Positions make up a positional index of the
+    same terms and docIDs. Both are gathered as (term, docID, frequency or positions) triples, in sorted runs, which are
+    merged at the end like the pairs of the index.
+    """
+
+    def __init__(self, frequencies: bool = True, positions: bool = False):
+        """
+        Create empty statistics.
+
+        :param frequencies: Whether to count term frequencies and document lengths
+        :param positions: Whether to find the positions of terms
+        """
+
+        self.with_frequencies = frequencies
+        self.with_positions = positions
+
+        self.runs: List[List[Tuple[str, int, int]]] = []
+        self.lengths: Dict[int, int] = {}
+        self._triples: List[Tuple[str, int, int]] = []
+
+        self.position_runs: List[List[Tuple[str, int, List[int]]]] = []
+        self._position_triples: List[Tuple[str, int, List[int]]] = []
+
+    def empty(self) -> 'TermStatistics':
+        """
+        Create empty statistics gathering the same things as these, i.e. for a worker process to fill.
+
+        :return: The empty statistics
+        """
+
+        return TermStatistics(self.with_frequencies, self.with_positions)
+
+    def add(self, doc_id: int, tokens: List[str]) -> None:
+        """
+        Count the terms of an article, and find their positions.
+
+        :param doc_id: The docID of the article
+        :param tokens: All tokens of the article, duplicates included, in order
+        """
+
+        if self.with_frequencies:
+            counts = Counter(tokens)
+            self._triples.extend((term, doc_id, frequency) for term, frequency in counts.items())
+            self.lengths[doc_id] = len(tokens)
+
+        if self.with_positions:
+            term_positions = defaultdict(list)
+            for position, token in enumerate(tokens):
+                term_positions[token].append(position)
+            self._position_triples.extend((term, doc_id, found) for term, found in term_positions.items())
+
+    def add_saved(self, index: Dict[str, list], frequencies: Dict[str, list], lengths: Dict[int, int],
+                  deleted: incremental.DocIDBitmap) -> None:
+        """
+        Add the saved frequencies and lengths of an index, leaving out deleted documents.
+
+        :param index: The index the statistics were saved with
+        :param frequencies: Its term frequencies, in the order of its postings lists
+        :param lengths: Its document lengths, by docID
+        :param deleted: The docIDs to leave out
+        """
+
+        self.runs.append([(term, doc_id, frequency) for term in sorted(index)
+                          for doc_id, frequency in zip(index[term], frequencies[term]) if doc_id not in deleted])
+        self.lengths.update((doc_id, length) for doc_id, length in lengths.items() if doc_id not in deleted)
+
+    def add_saved_positions(self, positional: PositionalIndex, deleted: incremental.DocIDBitmap) -> None:
+        """
+        Add the saved positional index of an index, leaving out deleted documents.
+
+        :param positional: The positional index saved with the index
+        :param deleted: The docIDs to leave out
+        """
+
+        self.position_runs.append([(term, doc_id, found) for term in sorted(positional.dictionary)
+                                   for doc_id, found in positional.postings(term) if doc_id not in deleted])
+
+    def seal(self) -> None:
+        """
+        Sort the triples gathered since the last sealed runs into runs of their own.
+        """
+
+        if self._triples:
+            self.runs.append(sorted(self._triples))
+            self._triples = []
+
+        if self._position_triples:
+            self.position_runs.append(sorted(self._position_triples, key=lambda triple: triple[:2]))
+            self._position_triples = []
+
+    def update(self, other: 'TermStatistics') -> None:
+        """
+        Add the statistics of other articles, i.e. those a worker process gathered.
+
+        :param other: The statistics of the other articles
+        """
+
+        other.seal()
+        self.runs.extend(other.runs)
+        self.lengths.update(other.lengths)
+        self.position_runs.extend(other.position_runs)
+
+    @METRICS.timed('merge_frequencies')
+    def frequencies(self) -> Dict[str, list]:
+        """
+        Merge the runs into the term frequencies.
+
+        :return: The term frequencies, of form `{term: [frequency in each docID of its postings list]}`
+        """
+
+        self.seal()
+
+        frequencies = defaultdict(list)
+        for term, _, frequency in heapq.merge(*self.runs):
+            frequencies[term].append(frequency)
+
+        return dict(frequencies)
+
+    @METRICS.timed('merge_positions')
+    def positional(self) -> Dict[str, Positions]:
+        """
+        Merge the runs into a positional index.
+
+        :return: A dictionary of form `{term: [(docID, [list, of, positions])]}`
+        """
+
+        self.seal()
+
+        positional = defaultdict(list)
+        for term, doc_id, found in heapq.merge(*self.position_runs, key=lambda triple: triple[:2]):
+            positional[term].append((doc_id, found))
+
+        return dict(positional)
+
+
+def save_frequencies(frequencies: Dict[str, list], lengths: Dict[int, int]) -> None:
+    """
+    Save the term frequencies and document lengths of the naive index, next to it, atomically.
+
+    Always saves to `output/1. naive_index.tf`. Document lengths are saved in order of docID, however they were counted.
+
+    :param frequencies: The term frequencies, from `TermStatistics.frequencies()`
+    :param lengths: The document lengths, from `TermStatistics.lengths`
+    """
+
+    print("Saving to file: output/1. naive_index.tf")
+
+    Path('output/').mkdir(exist_ok=True, parents=True)
+    write_index({'frequencies': frequencies, 'lengths': dict(sorted(lengths.items()))}, "output/1. naive_index.tf")
+
+
+def report_positional_overhead(positional: Dict[str, Positions]) -> None:
+    """
+    Show a table of how much more disk space and memory the index takes with positions than without.
+
+    :param positional: The positional index, as merged by `TermStatistics.positional()`
+    """
+
+    INDEX_FILE = Path("output/1. naive_index.txt")
+    with open(INDEX_FILE, 'rt') as f:
+        index = json.load(f)
+
+    INDEX_DISK_SIZE = INDEX_FILE.stat().st_size
+    POSITIONS_DISK_SIZE = positions_path(INDEX_FILE).stat().st_size
+
+    INDEX_MEMORY_SIZE = calc_memory_size(index)
+    encoded = PositionalIndex(positions_path(INDEX_FILE))
+    ENCODED_MEMORY_SIZE = calc_memory_size(encoded.dictionary) + sys.getsizeof(encoded.data)
+    DECODED_MEMORY_SIZE = calc_memory_size(positional)
+
+    render_storage_table([
+        [("Non-positional index on disk, JSON", INDEX_DISK_SIZE),
+         ("With positions, gap and variable-byte encoded", INDEX_DISK_SIZE + POSITIONS_DISK_SIZE)],
+        [("Non-positional index in memory, Python lists", INDEX_MEMORY_SIZE),
+         ("With positions, kept encoded", INDEX_MEMORY_SIZE + ENCODED_MEMORY_SIZE),
+         ("With positions, decoded to Python lists", INDEX_MEMORY_SIZE + DECODED_MEMORY_SIZE)],
+    ], title="Overhead of Positional Index")
+
+
+@METRICS.timed()
+def create_index(pairs: Iterable[Tuple[str, int]]) -> Dict[str, list]:
     """
     Create an inverted index based on the list of (term, docID) tuples.
 
-    :param pairs: The list of (term, docID) tuples
+    :param pairs: The sorted (term, docID) tuples
     :return: A dictionary of form `{term: [list, of, docIDs]}`
     """
 
@@ -84,7 +622,7 @@ def create_index(pairs: List[Tuple[str, int]]) -> Dict[str, list]:
         this_term = tup[0]
         this_doc_id = tup[1]
 
-        index[this_term] += [this_doc_id]
+        index[this_term].append(this_doc_id)
 
     return dict(index)
 
@@ -103,69 +641,93 @@ def create_pairs(tokens: List[str], docID: int) -> list:
     return pairs
 
 
-def process_document(document: Tag) -> list:
+@METRICS.timed()
+def process_document(text: str, doc_id: int = 0, statistics: Optional[TermStatistics] = None) -> list:
     """
     Perform various textual processing steps on a given document to get ready for future steps.
 
-    :param document: The Reuters document, as represented by a Tag object
+    :param text: The text of the Reuters document, without the 'dateline' or 'title' tags
+    :param doc_id: The docID of the document, for its statistics
+    :param statistics: If given, also count the term frequencies and length of the document into it
     :return: A list of cleaned, tokenized, lower-cased, sorted tokens with no duplicates
     """
 
-    # Text is given as an individual document. Get the only document text in the list of 'text' tags in the document
-    doc_text = document('text')[0]
+    # Clean and tokenize the text in a single scan
+    tokens = list(tokenize(text))
+    if statistics is not None:
+        statistics.add(doc_id, tokens)
 
-    # Get the text of the article without the 'dateline' or 'title' tag, as this adds clutter
-    this_text = '\n'.join(tag.text for tag in doc_text.children if tag.name not in ['dateline', 'title'])
+    # Remove duplicates
+    no_dupes = set(tokens)
 
-    # Clean the text, so that I can tokenize more properly
-    cleaned_text = clean(this_text)
+    # Every distinct token becomes a (term, docID) pair
+    METRICS.count('documents')
+    METRICS.count('pairs', len(no_dupes))
 
-    # Tokenize the text
-    tokenized: List[str] = word_tokenize(cleaned_text)
+    return list(no_dupes)
 
-    # Remove duplicates
-    no_dupes = set(tokenized)
 
-    return list(no_dupes)
+def check_tokenizer_parity() -> bool:
+    """
+    Check that the single-scan tokenizer gives the same token set for every article in the corpus as cleaning the text
+    with `clean()` and tokenizing it with `nltk.word_tokenize()` does.
+
+    :return: Whether the token sets are the same for every article
+    """
 
+    mismatches = 0
 
-def get_texts() -> List[Tag]:
+    for article in get_texts():
+        if set(tokenize(article.text)) != set(word_tokenize(clean(article.text))):
+            mismatches += 1
+            print(f"Token sets differ for article {article.newid}")
+
+    if mismatches == 0:
+        print("\nThe tokenizer gives the same token set as clean() and word_tokenize() for every article")
+
+    return mismatches == 0
+
+
+@METRICS.timed()
+def get_texts() -> Iterator[Article]:
     """
-    Read the Reuters corpus to get all the articles
+    Read the Reuters corpus to get all the articles.
+
+    Articles are streamed lazily, one at a time, so the whole corpus is never held in memory.
 
-    :return: A list of Reuters articles, represented by Tag objects
+    :return: A generator of Reuters articles, represented by (newid, text) Article records
     """
 
     # Get a list of all corpus files to read
-    CORPUS_FILES: List[Path] = [Path(p) for p in glob("../reuters21578/*.sgm")]
-    dirname = CORPUS_FILES[0].parent
-    print(f"\nIn directory: {dirname}, found files:\n\n{[f.name for f in CORPUS_FILES]}\n")
-
-    # Create a list, to be populated later, of actual articles in this corpus
-    all_articles: List[Tag] = []
+    CORPUS_FILES: List[Path] = get_corpus_files()
 
-    # Loop though each file in the corpus
+    # Loop though each file in the corpus, yielding its articles
     for file in CORPUS_FILES:
         print(f"Reading file: {file.name}")
 
-        # Read the files contents as HTML
-        with open(file, 'r') as f:
-            contents = BeautifulSoup(f, features='html.parser')
+        yield from read_articles(file)
+
+
+def get_corpus_files() -> List[Path]:
+    """
+    Find all the files of the Reuters corpus
 
-        # Filter this content by 'reuters' tags
-        articles = contents('reuters')
+    :return: A list of Paths to the corpus files
+    """
 
-        # Add to the all_articles list, the list of articles found in this file. Use .extend to do so in a 'flat' way
-        # i.e. Don't want: [1, [2, [3, [4]]]], want: [1, 2, 3, 4]
-        all_articles.extend(articles)
+    CORPUS_FILES: List[Path] = [Path(p) for p in sorted(glob("../reuters21578/*.sgm"))]
+    dirname = CORPUS_FILES[0].parent
+    print(f"\nIn directory: {dirname}, found files:\n\n{[f.name for f in CORPUS_FILES]}\n")
 
-    return all_articles
+    return CORPUS_FILES
 
 
 def clean(text: str) -> str:
     """
     Perform mild cleaning of the incoming text to make tokenization easier and more accurate.
 
+    This is the reference for `tokenizer.tokenize()`, which does the same cleaning while it tokenizes.
+
     Based on experiment, need to remove Unicode control characters, make sure new lines have a space after,
     simplify acronyms to their constituent letters, remove all punctuation and special characters, remove all
     apostrophes (handle contractions carefully), and remove a srange ^M character.
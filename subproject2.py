@@ -1,11 +1,610 @@
+import bisect
 import json
+import re
 import sys
+import tempfile
+import time
 from pathlib import Path
-from typing import List
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, Mapping, Optional, Tuple
 
-from nltk.stem import PorterStemmer
+import numpy as np
 
+import postings_store
+from aho_corasick import AhoCorasick
+from binary_index import BinaryIndex
+from bm25 import BM25, frequencies_path, read_frequencies
+from dictionary_compression import FrontCodedIndex
+from kgram_index import KGramIndex, kgram_path
+from metrics import METRICS
+from positional_index import PositionalIndex, phrase_match, positions_path, proximity_match
+from postings import difference, intersect, union
+from postings_store import DOC_ID, PostingsStore
+from segments import MANIFEST_NAME, SegmentStore, SegmentedIndex
+from stemming import STEMMER
 
+
+# Default most query results, and most decoded postings lists, the query engine keeps cached
+RESULT_CACHE_SIZE = 1024
+POSTINGS_CACHE_SIZE = 4096
+
+# How a full cache picks the entry to evict: the least recently used one, or the least frequently used one
+CACHE_POLICIES = ('lru', 'lfu')
+
+# The fewest uncached queries a batch search builds an Aho-Corasick automaton for. Fewer are looked up one at a time,
+# through the k-gram index, as building the automaton costs more than sharing the scan saves. See the batch crossover
+# of `benchmark.py`
+MIN_BATCH = 2
+
+
+class QueryCache:
+    """
+    A bounded cache that counts its hits and misses, evicting either the least recently used entry (LRU) or the least
+    frequently used one (LFU) when full.
+
+    Under LFU, the keys are kept in buckets by how often they have been used, each bucket in order of use, so the
+    entry evicted is the least recently used of the least frequently used ones. Both policies get, put and evict in
+    constant time.
+    """
+
+    def __init__(self, max_size: int, policy: str = 'lru', name: str = 'cache'):
+        """
+        Create an empty cache.
+
+        :param max_size: The most entries to keep. Less than 1 disables the cache
+        :param policy: 'lru' or 'lfu'
+        :param name: The name of the cache, to name its hit and miss counters in the metrics with
+        """
+
+        if policy not in CACHE_POLICIES:
+            raise ValueError(f"Unknown cache policy \"{policy}\", expected one of {', '.join(CACHE_POLICIES)}")
+
+        self.max_size = max_size
+        self.policy = policy
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+
+        # The cached values, in order of use under LRU
+        self._entries: OrderedDict[Hashable, object] = OrderedDict()
+
+        # Under LFU: how often each key has been used, the keys by how often, and the fewest uses of any key
+        self._uses: Dict[Hashable, int] = {}
+        self._buckets: Dict[int, OrderedDict[Hashable, None]] = {}
+        self._lowest = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[object]:
+        """
+        Get the cached value of a key, counting a hit or a miss.
+
+        :param key: The key to look up
+        :return: Its value, or None if it isn't cached
+        """
+
+        if key not in self._entries:
+            self.misses += 1
+            METRICS.count(f'{self.name}_misses')
+            return None
+
+        self.hits += 1
+        METRICS.count(f'{self.name}_hits')
+        self._use(key)
+        return self._entries[key]
+
+    def put(self, key: Hashable, value: object) -> None:
+        """
+        Cache the value of a key, evicting an entry first if the cache is full.
+
+        :param key: The key
+        :param value: Its value. Must not be None, nor changed afterwards
+        """
+
+        if self.max_size < 1:
+            return
+
+        if key in self._entries:
+            self._entries[key] = value
+            self._use(key)
+            return
+
+        while len(self._entries) >= self.max_size:
+            self._evict()
+
+        self._entries[key] = value
+        if self.policy == 'lfu':
+            self._uses[key] = 1
+            self._buckets.setdefault(1, OrderedDict())[key] = None
+            self._lowest = 1
+
+    def discard(self, predicate: Callable[[Hashable], bool]) -> None:
+        """
+        Remove every entry whose key matches a predicate, i.e. every entry of an index whose file has changed.
+
+        :param predicate: Whether to remove the entry of a key
+        """
+
+        for key in [key for key in self._entries if predicate(key)]:
+            del self._entries[key]
+            if self.policy == 'lfu':
+                self._unbucket(key, self._uses.pop(key))
+
+    def clear(self) -> None:
+        """
+        Remove every entry. The hit and miss counts are kept.
+        """
+
+        self._entries.clear()
+        self._uses.clear()
+        self._buckets.clear()
+
+    def stats(self) -> dict:
+        """
+        Get how the cache has done so far.
+
+        :return: A dictionary of its policy, size bound, size, hits, misses and hit rate
+        """
+
+        lookups = self.hits + self.misses
+        return {'policy': self.policy, 'max_size': self.max_size, 'size': len(self._entries), 'hits': self.hits,
+                'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else None}
+
+    def _use(self, key: Hashable) -> None:
+        """
+        Mark a cached key as just used: the most recently used under LRU, used once more under LFU.
+
+        :param key: The key
+        """
+
+        if self.policy == 'lru':
+            self._entries.move_to_end(key)
+            return
+
+        uses = self._uses[key]
+        self._unbucket(key, uses)
+        if self._lowest == uses and uses not in self._buckets:
+            self._lowest = uses + 1
+
+        self._uses[key] = uses + 1
+        self._buckets.setdefault(uses + 1, OrderedDict())[key] = None
+
+    def _unbucket(self, key: Hashable, uses: int) -> None:
+        """
+        Take a key out of its LFU bucket, dropping the bucket if that empties it.
+
+        :param key: The key
+        :param uses: How often it has been used
+        """
+
+        bucket = self._buckets[uses]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[uses]
+
+    def _evict(self) -> None:
+        """
+        Remove the entry the policy picks: the least recently used, or the least recently used of the least frequently
+        used.
+        """
+
+        if self.policy == 'lru':
+            self._entries.popitem(last=False)
+            return
+
+        # Removing entries may have emptied the bucket of the fewest uses
+        if self._lowest not in self._buckets:
+            self._lowest = min(self._buckets)
+
+        key = next(iter(self._buckets[self._lowest]))
+        self._unbucket(key, self._lowest)
+        del self._uses[key]
+        del self._entries[key]
+
+
+class QueryEngine:
+    """
+    Answers queries on inverted index files, keeping the indexes it has read resident in memory.
+
+    Indexes are kept in a bounded LRU cache keyed by path. Each is remembered along with the modification time of its
+    file, so an index whose file has changed since it was read is read again.
+
+    Substring matching goes through a k-gram index of each index's dictionary, built the first time it is searched.
+
+    Query traffic is skewed, so on top of that there are two caches: the results of substring searches, keyed by the
+    query and the identity of the index, its path and modification time, and the postings lists of hot terms, decoded
+    from binary, front-coded and segmented indexes. Once an index's file changes, everything cached of it is dropped.
+    Queries are expected to be normalized already, like `challenge_query_processor()` does, so each query has a single
+    entry.
+    """
+
+    def __init__(self, max_indexes: int = 4, persist_kgrams: bool = False, max_results: int = RESULT_CACHE_SIZE,
+                 max_postings: int = POSTINGS_CACHE_SIZE, cache_policy: str = 'lru'):
+        """
+        Create a query engine with empty caches.
+
+        :param max_indexes: The most indexes to keep in memory at once. The least recently used one is dropped first
+        :param persist_kgrams: Whether to save k-gram indexes next to their index files, and load them from there
+        :param max_results: The most search results to cache. 0 disables the result cache
+        :param max_postings: The most decoded postings lists to cache. 0 disables the postings cache
+        :param cache_policy: How both caches evict entries, 'lru' or 'lfu'
+        """
+
+        self.max_indexes = max_indexes
+        self.persist_kgrams = persist_kgrams
+        self.set_caches(max_results, max_postings, cache_policy)
+        self._indexes: OrderedDict[Path, Tuple[int, Mapping]] = OrderedDict()
+        self._kgrams: Dict[Path, Tuple[int, KGramIndex]] = {}
+        self._scorers: Dict[Path, Tuple[int, BM25]] = {}
+        self._universes: Dict[Path, Tuple[int, list]] = {}
+        self._stores: Dict[Path, Tuple[int, PostingsStore]] = {}
+        self._positions: Dict[Path, Tuple[int, PositionalIndex]] = {}
+
+    def index(self, file: Path) -> Mapping:
+        """
+        Get the index of the given file, reading it only if it isn't cached or its file has changed.
+
+        Print an error message and exit if the file doesn't exist
+
+        :param file: The file to get the index of
+        :return: The inverted index as a dictionary
+        """
+
+        file = file.resolve()
+
+        try:
+            mtime = file.stat().st_mtime_ns
+        except FileNotFoundError:
+            sys.exit(f"\nThe required file ({str(file)}), does not exist.")
+
+        cached = self._indexes.get(file)
+        if cached is not None and cached[0] == mtime:
+            self._indexes.move_to_end(file)
+            return cached[1]
+
+        # The file has changed, so nothing cached of what it held before can be used again
+        if cached is not None:
+            self.results.discard(lambda key: key[0][0] == file)
+            self.postings_cache.discard(lambda key: key[0][0] == file)
+
+        inverted_index = _read_file(file)
+        self._indexes[file] = (mtime, inverted_index)
+        self._indexes.move_to_end(file)
+
+        # Drop the least recently used indexes
+        while len(self._indexes) > self.max_indexes:
+            dropped, _ = self._indexes.popitem(last=False)
+            self._kgrams.pop(dropped, None)
+            self._scorers.pop(dropped, None)
+            self._universes.pop(dropped, None)
+            self._stores.pop(dropped, None)
+            self.postings_cache.discard(lambda key: key[0][0] == dropped)
+
+        return inverted_index
+
+    def kgrams(self, file: Path) -> KGramIndex:
+        """
+        Get the k-gram index of the dictionary of the index of the given file, building it only if needed.
+
+        :param file: The file to get the k-gram index of
+        :return: The k-gram index of its dictionary
+        """
+
+        inverted_index = self.index(file)
+        file = file.resolve()
+        mtime = self._indexes[file][0]
+
+        cached = self._kgrams.get(file)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        # A saved k-gram index is only good if it was saved after the index file was last changed
+        saved = kgram_path(file)
+        if self.persist_kgrams and saved.exists() and saved.stat().st_mtime_ns >= mtime:
+            kgrams = KGramIndex.load(saved)
+        else:
+            kgrams = KGramIndex(inverted_index.keys())
+            if self.persist_kgrams:
+                kgrams.save(saved)
+
+        self._kgrams[file] = (mtime, kgrams)
+        return kgrams
+
+    def scorer(self, file: Path) -> BM25:
+        """
+        Get the BM25 scorer of the index of the given file, reading its term frequencies only if needed.
+
+        Print an error message and exit if the index has no saved term frequencies
+
+        :param file: The file to get the BM25 scorer of
+        :return: The BM25 scorer of its index
+        """
+
+        inverted_index = self.index(file)
+        file = file.resolve()
+        mtime = self._indexes[file][0]
+
+        cached = self._scorers.get(file)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        try:
+            frequencies, lengths = read_frequencies(frequencies_path(file))
+        except FileNotFoundError:
+            sys.exit(f"\nThe required file ({str(frequencies_path(file))}), does not exist. Build the index with "
+                     f"--frequencies.")
+
+        scorer = BM25(inverted_index, frequencies, lengths)
+        self._scorers[file] = (mtime, scorer)
+        return scorer
+
+    def universe(self, file: Path) -> list:
+        """
+        Get every docID in the index of the given file, computing it only if it isn't cached or its file has changed.
+
+        :param file: The file to get the docIDs of
+        :return: The sorted docIDs of every document in the index. Must not be changed
+        """
+
+        inverted_index = self.index(file)
+        file = file.resolve()
+        mtime = self._indexes[file][0]
+
+        cached = self._universes.get(file)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        # A single set union runs in C, rather than merging the postings lists one by one
+        universe = sorted(set().union(*(inverted_index[key] for key in inverted_index.keys())))
+        self._universes[file] = (mtime, universe)
+        return universe
+
+    def store(self, file: Path) -> Mapping:
+        """
+        Get the index of the given file with its postings in NumPy arrays, for Boolean queries to merge them vectorized.
+        Only built if it isn't cached or its file has changed.
+
+        Only indexes read whole from JSON are copied into a `PostingsStore`. Memory-mapped, front-coded and segmented
+        indexes are given as they are, so they are never read whole.
+
+        :param file: The file to get the index of
+        :return: The array-backed index, or the index itself if it isn't read whole
+        """
+
+        inverted_index = self.index(file)
+        if not isinstance(inverted_index, dict):
+            return inverted_index
+
+        file = file.resolve()
+        mtime = self._indexes[file][0]
+
+        cached = self._stores.get(file)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        store = PostingsStore.from_index(inverted_index)
+        self._stores[file] = (mtime, store)
+        return store
+
+    def positions(self, file: Path) -> PositionalIndex:
+        """
+        Get the positional index of the index of the given file, reading it only if it isn't cached or has changed.
+
+        Print an error message and exit if the index has no positional index
+
+        :param file: The file to get the positional index of
+        :return: Its positional index
+        """
+
+        file = positions_path(file.resolve())
+
+        try:
+            mtime = file.stat().st_mtime_ns
+        except FileNotFoundError:
+            sys.exit(f"\nThe required file ({str(file)}), does not exist. Build the index with --positions.")
+
+        cached = self._positions.get(file)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        positional = PositionalIndex(file)
+        self._positions[file] = (mtime, positional)
+        return positional
+
+    def set_caches(self, max_results: int = RESULT_CACHE_SIZE, max_postings: int = POSTINGS_CACHE_SIZE,
+                   policy: str = 'lru') -> None:
+        """
+        Replace the result and postings caches with empty ones of the given sizes and policy.
+
+        :param max_results: The most search results to cache. 0 disables the result cache
+        :param max_postings: The most decoded postings lists to cache. 0 disables the postings cache
+        :param policy: How both caches evict entries, 'lru' or 'lfu'
+        """
+
+        self.results = QueryCache(max_results, policy, 'result_cache')
+        self.postings_cache = QueryCache(max_postings, policy, 'postings_cache')
+
+    def clear_caches(self) -> None:
+        """
+        Empty the result and postings caches, i.e. to time queries on a cold cache. The indexes stay resident.
+        """
+
+        self.results.clear()
+        self.postings_cache.clear()
+
+    def cache_stats(self) -> dict:
+        """
+        Get how the result and postings caches have done so far.
+
+        :return: The stats of each cache, by name
+        """
+
+        return {'results': self.results.stats(), 'postings': self.postings_cache.stats()}
+
+    def _identity(self, file: Path) -> Tuple[Path, int]:
+        """
+        Get the identity of a resident index, which the entries cached of it are keyed by.
+
+        :param file: The file of the index, already read by `index()`
+        :return: Its resolved path and the modification time it was read at
+        """
+
+        file = file.resolve()
+        return file, self._indexes[file][0]
+
+    def _postings(self, inverted_index: Mapping, identity: Tuple[Path, int], term: str) -> list:
+        """
+        Get the postings list of a term of an index, going through the postings cache unless the index is a dictionary,
+        whose postings lists are already decoded.
+
+        :param inverted_index: The index
+        :param identity: Its identity, from `_identity()`
+        :param term: The term, which must be in the index
+        :return: The postings list of the term. Must not be changed
+        """
+
+        if isinstance(inverted_index, dict):
+            return inverted_index[term]
+
+        key = (identity, term)
+        postings = self.postings_cache.get(key)
+        if postings is None:
+            postings = inverted_index[term]
+            self.postings_cache.put(key, postings)
+
+        return postings
+
+    def postings(self, term: str, file: Path) -> list:
+        """
+        Look a single term up exactly in the index of the given file.
+
+        :param term: The term to look up
+        :param file: The file of the index
+        :return: The postings list of the term, or an empty list if it isn't in the index
+        """
+
+        inverted_index = self.index(file)
+        if term not in inverted_index:
+            return []
+
+        return list(self._postings(inverted_index, self._identity(file), term))
+
+    def search(self, query: str, file: Path) -> list:
+        """
+        Find all docIDs of all terms in the index of the given file that contain the query.
+
+        :param query: The query to search the inverted index for
+        :param file: The file of the index to search
+        :return: A sorted list of docIDs without duplicates, possibly empty
+        """
+
+        inverted_index = self.index(file)
+        identity = self._identity(file)
+
+        cached = self.results.get((identity, query))
+        if cached is not None:
+            return list(cached)
+
+        postings = self._search(inverted_index, identity, query, file)
+        self.results.put((identity, query), tuple(postings))
+        return postings
+
+    def _search(self, inverted_index: Mapping, identity: Hashable, query: str, file: Path) -> list:
+        """
+        Find all docIDs of all terms in an index that contain the query, without looking at the result cache.
+
+        :param inverted_index: The index of the given file
+        :param identity: The identity of the index, see `_identity()`
+        :param query: The query to search the inverted index for
+        :param file: The file of the index to search
+        :return: A sorted list of docIDs without duplicates, possibly empty
+        """
+
+        # Find all keys that contain the query, through the k-gram index rather than looking through all keys
+        postings = []
+        for key in self.kgrams(file).matches(query):
+            postings.extend(self._postings(inverted_index, identity, key))
+
+        # Sort and remove duplicates from postings list
+        return sorted(set(postings))
+
+    def batch_search(self, queries: List[str], file: Path, min_batch: int = MIN_BATCH) -> Dict[str, list]:
+        """
+        Search the index of the given file for many queries at once, giving the same results as `search()` for each.
+
+        Queries whose results are cached are answered from there. An Aho-Corasick automaton is built over the rest.
+        Only the terms the k-gram index gives as candidates for some query can contain it, so only those are streamed
+        through the automaton, once each. Each is scanned a single time, whatever the number of queries, and its
+        postings list is handed to every query found in it. Too few queries to be worth an automaton are searched one
+        at a time, like `search()` does.
+
+        :param queries: The queries to search the inverted index for
+        :param file: The file of the index to search
+        :param min_batch: The fewest uncached queries to build an automaton for
+        :return: The sorted docIDs without duplicates of each query, by query
+        """
+
+        inverted_index = self.index(file)
+        identity = self._identity(file)
+
+        patterns = list(dict.fromkeys(queries))
+        results: Dict[str, list] = {}
+        misses = []
+        for query in patterns:
+            cached = self.results.get((identity, query))
+            if cached is None:
+                misses.append(query)
+            else:
+                results[query] = list(cached)
+
+        if len(misses) < min_batch:
+            for query in misses:
+                results[query] = self._search(inverted_index, identity, query, file)
+                self.results.put((identity, query), tuple(results[query]))
+
+        elif misses:
+            automaton = AhoCorasick(misses)
+            kgrams = self.kgrams(file)
+
+            # Only the terms with every k-gram of some query can contain it
+            candidates = set()
+            for query in misses:
+                candidates.update(kgrams.candidates(query))
+
+            # The postings lists of the terms each query is found in
+            accumulators: List[List[list]] = [[] for _ in misses]
+            for position in candidates:
+                term = kgrams.terms[position]
+                found = automaton.find(term)
+                if found:
+                    postings = self._postings(inverted_index, identity, term)
+                    for number in found:
+                        accumulators[number].append(postings)
+
+            for query, postings_lists in zip(misses, accumulators):
+                results[query] = sorted(set().union(*postings_lists))
+                self.results.put((identity, query), tuple(results[query]))
+
+        return {query: results[query] for query in patterns}
+
+
+# The query engine all queries go through, so each index is only read once
+ENGINE = QueryEngine()
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a query the way the challenge queries are: case-folded, then stemmed with the shared Porter stemmer.
+
+    :param query: The query as given
+    :return: The normalized query
+    """
+
+    return STEMMER.stem(query.lower())
+
+
+@METRICS.timed()
 def _search_query(query: str, file: Path, subproject: int, show_results: bool = True) -> list:
     """
     Search the inverted index for the user-given query.
@@ -18,17 +617,113 @@ def _search_query(query: str, file: Path, subproject: int, show_results: bool =
     :return: A possible list of docIDs, if any were found
     """
 
-    # Read the inverted index
-    inverted_index = _read_file(file)
+    # Search the index, which is only read the first time it is needed
+    postings = ENGINE.search(query, file)
+
+    if show_results:
+        if subproject == 1:
+            print(f"\nFor the uncompressed index, the list of articles the query \"{query}\" is found in: {postings}")
+        elif subproject == 3:
+            print(f"\nFor the compressed index, the list of articles the query \"{query}\" is found in: {postings}")
+
+    # Return all postings found, if any
+    return postings
+
+
+@METRICS.timed()
+def _boolean_query(query: str, file: Path, subproject: int, show_results: bool = True) -> list:
+    """
+    Search the inverted index for a Boolean query, like "bundesbank AND rate NOT germany".
+
+    Terms are matched exactly against the dictionary, so they should be normalized the same way the index is. Operators
+    are `AND`, `OR` and `NOT`, with `NOT` binding tightest and `OR` loosest, and parentheses for grouping. Terms next
+    to each other without an operator are ANDed, so "rate NOT germany" means "rate AND NOT germany".
+
+    :param query: The Boolean query to search the inverted index for
+    :param file: The file to read the index of
+    :param subproject: Whether this is being run on the uncompressed or compressed index. Changes output text
+    :return: A possible list of docIDs, if any were found
+    """
+
+    inverted_index = ENGINE.store(file)
 
-    # Look through all keys, to find all that contain the query
-    postings = []
-    for key in inverted_index.keys():
-        if query in key:
-            postings.extend(inverted_index[key])
+    tokens = re.findall(r'\(|\)|[^\s()]+', query)
+    tree = _parse_or(tokens)
+    if tokens:
+        raise ValueError(f"Unexpected \"{tokens[0]}\" in Boolean query \"{query}\"")
 
-    # Sort and remove duplicates from postings list
-    postings = sorted(set(postings))
+    postings = _evaluate(tree, inverted_index, lambda: ENGINE.universe(file))
+
+    # Array-backed indexes give arrays of docIDs. A single term may give the list held in the index itself, so copy it
+    postings = postings.tolist() if isinstance(postings, np.ndarray) else list(postings)
+
+    if show_results:
+        if subproject == 1:
+            print(f"\nFor the uncompressed index, the list of articles the query \"{query}\" is found in: {postings}")
+        elif subproject == 3:
+            print(f"\nFor the compressed index, the list of articles the query \"{query}\" is found in: {postings}")
+
+    return postings
+
+
+@METRICS.timed()
+def _ranked_query(query: str, file: Path, subproject: int, k: int = 10,
+                  show_results: bool = True) -> List[Tuple[int, float]]:
+    """
+    Rank the documents of the inverted index for a query of terms with BM25, returning the best k.
+
+    Terms are separated by whitespace, and matched exactly against the dictionary, so they should be normalized the
+    same way the index is. Needs the term frequencies of the index, saved with `--frequencies`.
+
+    :param query: The terms to rank documents for
+    :param file: The file to read the index of
+    :param subproject: Whether this is being run on the uncompressed or compressed index. Changes output text
+    :param k: How many documents to return
+    :return: The top k (docID, score) pairs, by highest score
+    """
+
+    ranked = ENGINE.scorer(file).top_k(query.split(), k)
+
+    if show_results:
+        if subproject == 1:
+            print(f"\nFor the uncompressed index, the top {k} articles for the query \"{query}\": {ranked}")
+        elif subproject == 3:
+            print(f"\nFor the compressed index, the top {k} articles for the query \"{query}\": {ranked}")
+
+    return ranked
+
+
+@METRICS.timed()
+def _positional_query(query: str, file: Path, subproject: int, show_results: bool = True) -> list:
+    """
+    Search the positional index for a phrase, like "Bundesbank president", or for two terms near each other, like
+    "Bundesbank NEAR/5 president".
+
+    A phrase matches documents with its terms next to each other, in order. `NEAR/k` matches documents with the two
+    terms at most k positions apart, in either order. Terms are matched exactly, like in `_boolean_query()`. Terms are
+    checked rarest first, so the fewest documents and positions are looked at.
+
+    :param query: The phrase, or proximity query, to search the positional index for
+    :param file: The file of the index to search. Its positional index must have been saved
+    :param subproject: Whether this is being run on the uncompressed or compressed index. Changes output text
+    :return: A possible list of docIDs, if any were found
+    """
+
+    positional = ENGINE.positions(file)
+
+    near = re.fullmatch(r'\s*(\S+)\s+NEAR/(\d+)\s+(\S+)\s*', query)
+    if near:
+        first, second = sorted([near.group(1), near.group(3)], key=positional.document_frequency)
+        postings = proximity_match(positional.postings(first), positional.postings(second), int(near.group(2)))
+
+    else:
+        terms = query.strip('"').split()
+        if not terms:
+            raise ValueError("Missing term in phrase query")
+
+        # Rarest first, remembering where each term is in the phrase
+        order = sorted(range(len(terms)), key=lambda offset: positional.document_frequency(terms[offset]))
+        postings = phrase_match([positional.postings(terms[offset]) for offset in order], order)
 
     if show_results:
         if subproject == 1:
@@ -36,14 +731,291 @@ def _search_query(query: str, file: Path, subproject: int, show_results: bool =
         elif subproject == 3:
             print(f"\nFor the compressed index, the list of articles the query \"{query}\" is found in: {postings}")
 
-    # Return all postings found, if any
     return postings
 
 
-def _read_file(file: Path) -> dict:
+def _parse_or(tokens: List[str]) -> tuple:
+    """
+    Parse the tokens of a Boolean query into a tree of `('or', [children])`, `('and', [children], [negated children])`
+    and `('term', term)` nodes. Parsed tokens are removed from the front of the list.
+
+    :param tokens: The tokens of the Boolean query
+    :return: The parsed tree
+    """
+
+    children = [_parse_and(tokens)]
+    while tokens and tokens[0] == 'OR':
+        tokens.pop(0)
+        children.append(_parse_and(tokens))
+
+    return children[0] if len(children) == 1 else ('or', children)
+
+
+def _parse_and(tokens: List[str]) -> tuple:
+    """
+    Parse an AND of one or more possibly negated operands. See `_parse_or()`.
+
+    :param tokens: The tokens of the Boolean query
+    :return: The parsed tree
+    """
+
+    positive, negative = [], []
+
+    while True:
+        # A NOT negates the next operand. Two of them cancel out
+        negated = False
+        while tokens and tokens[0] == 'NOT':
+            tokens.pop(0)
+            negated = not negated
+
+        if not tokens or tokens[0] in ('AND', 'OR', ')'):
+            raise ValueError("Missing term in Boolean query")
+
+        if tokens[0] == '(':
+            tokens.pop(0)
+            operand = _parse_or(tokens)
+            if not tokens or tokens.pop(0) != ')':
+                raise ValueError("Missing closing parenthesis in Boolean query")
+        else:
+            operand = ('term', tokens.pop(0))
+
+        (negative if negated else positive).append(operand)
+
+        # Keep going on an explicit AND, or on another operand right after this one
+        if tokens and tokens[0] == 'AND':
+            tokens.pop(0)
+        elif not tokens or tokens[0] in ('OR', ')'):
+            break
+
+    if len(positive) == 1 and not negative:
+        return positive[0]
+
+    return 'and', positive, negative
+
+
+def _evaluate(tree: tuple, inverted_index: Mapping, universe: Callable[[], list]) -> list:
+    """
+    Evaluate a parsed Boolean query on the inverted index.
+
+    ANDs intersect their operands rarest first, so the intermediate results stay as small as possible, and stop as
+    soon as they are empty. Negated operands are removed from the result afterwards.
+
+    On a `PostingsStore`, postings are merged as arrays, with the vectorized merges of `postings_store`, and the result
+    is an array. Otherwise they are merged as lists, with skip pointers.
+
+    :param tree: The parsed Boolean query, from `_parse_or()`
+    :param inverted_index: The inverted index to evaluate the query on
+    :param universe: Gives every docID in the index, for ANDs of only negated operands. Only called if needed
+    :return: The sorted list, or array, of matching docIDs
+    """
+
+    if isinstance(inverted_index, PostingsStore):
+        merge_union, merge_intersect, merge_difference = (postings_store.union, postings_store.intersect,
+                                                          postings_store.difference)
+        empty = np.empty(0, dtype=DOC_ID)
+    else:
+        merge_union, merge_intersect, merge_difference, empty = union, intersect, difference, []
+
+    if tree[0] == 'term':
+        return inverted_index.get(tree[1], empty)
+
+    if tree[0] == 'or':
+        result = empty
+        for child in tree[1]:
+            result = merge_union(result, _evaluate(child, inverted_index, universe))
+        return result
+
+    _, positive, negative = tree
+
+    # Intersect from the shortest postings list up
+    operands = sorted((_evaluate(child, inverted_index, universe) for child in positive), key=len)
+    if operands:
+        result = operands[0]
+        for operand in operands[1:]:
+            if len(result) == 0:
+                break
+            result = merge_intersect(result, operand)
+
+    # Only negated operands, so start from every document in the index
+    else:
+        result = universe()
+        if isinstance(inverted_index, PostingsStore):
+            result = np.asarray(result, dtype=DOC_ID)
+
+    for child in negative:
+        if len(result) == 0:
+            break
+        result = merge_difference(result, _evaluate(child, inverted_index, universe))
+
+    return result
+
+
+def boolean_benchmark(file: Path, terms: List[str] = None, repeat: int = 100) -> None:
+    """
+    Time intersecting postings lists with skip pointers, and as NumPy arrays, against naively intersecting them as
+    sets, and print the results.
+
+    :param file: The file of the index to benchmark on
+    :param terms: The terms to AND together, in pairs and all together. Defaults to the 10 terms with the longest
+                  postings lists, as those benefit the most from skipping
+    :param repeat: How many times to time each query
+    """
+
+    inverted_index = ENGINE.index(file)
+    store = ENGINE.store(file)
+
+    if terms is None:
+        terms = sorted(inverted_index.keys(), key=lambda key: len(inverted_index[key]), reverse=True)[:10]
+
+    queries = [[first, second] for first, second in zip(terms, terms[1:])] + [terms]
+    print(f"\nBenchmarking {len(queries)} AND queries on {file}, {repeat} times each...")
+
+    for query in queries:
+        lists = [inverted_index[term] for term in query]
+
+        tick = time.perf_counter()
+        for _ in range(repeat):
+            merged = _evaluate(('and', [('term', term) for term in query], []), inverted_index,
+                               lambda: ENGINE.universe(file))
+        merge_time = (time.perf_counter() - tick) / repeat
+
+        tick = time.perf_counter()
+        for _ in range(repeat):
+            vectorized = _evaluate(('and', [('term', term) for term in query], []), store,
+                                   lambda: ENGINE.universe(file))
+        vectorized_time = (time.perf_counter() - tick) / repeat
+
+        tick = time.perf_counter()
+        for _ in range(repeat):
+            naive = sorted(set(lists[0]).intersection(*lists[1:]))
+        naive_time = (time.perf_counter() - tick) / repeat
+
+        assert merged == naive == list(vectorized)
+        print(f"{' AND '.join(query)} ({', '.join(str(len(lst)) for lst in lists)} postings): "
+              f"skip pointers {merge_time * 1000:0.3f} ms, arrays {vectorized_time * 1000:0.3f} ms, "
+              f"sets {naive_time * 1000:0.3f} ms")
+
+
+def ranked_benchmark(file: Path, queries: List[str] = None, k: int = 10, repeat: int = 20) -> None:
+    """
+    Time ranking documents with BM25 by scoring every matching document, against pruning them with WAND, and print the
+    results.
+
+    :param file: The file of the index to benchmark on. Its term frequencies must have been saved
+    :param queries: The queries to rank documents for, normalized like the index. Defaults to queries mixing common
+                    and rare terms, as those benefit the most from pruning
+    :param k: How many documents to rank
+    :param repeat: How many times to time each query
+    """
+
+    inverted_index = ENGINE.index(file)
+    scorer = ENGINE.scorer(file)
+
+    if queries is None:
+        by_frequency = sorted(inverted_index.keys(), key=lambda key: len(inverted_index[key]), reverse=True)
+        common, rare = by_frequency[:20], by_frequency[len(by_frequency) // 50:][:20]
+        queries = [f"{common[number]} {rare[number]}" for number in range(0, 20, 4)] + \
+                  [f"{common[number]} {common[number + 1]} {rare[number]}" for number in range(0, 20, 4)] + \
+                  [' '.join(common[:5])]
+
+    print(f"\nBenchmarking {len(queries)} top {k} BM25 queries on {file}, {repeat} times each...")
+
+    for query in queries:
+        terms = query.split()
+
+        tick = time.perf_counter()
+        for _ in range(repeat):
+            exhaustive = scorer.exhaustive(terms, k)
+        exhaustive_time = (time.perf_counter() - tick) / repeat
+        exhaustive_scored = scorer.documents_scored
+
+        tick = time.perf_counter()
+        for _ in range(repeat):
+            pruned = scorer.top_k(terms, k)
+        pruned_time = (time.perf_counter() - tick) / repeat
+        pruned_scored = scorer.documents_scored
+
+        assert pruned == exhaustive
+        print(f"{query}: exhaustive {exhaustive_time * 1000:0.3f} ms ({exhaustive_scored:,} documents scored), "
+              f"WAND {pruned_time * 1000:0.3f} ms ({pruned_scored:,} documents scored)")
+
+
+def segment_benchmark(file: Path, segment_counts: Tuple[int, ...] = (1, 2, 4, 8, 16), terms: List[str] = None,
+                      repeat: int = 20) -> None:
+    """
+    Time queries on the same index split into more and more segments, and print the results.
+
+    The documents are split into segments of consecutive docIDs, as ingestion batches would be. Every term is looked up
+    exactly, fanning out across the segments, and searched as a substring, as `_search_query()` does.
+
+    :param file: The file of the index to split into segments
+    :param segment_counts: The numbers of segments to time queries on
+    :param terms: The terms to query. Defaults to 10 terms from the most to the least common
+    :param repeat: How many times to time each query
+    """
+
+    # Imported here, as the benchmark suite imports this module
+    from benchmark import percentile
+
+    inverted_index = ENGINE.index(file)
+
+    if terms is None:
+        by_frequency = sorted(inverted_index.keys(), key=lambda key: len(inverted_index[key]), reverse=True)
+        terms = by_frequency[::max(len(by_frequency) // 10, 1)][:10]
+
+    doc_ids = ENGINE.universe(file)
+    print(f"\nBenchmarking {len(terms)} queries on {file} split into {', '.join(map(str, segment_counts))} segments, "
+          f"{repeat} times each...")
+
+    for count in segment_counts:
+        with tempfile.TemporaryDirectory() as directory:
+            # Split the documents into segments of consecutive docIDs
+            store = SegmentStore(Path(directory), merge_factor=None, background=False)
+            bounds = [doc_ids[len(doc_ids) * number // count] for number in range(count)] + [doc_ids[-1] + 1]
+            for low, high in zip(bounds, bounds[1:]):
+                segment = {}
+                for key in inverted_index.keys():
+                    postings = inverted_index[key]
+                    part = postings[bisect.bisect_left(postings, low):bisect.bisect_left(postings, high)]
+                    if part:
+                        segment[key] = part
+                store.add_segment(segment)
+
+            # A separate engine, so the benchmark doesn't push the real indexes out of the shared one, without caches,
+            # so every repeat of a query fans out across the segments
+            engine = QueryEngine(max_results=0, max_postings=0)
+            manifest = store.manifest_file
+            segmented = engine.index(manifest)
+            engine.kgrams(manifest)
+
+            lookups, searches = [], []
+            for term in terms:
+                for _ in range(repeat):
+                    tick = time.perf_counter()
+                    postings = segmented[term]
+                    lookups.append(time.perf_counter() - tick)
+
+                    tick = time.perf_counter()
+                    engine.search(term, manifest)
+                    searches.append(time.perf_counter() - tick)
+
+                assert postings == inverted_index[term]
+
+        print(f"{count} segments: lookup mean {sum(lookups) / len(lookups) * 1000:0.3f} ms, "
+              f"p99 {percentile(lookups, 99) * 1000:0.3f} ms; "
+              f"substring search mean {sum(searches) / len(searches) * 1000:0.3f} ms, "
+              f"p99 {percentile(searches, 99) * 1000:0.3f} ms")
+
+
+@METRICS.timed()
+def _read_file(file: Path) -> Mapping:
     """
     Try to read the naive_indexer.txt file.
 
+    If given a `.dict` file, open that binary index instead. It is memory-mapped rather than read, and behaves like
+    a dictionary. Likewise for a `.fc` front-coded index, which is kept compact in memory, and for the manifest of a
+    segmented index, whose lookups fan out across its segments.
+
     Print an error message and exit if unable to
 
     :return: The inverted index as a dictionary, if possible.
@@ -51,6 +1023,15 @@ def _read_file(file: Path) -> dict:
 
     # Try to read the inverted index, if it exists
     try:
+        if file.suffix == '.dict':
+            return BinaryIndex(file)
+
+        if file.suffix == '.fc':
+            return FrontCodedIndex(file)
+
+        if file.name == MANIFEST_NAME:
+            return SegmentedIndex(file)
+
         with open(file, 'rt') as f:
             inverted_index: dict = json.load(f)
         return inverted_index
@@ -60,6 +1041,68 @@ def _read_file(file: Path) -> dict:
         sys.exit(f"\nThe required file ({str(file)}), does not exist.")
 
 
+@METRICS.timed()
+def batch_query(queries: List[str], file: Path) -> Dict[str, list]:
+    """
+    Search the inverted index for many queries at once, giving the same results as `_search_query()` for each, in a
+    single pass over the dictionary. See `QueryEngine.batch_search()`.
+
+    :param queries: The queries to search the inverted index for
+    :param file: The file to read the index of
+    :return: The sorted docIDs without duplicates of each query, by query
+    """
+
+    return ENGINE.batch_search(queries, file)
+
+
+def read_queries(file: Path) -> List[str]:
+    """
+    Read a query file: one query per line, skipping blank lines.
+
+    Print an error message and exit if the file doesn't exist
+
+    :param file: The query file
+    :return: The queries, in order
+    """
+
+    try:
+        with open(file, 'rt') as f:
+            return [line.strip() for line in f if line.strip()]
+    except FileNotFoundError:
+        sys.exit(f"\nThe required file ({str(file)}), does not exist.")
+
+
+def batch_query_processor(query_file: Path, normalize: bool = True) -> None:
+    """
+    Run the query processor on every query of a query file, in a single pass over each index.
+
+    Search the uncompressed and compressed indexes for all queries, with `batch_query()`. Print results to files in the
+    `query_results/batch_queries/` directory, in the same shape as the other query results.
+
+    :param query_file: The file of queries, one per line
+    :param normalize: Whether to normalize the queries first, like the challenge queries
+    """
+
+    print(f"\nReading queries from file: {query_file}")
+    queries = read_queries(query_file)
+    if normalize:
+        queries = [normalize_query(query) for query in queries]
+
+    print(f"Searching the uncompressed and compressed indexes for {len(queries):,} queries...")
+    results_uncompressed = batch_query(queries, Path("output/1. naive_index.txt"))
+    results_compressed = batch_query(queries, Path("output/5. stemmed_index.txt"))
+
+    Path('query_results/batch_queries/').mkdir(exist_ok=True, parents=True)
+
+    print("\nSaving to file: query_results/batch_queries/uncompressed_index.txt")
+    with open('query_results/batch_queries/uncompressed_index.txt', 'wt') as f:
+        json.dump(results_uncompressed, f, indent=4)
+
+    print("Saving to file: query_results/batch_queries/compressed_index.txt")
+    with open('query_results/batch_queries/compressed_index.txt', 'wt') as f:
+        json.dump(results_compressed, f, indent=4)
+
+
 def challenge_query_processor(queries: List[str]) -> None:
     """
     Run the query processor on a list of challenge queries.
@@ -70,13 +1113,11 @@ def challenge_query_processor(queries: List[str]) -> None:
     :param queries: the list of queries to process
     """
 
-    stemmer = PorterStemmer()
-
     results_uncompressed = {}
     results_compressed = {}
 
     for query in queries:
-        query = stemmer.stem(query.lower())
+        query = normalize_query(query)
 
         results_uncompressed[query] = _search_query(query, Path("output/1. naive_index.txt"), 1)
         results_compressed[query] = _search_query(query, Path("output/5. stemmed_index.txt"), 3)
@@ -105,14 +1146,11 @@ def sample_query_processor(index: Path, subproject: int = 1) -> None:
     SAMPLE_QUERY_2 = "017"  # This tests number-removal
     SAMPLE_QUERY_3 = "Zweig"  # This tests case-folding
 
-    # Create Porter stemmer for normalizing search queries
-    stemmer = PorterStemmer()
-
-    # Create 3 sample queries for searching. Make sure they are normalized before
+    # Create 3 sample queries for searching. Make sure they are normalized with the shared Porter stemmer before
     # searching so both indexes have the terms
-    SAMPLE_QUERY_4 = stemmer.stem("males".lower())
-    SAMPLE_QUERY_5 = stemmer.stem("CORRECTED".lower())
-    SAMPLE_QUERY_6 = stemmer.stem("texts".lower())
+    SAMPLE_QUERY_4 = STEMMER.stem("males".lower())
+    SAMPLE_QUERY_5 = STEMMER.stem("CORRECTED".lower())
+    SAMPLE_QUERY_6 = STEMMER.stem("texts".lower())
 
     # Search the required index for those test queries
     print("\nRunning test queries...")
@@ -1,88 +1,119 @@
+import heapq
 import json
+import sys
 from collections import defaultdict
-
-from nltk.stem import PorterStemmer
-
-from utilities import (calc_postings_size, calc_dict_size, calc_percent_change, render_table)
-
-
-def subproject_3():
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+from bm25 import frequencies_path, read_frequencies
+from dictionary_compression import BLOCK_SIZE, DictionaryString, write_front_coded_index
+from index_writer import WRITER, atomic_file
+from metrics import METRICS
+from postings import merge_many
+from postings_compression import write_compressed_index
+from postings_store import PostingsStore
+from stemming import STEMMER
+from utilities import (calc_memory_size, calc_postings_size, calc_dict_size, calc_percent_change, render_storage_table,
+                       render_table)
+
+# The files every lossy compression stage saves its index to, in order
+STAGE_FILES = ["output/2. no_numbers_index.txt", "output/3. case_folded_index.txt", "output/4a. 30_stopwords_index.txt",
+               "output/4b. 150_stopwords_index.txt", "output/5. stemmed_index.txt"]
+
+# A single (term, postings) entry of an index, as streamed between the stages of the fused pipeline
+Entry = Tuple[str, list]
+
+
+@METRICS.timed()
+def subproject_3(workers: int = 1, fused: bool = False, write_intermediate: bool = True,
+                 affected: Optional[Set[str]] = None, frequencies: bool = False, array_postings: bool = False):
     """
     Read the index generated from `subproject1.py`, and perform various lossy compressions to it, saving
     to additional output files and recording size data along the way. Display a table at the end. Finally,
     run the query processor on the selected three queries again to see what has changed.
+
+    :param workers: The number of worker processes to stem the dictionary with
+    :param fused: Whether to fuse the lossy compression stages into a single streaming pass
+    :param write_intermediate: Whether the fused pass saves the index after every stage, or only the stemmed one.
+                               The staged pass always saves every stage
+    :param affected: The terms of the naive index whose postings lists changed since the last run, from an
+                     incremental update. If given, and every stage was saved by the last run, only the entries of these
+                     terms are updated. None means every stage is run in full
+    :param frequencies: Whether to carry the term frequencies of the naive index through to the stemmed index too,
+                        for ranked queries. See `stem_frequencies()`
+    :param array_postings: Whether to run the stages on an array-backed postings store rather than Python lists, and
+                           report how much memory it saves. See `array_pipeline()`
     """
 
     # Read the naive index into memory
     with open('output/1. naive_index.txt', 'rt') as f:
         index = json.load(f)
 
-    # Calculate initial sizes
-    INITIAL_DICT_SIZE = calc_dict_size(index)
-    INITIAL_POSTINGS_SIZE = calc_postings_size(index)
+    # Run the lossy compression stages, either one full index at a time, fused into a single streaming pass, or by
+    # only updating the entries of changed terms in the indexes of the last run
+    if affected is not None and all(Path(file).exists() for file in STAGE_FILES):
+        SIZES, case_folded_index, index = incremental_pipeline(index, affected, workers)
+    elif array_postings:
+        SIZES, case_folded_index, index = array_pipeline(index, workers)
+    elif fused:
+        SIZES, case_folded_index, index = fused_pipeline(index, workers, write_intermediate)
+    else:
+        SIZES, case_folded_index, index = staged_pipeline(index, workers)
+
+    # Sum the term frequencies of every naive term that ends up as the same stemmed term
+    if frequencies:
+        print("\nCarrying term frequencies through to the stemmed index")
+        stem_frequencies(read_stopwords(), workers)
+
+    # Store the case-folded dictionary compactly
+    CASE_FOLDING_DICTIONARY_SIZES = compress_dictionary(case_folded_index, "Case-folded",
+                                                        "output/3. case_folded_index.fc")
 
-    # Remove numbers
-    print("\nRemoving numbers from the index")
-    index = remove_numbers(index)
+    # Calculate initial sizes
+    INITIAL_DICT_SIZE, INITIAL_POSTINGS_SIZE = SIZES['initial']
 
     # Calculate size data after removing numbers
-    NO_NUMS_DICT_SIZE = calc_dict_size(index)
-    NO_NUMS_POSTINGS_SIZE = calc_postings_size(index)
+    NO_NUMS_DICT_SIZE, NO_NUMS_POSTINGS_SIZE = SIZES['no_numbers']
     PCT_CHANGE_DICT_SIZE_NO_NUMS = calc_percent_change(NO_NUMS_DICT_SIZE, INITIAL_DICT_SIZE)
     PCT_CHANGE_POSTINGS_SIZE_NO_NUMS = calc_percent_change(NO_NUMS_POSTINGS_SIZE, INITIAL_POSTINGS_SIZE)
 
-    # Do case folding
-    print("\nCase-folding the index")
-    index = case_folding(index)
-
     # Calculate size data after case-folding
-    CASE_FOLDING_DICT_SIZE = calc_dict_size(index)
-    CASE_FOLDING_POSTINGS_SIZE = calc_postings_size(index)
+    CASE_FOLDING_DICT_SIZE, CASE_FOLDING_POSTINGS_SIZE = SIZES['case_folding']
     PCT_CHANGE_DICT_SIZE_CASE_FOLDING = calc_percent_change(CASE_FOLDING_DICT_SIZE, NO_NUMS_DICT_SIZE)
     CML_CHANGE_DICT_SIZE_CASE_FOLDING = calc_percent_change(CASE_FOLDING_DICT_SIZE, INITIAL_DICT_SIZE)
     PCT_CHANGE_POSTINGS_SIZE_CASE_FOLDING = calc_percent_change(CASE_FOLDING_POSTINGS_SIZE, NO_NUMS_POSTINGS_SIZE)
     CML_CHANGE_POSTINGS_SIZE_CASE_FOLDING = calc_percent_change(CASE_FOLDING_POSTINGS_SIZE, INITIAL_POSTINGS_SIZE)
 
-    # Find most common stopwords, after case-folding and number removal
-    print("\nCreating stopwords list based on the 150 most common terms in the index")
-    create_stopwords(index)
-
-    # Remove 30 stopwords
-    print("\nRemoving the most common 30 stopwords from the index")
-    index30 = stopwords30(index)
-
     # Calculate size data after removing 30 stopwords
-    STOPW30_DICT_SIZE = calc_dict_size(index30)
-    STOPW30_POSTINGS_SIZE = calc_postings_size(index30)
+    STOPW30_DICT_SIZE, STOPW30_POSTINGS_SIZE = SIZES['30_stopwords']
     PCT_CHANGE_DICT_SIZE_30_STOPW = calc_percent_change(STOPW30_DICT_SIZE, CASE_FOLDING_DICT_SIZE)
     CML_CHANGE_DICT_SIZE_30_STOPW = calc_percent_change(STOPW30_DICT_SIZE, INITIAL_DICT_SIZE)
     PCT_CHANGE_POSTINGS_SIZE_30_STOPW = calc_percent_change(STOPW30_POSTINGS_SIZE, CASE_FOLDING_POSTINGS_SIZE)
     CML_CHANGE_POSTINGS_SIZE_30_STOPW = calc_percent_change(STOPW30_POSTINGS_SIZE, INITIAL_POSTINGS_SIZE)
 
-    # Remove 150 stopwords
-    print("\nRemoving the most common 150 stopwords from the index")
-    index150 = stopwords150(index)
-
     # Calculate size data after removing 150 stopwords
-    STOPW150_DICT_SIZE = calc_dict_size(index150)
-    STOPW150_POSTINGS_SIZE = calc_postings_size(index150)
+    STOPW150_DICT_SIZE, STOPW150_POSTINGS_SIZE = SIZES['150_stopwords']
     PCT_CHANGE_DICT_SIZE_150_STOPW = calc_percent_change(STOPW150_DICT_SIZE, CASE_FOLDING_DICT_SIZE)
     CML_CHANGE_DICT_SIZE_150_STOPW = calc_percent_change(STOPW150_DICT_SIZE, INITIAL_DICT_SIZE)
     PCT_CHANGE_POSTINGS_SIZE_150_STOPW = calc_percent_change(STOPW150_POSTINGS_SIZE, CASE_FOLDING_POSTINGS_SIZE)
     CML_CHANGE_POSTINGS_SIZE_150_STOPW = calc_percent_change(STOPW150_POSTINGS_SIZE, INITIAL_POSTINGS_SIZE)
 
-    # Stem
-    print("\nStemming the index")
-    index = stem(index150)
-
     # Calculate size data after stemming
-    STEM_DICT_SIZE = calc_dict_size(index)
-    STEM_POSTINGS_SIZE = calc_postings_size(index)
+    STEM_DICT_SIZE, STEM_POSTINGS_SIZE = SIZES['stem']
     PCT_CHANGE_DICT_SIZE_STEM = calc_percent_change(STEM_DICT_SIZE, STOPW150_DICT_SIZE)
     CML_CHANGE_DICT_SIZE_STEM = calc_percent_change(STEM_DICT_SIZE, INITIAL_DICT_SIZE)
     PCT_CHANGE_POSTINGS_SIZE_STEM = calc_percent_change(STEM_POSTINGS_SIZE, STOPW150_POSTINGS_SIZE)
     CML_CHANGE_POSTINGS_SIZE_STEM = calc_percent_change(STEM_POSTINGS_SIZE, INITIAL_POSTINGS_SIZE)
 
+    # Compress the postings lists and the dictionary of the stemmed index, losslessly
+    print("\nCompressing the postings lists of the stemmed index")
+    POSTINGS_STORAGE_SIZES = compress_postings(index)
+    STEM_DICTIONARY_SIZES = compress_dictionary(index, "Stemmed", "output/5. stemmed_index.fc")
+    STORAGE_SIZES = [POSTINGS_STORAGE_SIZES, CASE_FOLDING_DICTIONARY_SIZES, STEM_DICTIONARY_SIZES]
+
+    # Wait for the indexes still being saved in the background
+    WRITER.flush()
+
     # Render the table to the console, featuring all the computed data
     render_table(CASE_FOLDING_DICT_SIZE, CASE_FOLDING_POSTINGS_SIZE, CML_CHANGE_DICT_SIZE_150_STOPW,
                  CML_CHANGE_DICT_SIZE_30_STOPW, CML_CHANGE_DICT_SIZE_CASE_FOLDING, CML_CHANGE_DICT_SIZE_STEM,
@@ -93,9 +124,415 @@ def subproject_3():
                  PCT_CHANGE_DICT_SIZE_STEM, PCT_CHANGE_POSTINGS_SIZE_150_STOPW, PCT_CHANGE_POSTINGS_SIZE_30_STOPW,
                  PCT_CHANGE_POSTINGS_SIZE_CASE_FOLDING, PCT_CHANGE_POSTINGS_SIZE_NO_NUMS, PCT_CHANGE_POSTINGS_SIZE_STEM,
                  STEM_DICT_SIZE, STEM_POSTINGS_SIZE, STOPW150_DICT_SIZE, STOPW150_POSTINGS_SIZE, STOPW30_DICT_SIZE,
-                 STOPW30_POSTINGS_SIZE)
+                 STOPW30_POSTINGS_SIZE, STORAGE_SIZES)
+
+
+@METRICS.timed()
+def staged_pipeline(index: dict, workers: int = 1) -> Tuple[Dict[str, Tuple[int, int]], dict, dict]:
+    """
+    Run the lossy compression stages one at a time, each creating a full new index and saving it to file.
+
+    :param index: The naive index
+    :param workers: The number of worker processes to stem the dictionary with
+    :return: The (dictionary size, postings size) after each stage by name, the case-folded index, and the
+             stemmed index
+    """
+
+    SIZES = {'initial': (calc_dict_size(index), calc_postings_size(index))}
+
+    # Remove numbers
+    print("\nRemoving numbers from the index")
+    index = remove_numbers(index)
+    SIZES['no_numbers'] = (calc_dict_size(index), calc_postings_size(index))
+
+    # Do case folding
+    print("\nCase-folding the index")
+    index = case_folding(index)
+    SIZES['case_folding'] = (calc_dict_size(index), calc_postings_size(index))
+
+    # Find most common stopwords, after case-folding and number removal
+    print("\nCreating stopwords list based on the 150 most common terms in the index")
+    STOPWORDS = create_stopwords(index)
+
+    # Remove 30 stopwords
+    print("\nRemoving the most common 30 stopwords from the index")
+    index30 = stopwords30(index, STOPWORDS[:30])
+    SIZES['30_stopwords'] = (calc_dict_size(index30), calc_postings_size(index30))
+
+    # Remove 150 stopwords
+    print("\nRemoving the most common 150 stopwords from the index")
+    index150 = stopwords150(index, STOPWORDS)
+    SIZES['150_stopwords'] = (calc_dict_size(index150), calc_postings_size(index150))
+
+    # Stem
+    print("\nStemming the index")
+    stemmed = stem(index150, workers)
+    SIZES['stem'] = (calc_dict_size(stemmed), calc_postings_size(stemmed))
+
+    return SIZES, index, stemmed
+
+
+@METRICS.timed()
+def array_pipeline(index: dict, workers: int = 1) -> Tuple[Dict[str, Tuple[int, int]], dict, dict]:
+    """
+    Run the lossy compression stages one at a time, like `staged_pipeline()`, on an array-backed postings store.
+
+    All postings of each stage are held in one contiguous array of 32-bit docIDs. Filtering stages gather the kept
+    postings in a single vectorized step, normalizing stages merge postings with NumPy, and sizes and stopwords are
+    computed from the array of postings lengths. Gives the same files and sizes as `staged_pipeline()`.
+
+    :param index: The naive index
+    :param workers: The number of worker processes to stem the dictionary with
+    :return: The (dictionary size, postings size) after each stage by name, the case-folded index, and the
+             stemmed index, as dictionaries of Python lists
+    """
+
+    store = PostingsStore.from_index(index)
+    report_array_memory(index, store)
+    del index
+
+    def stage(stage_store: PostingsStore, name: str, file: str) -> PostingsStore:
+        # Record the sizes after this stage, and save it in the background
+        SIZES[name] = (calc_dict_size(stage_store), calc_postings_size(stage_store))
+        print(f"Saving to file: {file}")
+        WRITER.save(stage_store, file)
+        return stage_store
+
+    SIZES = {'initial': (calc_dict_size(store), calc_postings_size(store))}
+
+    print("\nRemoving numbers from the index")
+    store = stage(store.select(lambda key: not key.isnumeric()), 'no_numbers', "output/2. no_numbers_index.txt")
+
+    print("\nCase-folding the index")
+    case_folded = stage(store.normalize(str.lower), 'case_folding', "output/3. case_folded_index.txt")
+
+    print("\nCreating stopwords list based on the 150 most common terms in the index")
+    STOPWORDS = create_stopwords(case_folded)
+    STOPWORDS_30, STOPWORDS_150 = set(STOPWORDS[:30]), set(STOPWORDS)
+
+    print("\nRemoving the most common 30 stopwords from the index")
+    stage(case_folded.select(lambda key: key not in STOPWORDS_30), '30_stopwords',
+          "output/4a. 30_stopwords_index.txt")
+
+    print("\nRemoving the most common 150 stopwords from the index")
+    store = stage(case_folded.select(lambda key: key not in STOPWORDS_150), '150_stopwords',
+                  "output/4b. 150_stopwords_index.txt")
+
+    print("\nStemming the index")
+    stems = STEMMER.stem_many(store.keys(), workers)
+    stemmed = stage(store.normalize(stems.__getitem__), 'stem', "output/5. stemmed_index.txt")
+    STEMMER.save()
+
+    # Lossless compression works on lists of Python ints
+    return SIZES, case_folded.to_dict(), stemmed.to_dict()
+
+
+def report_array_memory(index: dict, store: PostingsStore) -> None:
+    """
+    Show a table of how much memory the naive index takes as Python lists, and as an array-backed postings store.
+
+    :param index: The naive index, as Python lists
+    :param store: The naive index, as an array-backed postings store
+    """
+
+    render_storage_table([
+        [("Naive index in memory, Python lists", calc_memory_size(index)),
+         ("Naive index in memory, 32-bit array store", store.memory_size())],
+    ], title="Memory of Postings Storage")
+
+
+@METRICS.timed()
+def fused_pipeline(index: dict, workers: int = 1,
+                   write_intermediate: bool = False) -> Tuple[Dict[str, Tuple[int, int]], dict, dict]:
+    """
+    Run the lossy compression stages fused into a single streaming pass over the (term, postings) entries of the index.
+
+    Each stage is a transform of a stream of entries. Filtering stages never create a new index, and the sizes after
+    every stage are counted as the entries stream through. Only case-folding and stemming need to see all entries
+    before giving any out, to group keys, and picking stopwords needs the whole case-folded index. Postings lists are
+    shared between stages rather than copied. Gives the same indexes and sizes as `staged_pipeline()`.
+
+    :param index: The naive index
+    :param workers: The number of worker processes to stem the dictionary with
+    :param write_intermediate: Whether to also save the index after every stage, not only the stemmed one. If not,
+                               the intermediate indexes of earlier runs are removed
+    :return: The (dictionary size, postings size) after each stage by name, the case-folded index, and the
+             stemmed index
+    """
+
+    SIZES: Dict[str, Tuple[int, int]] = {}
+
+    # The intermediate indexes of an earlier run would no longer match the stemmed index, so don't leave them behind
+    if not write_intermediate:
+        for file in STAGE_FILES[:-1]:
+            Path(file).unlink(missing_ok=True)
+
+    def stage(entries: Iterable[Entry], name: str, file: str) -> Iterator[Entry]:
+        # Count the sizes after this stage, and save its entries to file if asked to
+        entries = measure(entries, SIZES, name)
+        return write_entries(entries, file) if write_intermediate else entries
+
+    print("\nRemoving numbers from, and case-folding, the index")
+    entries = measure(index.items(), SIZES, 'initial')
+    entries = stage(filter_keys(entries, lambda key: not key.isnumeric()), 'no_numbers',
+                    "output/2. no_numbers_index.txt")
+    entries = stage(normalize_entries(entries, str.lower), 'case_folding', "output/3. case_folded_index.txt")
+    case_folded_index = dict(entries)
+
+    print("\nCreating stopwords list based on the 150 most common terms in the index")
+    STOPWORDS = create_stopwords(case_folded_index)
+
+    # The 150 stopwords include the 30, so removing the 150 after the 30 is the same as removing them on their own
+    print("\nRemoving stopwords from, and stemming, the index")
+    STOPWORDS_30, STOPWORDS_150 = set(STOPWORDS[:30]), set(STOPWORDS)
+    entries = stage(filter_keys(case_folded_index.items(), lambda key: key not in STOPWORDS_30), '30_stopwords',
+                    "output/4a. 30_stopwords_index.txt")
+    entries = stage(filter_keys(entries, lambda key: key not in STOPWORDS_150), '150_stopwords',
+                    "output/4b. 150_stopwords_index.txt")
+
+    # Stemming needs all keys at once, to stem them in a batch
+    kept = list(entries)
+    stems = STEMMER.stem_many((key for key, _ in kept), workers)
+    entries = measure(normalize_entries(kept, stems.__getitem__), SIZES, 'stem')
+    stemmed = dict(write_entries(entries, "output/5. stemmed_index.txt"))
+    STEMMER.save()
+
+    return SIZES, case_folded_index, stemmed
+
+
+@METRICS.timed()
+def incremental_pipeline(index: dict, affected: Set[str],
+                         workers: int = 1) -> Tuple[Dict[str, Tuple[int, int]], dict, dict]:
+    """
+    Update the indexes saved by the last run of the lossy compression stages, after an incremental update of the naive
+    index. Only the entries that the changed terms end up in are recomputed, every other entry is kept as it is.
+
+    The stopwords are picked again from the updated case-folded index. Any term that stopped or started being a
+    stopword is treated as changed too. Gives the same indexes and sizes as `staged_pipeline()` on the updated index.
+
+    :param index: The updated naive index
+    :param affected: The terms of the naive index whose postings lists changed
+    :param workers: The number of worker processes to stem the dictionary with
+    :return: The (dictionary size, postings size) after each stage by name, the case-folded index, and the
+             stemmed index
+    """
+
+    def sizes(stage_index: dict) -> Tuple[int, int]:
+        return calc_dict_size(stage_index), calc_postings_size(stage_index)
 
+    # The indexes saved by the last run
+    previous = []
+    for file in STAGE_FILES:
+        with open(file, 'rt') as f:
+            previous.append(json.load(f))
+    no_numbers_file, case_folded_file, stopwords30_file, stopwords150_file, stemmed_file = STAGE_FILES
 
+    print(f"\nUpdating {len(affected):,} changed terms in the indexes of the last run")
+    SIZES = {'initial': sizes(index)}
+
+    no_numbers = update_filtered(previous[0], index, affected, lambda key: not key.isnumeric())
+    WRITER.save(no_numbers, no_numbers_file)
+    SIZES['no_numbers'] = sizes(no_numbers)
+
+    case_folded, affected = update_normalized(previous[1], no_numbers, affected, str.lower)
+    WRITER.save(case_folded, case_folded_file)
+    SIZES['case_folding'] = sizes(case_folded)
+
+    # Terms that stopped or started being stopwords change too
+    OLD_STOPWORDS = read_stopwords()
+    STOPWORDS = create_stopwords(case_folded)
+    affected30 = affected | (set(OLD_STOPWORDS[:30]) ^ set(STOPWORDS[:30]))
+    affected150 = affected | (set(OLD_STOPWORDS) ^ set(STOPWORDS))
+
+    STOPWORDS_30, STOPWORDS_150 = set(STOPWORDS[:30]), set(STOPWORDS)
+    index30 = update_filtered(previous[2], case_folded, affected30, lambda key: key not in STOPWORDS_30)
+    WRITER.save(index30, stopwords30_file)
+    SIZES['30_stopwords'] = sizes(index30)
+
+    index150 = update_filtered(previous[3], case_folded, affected150, lambda key: key not in STOPWORDS_150)
+    WRITER.save(index150, stopwords150_file)
+    SIZES['150_stopwords'] = sizes(index150)
+
+    # Removed keys are stemmed too, to find the stemmed keys they were merged into
+    stems = STEMMER.stem_many(index150.keys() | affected150, workers)
+    stemmed, _ = update_normalized(previous[4], index150, affected150, stems.__getitem__)
+    WRITER.save(stemmed, stemmed_file)
+    SIZES['stem'] = sizes(stemmed)
+    STEMMER.save()
+
+    return SIZES, case_folded, stemmed
+
+
+def update_filtered(previous: dict, index: dict, affected: Set[str], keep: Callable[[str], bool]) -> dict:
+    """
+    Update the result of a filtering stage, only checking the changed keys.
+
+    :param previous: The result of the stage on the index before it changed
+    :param index: The changed index the stage filters
+    :param affected: The keys of the index whose postings lists changed, or were added or removed
+    :param keep: Whether the stage keeps the entry of a key
+    :return: The updated result of the stage, sorted by key, alphabetically
+    """
+
+    updated = dict(previous)
+    for key in affected:
+        if key in index and keep(key):
+            updated[key] = index[key]
+        else:
+            updated.pop(key, None)
+
+    return {key: updated[key] for key in sorted(updated)}
+
+
+def update_normalized(previous: dict, index: dict, affected: Set[str],
+                      normalize: Callable[[str], str]) -> Tuple[dict, Set[str]]:
+    """
+    Update the result of a normalizing stage, only merging the postings lists of the normalized keys that the changed
+    keys normalize to.
+
+    :param previous: The result of the stage on the index before it changed
+    :param index: The changed index the stage normalizes
+    :param affected: The keys of the index whose postings lists changed, or were added or removed
+    :param normalize: The function giving the normalized form of a key
+    :return: The updated result of the stage, sorted by key, alphabetically, and its keys that changed
+    """
+
+    targets = {normalize(key) for key in affected}
+
+    # Find every key normalizing to a changed key, including the unchanged ones
+    groups = defaultdict(list)
+    for key, postings in index.items():
+        target = normalize(key)
+        if target in targets:
+            groups[target].append(postings)
+
+    updated = dict(previous)
+    for target in targets:
+        if target in groups:
+            updated[target] = merge_many(groups[target])
+        else:
+            updated.pop(target, None)
+
+    return {key: updated[key] for key in sorted(updated)}, targets
+
+
+def filter_keys(entries: Iterable[Entry], keep: Callable[[str], bool]) -> Iterator[Entry]:
+    """
+    Pipeline stage: keep only the entries whose keys pass the test, discarding their postings lists otherwise.
+
+    :param entries: The (term, postings) entries to filter
+    :param keep: Whether to keep the entry of a key
+    :return: A generator of the kept entries
+    """
+
+    return ((key, postings) for key, postings in entries if keep(key))
+
+
+def normalize_entries(entries: Iterable[Entry], normalize: Callable[[str], str]) -> Iterator[Entry]:
+    """
+    Pipeline stage: normalize the keys of the entries, merging the postings lists of keys that normalize to the same
+    new key.
+
+    First groups the original keys by their normalized form, then merges the postings lists of each group once, rather
+    than re-sorting the merged list every time another key of the group is found. Keys that are alone in their group
+    keep their postings list as it is.
+
+    :param entries: The (term, postings) entries to normalize
+    :param normalize: The function giving the normalized form of a key
+    :return: A generator of the normalized entries, sorted by key, alphabetically
+    """
+
+    # Group the postings lists of the original keys by their normalized form
+    groups = defaultdict(list)
+    for key, postings in entries:
+        groups[normalize(key)].append(postings)
+
+    # Merge each group once, in key order
+    return ((key, merge_many(groups[key])) for key in sorted(groups))
+
+
+def measure(entries: Iterable[Entry], sizes: Dict[str, Tuple[int, int]], name: str) -> Iterator[Entry]:
+    """
+    Pipeline stage: count the dictionary size and the postings size of the entries as they stream through, unchanged.
+
+    The sizes are only recorded once all entries have been through.
+
+    :param entries: The (term, postings) entries to measure
+    :param sizes: Where to record the sizes
+    :param name: The name to record the sizes under
+    :return: A generator of the same entries
+    """
+
+    dict_size = postings_size = 0
+    for key, postings in entries:
+        dict_size += 1
+        postings_size += len(postings)
+        yield key, postings
+
+    sizes[name] = (dict_size, postings_size)
+
+
+def write_entries(entries: Iterable[Entry], file: str) -> Iterator[Entry]:
+    """
+    Pipeline stage: save the entries to file as they stream through, unchanged.
+
+    Gives the same file as `json.dump()` of a dictionary of the same entries.
+
+    :param entries: The (term, postings) entries to save
+    :param file: The file to save them to
+    :return: A generator of the same entries
+    """
+
+    print(f"Saving to file: {file}")
+
+    with atomic_file(file) as f:
+        f.write('{')
+        for number, (key, postings) in enumerate(entries):
+            if number:
+                f.write(', ')
+            f.write(f'{json.dumps(key)}: {json.dumps(postings)}')
+            yield key, postings
+        f.write('}')
+
+
+@METRICS.timed()
+def stem_frequencies(stopwords: List[str], workers: int = 1) -> None:
+    """
+    Create the term frequencies and document lengths of the stemmed index, from those of the naive index.
+
+    Every naive term goes through the same stages as in the stemmed index: numbers and stopwords are dropped, and the
+    frequencies of the terms that case-fold and stem to the same key are summed per document. Document lengths are the
+    number of tokens left in them, so they are summed up from the frequencies. Saved next to the stemmed index, in the
+    order of its postings lists.
+
+    :param stopwords: The 150 stopwords removed from the stemmed index
+    :param workers: The number of worker processes to stem keys that haven't been stemmed before with
+    """
+
+    with open('output/1. naive_index.txt', 'rt') as f:
+        index = json.load(f)
+    naive_frequencies, naive_lengths = read_frequencies(frequencies_path(Path('output/1. naive_index.txt')))
+
+    STOPWORDS = set(stopwords)
+    kept = [key for key in index if not key.isnumeric() and key.lower() not in STOPWORDS]
+    stems = STEMMER.stem_many({key.lower() for key in kept}, workers)
+
+    # Sum the frequencies of every naive term that ends up as the same stemmed term, per document
+    counts = defaultdict(dict)
+    lengths = dict.fromkeys(naive_lengths, 0)
+    for key in kept:
+        stemmed = counts[stems[key.lower()]]
+        for doc_id, frequency in zip(index[key], naive_frequencies[key]):
+            stemmed[doc_id] = stemmed.get(doc_id, 0) + frequency
+            lengths[doc_id] += frequency
+
+    frequencies = {key: [counts[key][doc_id] for doc_id in sorted(counts[key])] for key in sorted(counts)}
+
+    print("Saving to file: output/5. stemmed_index.tf")
+    WRITER.save({'frequencies': frequencies, 'lengths': lengths}, "output/5. stemmed_index.tf")
+
+
+@METRICS.timed()
 def remove_numbers(index: dict) -> dict:
     """
     Remove all numeric keys in the given index.
@@ -112,12 +549,12 @@ def remove_numbers(index: dict) -> dict:
 
     print("Saving to file: output/2. no_numbers_index.txt")
 
-    with open("output/2. no_numbers_index.txt", "wt") as f:
-        json.dump(new_index, f)
+    WRITER.save(new_index, "output/2. no_numbers_index.txt")
 
     return new_index
 
 
+@METRICS.timed()
 def case_folding(index: dict) -> dict:
     """
     Handle case-folding the keys of the given index.
@@ -135,37 +572,32 @@ def case_folding(index: dict) -> dict:
              and sorted postings for each key.
     """
 
-    # Get all the keys of the given index
-    index_keys = list(index.keys())
+    # Merge the postings lists of all keys that lower-case to the same new key
+    new_index = merge_normalized(index, str.lower)
 
-    # Create a new index to return
-    new_index = defaultdict(list)
+    print("Saving to file: output/3. case_folded_index.txt")
 
-    # Go through each of the given indexes keys
-    for key in index_keys:
-        lowered = key.lower()
+    WRITER.save(new_index, "output/3. case_folded_index.txt")
 
-        # Either populate or create a key based on the lower-cased version of this key.
-        # The key should be associated with the postings list of that key in the original index.
-        # If a postings list already exists, just append to it.
-        # If it doesn't exist, the defaultdicts list for that key will be [], so can still append to it
-        new_index[lowered] += index[key]
+    return new_index
 
-        # Sort the postings list for this key, and remove duplicates
-        new_index[lowered] = sorted(set(new_index[lowered]))
 
-    # Sort index by keys
-    new_index = dict(sorted(new_index.items()))
+def merge_normalized(index: dict, normalize: Callable[[str], str]) -> dict:
+    """
+    Normalize the keys of the given index, merging the postings lists of keys that normalize to the same new key.
 
-    print("Saving to file: output/3. case_folded_index.txt")
+    See `normalize_entries()`. The result is sorted by key, alphabetically.
 
-    with open("output/3. case_folded_index.txt", "wt") as f:
-        json.dump(new_index, f)
+    :param index: The index to normalize the keys of
+    :param normalize: The function giving the normalized form of a key
+    :return: A new index, based on the given index, with normalized keys
+    """
 
-    return new_index
+    return dict(normalize_entries(index.items(), normalize))
 
 
-def stopwords30(index: dict) -> dict:
+@METRICS.timed()
+def stopwords30(index: dict, stopwords: List[str] = None) -> dict:
     """
     Create a new index, based on the given index, with 30 stopword keys removed.
 
@@ -174,25 +606,25 @@ def stopwords30(index: dict) -> dict:
     Creates a new index based on the given index to avoid errors.
 
     :param index: The index to remove 30 stopword keys for
+    :param stopwords: The 30 stopwords. Read from stopwords.txt if not given
     :return: A new index, based on the given index, with all keys corresponding to 30 stopwords removed.
     """
 
     # Get the first 30 stopwords from stopwords.txt. The file has the 150 most common words in the corpus
-    with open('stopwords.txt', 'rt') as f:
-        STOPWORDS = [word.strip() for word in f.readlines()][:30]
+    STOPWORDS = set(read_stopwords()[:30] if stopwords is None else stopwords)
 
     # Create new index based on whether the keys of the old index are stopwords
     new_index = {key: val for key, val in index.items() if key not in STOPWORDS}
 
     print("Saving to file: output/4a. 30_stopwords_index.txt")
 
-    with open("output/4a. 30_stopwords_index.txt", "wt") as f:
-        json.dump(new_index, f)
+    WRITER.save(new_index, "output/4a. 30_stopwords_index.txt")
 
     return new_index
 
 
-def stopwords150(index: dict) -> dict:
+@METRICS.timed()
+def stopwords150(index: dict, stopwords: List[str] = None) -> dict:
     """
     Create a new index, based on the given index, with 150 stopword keys removed.
 
@@ -201,25 +633,25 @@ def stopwords150(index: dict) -> dict:
     Creates a new index based on the given index to avoid errors.
 
     :param index: The index to remove 150 stopword keys for
+    :param stopwords: The 150 stopwords. Read from stopwords.txt if not given
     :return: A new index, based on the given index, with all keys corresponding to 150 stopwords removed.
     """
 
     # Get all stopwords from stopwords.txt. The file has the 150 most common words in the corpus
-    with open('stopwords.txt', 'rt') as f:
-        STOPWORDS = [word.strip() for word in f.readlines()]
+    STOPWORDS = set(read_stopwords() if stopwords is None else stopwords)
 
     # Create new index based on whether the keys of the old index are stopwords
     new_index = {key: val for key, val in index.items() if key not in STOPWORDS}
 
     print("Saving to file: output/4b. 150_stopwords_index.txt")
 
-    with open("output/4b. 150_stopwords_index.txt", "wt") as f:
-        json.dump(new_index, f)
+    WRITER.save(new_index, "output/4b. 150_stopwords_index.txt")
 
     return new_index
 
 
-def stem(index: dict) -> dict:
+@METRICS.timed()
+def stem(index: dict, workers: int = 1) -> dict:
     """
     Handle stemming the keys of the given index.
 
@@ -231,45 +663,81 @@ def stem(index: dict) -> dict:
     Creates a new index based on the given index to avoid errors.
 
     :param index: The index to stem keys for
+    :param workers: The number of worker processes to stem keys that haven't been stemmed before with
     :return: A new index, based on the given index, that has stemmed versions of the given indexes keys.
              Should be smaller than the given index. Should not lose any postings. Should have unique
              and sorted postings for each key.
     """
 
-    # Get all the keys of the given index
-    index_keys = list(index.keys())
+    # Stem all keys at once, looking up the ones stemmed before in the shared memo table
+    stems = STEMMER.stem_many(index.keys(), workers)
 
-    # Create a new index to return
-    new_index = defaultdict(list)
+    # Merge the postings lists of all keys that stem to the same new key
+    new_index = merge_normalized(index, stems.__getitem__)
 
-    # Create them Porter stemmer
-    stemmer = PorterStemmer()
+    print("Saving to file: output/5. stemmed_index.txt")
 
-    # Go through each of the given indexes keys
-    for key in index_keys:
-        stemmed = stemmer.stem(key)
+    WRITER.save(new_index, "output/5. stemmed_index.txt")
 
-        # Either populate or create a key based on the stemmed version of this key.
-        # The key should be associated with the postings list of that key in the original index.
-        # If a postings list already exists, just append to it.
-        # If it doesn't exist, the defaultdicts list for that key will be [], so can still append to it
-        new_index[stemmed] += index[key]
+    # Remember the stems for the next run, and for query time
+    STEMMER.save()
 
-        # Sort the postings list for this key, and remove duplicates
-        new_index[stemmed] = sorted(set(new_index[stemmed]))
+    return new_index
 
-    # Sort index by keys
-    new_index = dict(sorted(new_index.items()))
 
-    print("Saving to file: output/5. stemmed_index.txt")
+@METRICS.timed()
+def compress_postings(index: dict) -> List[Tuple[str, int]]:
+    """
+    Losslessly compress the postings lists of the given index.
 
-    with open("output/5. stemmed_index.txt", "wt") as f:
-        json.dump(new_index, f)
+    Gap-encodes each postings list, and compresses the gaps with variable-byte and Elias-gamma codes, saving each to
+    its own file.
 
-    return new_index
+    :param index: The index to compress the postings lists of
+    :return: (description, size in bytes) tuples of the postings lists as JSON, as 32-bit integers, and compressed
+             with each code
+    """
+
+    JSON_SIZE = sum(len(json.dumps(postings)) for postings in index.values())
+    FIXED_WIDTH_SIZE = 4 * calc_postings_size(index)
+
+    print("Saving to file: output/6a. stemmed_index.vb")
+    VB_SIZE = write_compressed_index(index, Path("output/6a. stemmed_index.vb"), 'vb')
+
+    print("Saving to file: output/6b. stemmed_index.gamma")
+    GAMMA_SIZE = write_compressed_index(index, Path("output/6b. stemmed_index.gamma"), 'gamma')
+
+    return [("Postings as JSON", JSON_SIZE), ("32-bit integers", FIXED_WIDTH_SIZE),
+            ("Gaps, variable byte", VB_SIZE), ("Gaps, Elias-gamma", GAMMA_SIZE)]
 
 
-def create_stopwords(index: dict) -> None:
+@METRICS.timed()
+def compress_dictionary(index: dict, name: str, file: str) -> List[Tuple[str, int]]:
+    """
+    Losslessly compress the dictionary of the given index.
+
+    Saves the index to file with a blocked front-coded dictionary, and compressed postings lists. It can be read back
+    with `dictionary_compression.FrontCodedIndex`.
+
+    :param index: The index to compress the dictionary of
+    :param name: The name of the index, to describe the sizes with
+    :param file: The file to save the front-coded index to
+    :return: (description, size in bytes) tuples of the dictionary as Python strings, as a single string, and
+             front-coded in blocks
+    """
+
+    STRINGS_SIZE = sum(sys.getsizeof(term) for term in index)
+    DICTIONARY_STRING_SIZE = DictionaryString(index.keys()).size_bytes()
+
+    print(f"Saving to file: {file}")
+    FRONT_CODED_SIZE = write_front_coded_index(index, Path(file))
+
+    return [(f"{name} terms as Python strings", STRINGS_SIZE), (f"{name} dictionary as a string", DICTIONARY_STRING_SIZE),
+            (f"{name} blocked front coding (k={BLOCK_SIZE})", FRONT_CODED_SIZE)]
+
+
+@METRICS.timed()
+def create_stopwords(index: Union[dict, PostingsStore]) -> List[str]:
     """
     Create a list of the 150 most common terms in the index.
 
@@ -280,15 +748,29 @@ def create_stopwords(index: dict) -> None:
     Finds the most common terms by seeing which terms have the longest postings list.
 
     :param index: The index to find the most common terms of
+    :return: The 150 most common terms, most common first
     """
 
-    # Sort by most common dictionary terms. Inspired by https://stackoverflow.com/a/50863131
-    sorted_index = dict(sorted(index.items(), key=lambda x: len(x[1]), reverse=True))
-
-    # Get only the 150 most common tokens
-    most_common_tokens_150 = list(sorted_index.keys())[:150]
+    # Get only the 150 most common tokens, without sorting the whole index. Ties keep their order in the index
+    if isinstance(index, PostingsStore):
+        most_common_tokens_150 = index.most_common(150)
+    else:
+        most_common_tokens_150 = [key for key, _ in heapq.nlargest(150, index.items(), key=lambda x: len(x[1]))]
 
     # Save them to a file
     print("Saving to file: stopwords.txt")
-    with open('stopwords.txt', 'wt') as f:
+    with atomic_file('stopwords.txt') as f:
         f.write('\n'.join(token for token in most_common_tokens_150))
+
+    return most_common_tokens_150
+
+
+def read_stopwords() -> List[str]:
+    """
+    Read the stopwords saved by `create_stopwords()`.
+
+    :return: The 150 most common terms, most common first
+    """
+
+    with open('stopwords.txt', 'rt') as f:
+        return [word.strip() for word in f.readlines()]
@@ -0,0 +1,41 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# The modules live at the top of the repository, next to main.py
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmark import generate_corpus  # noqa: E402
+
+
+@pytest.fixture
+def workspace(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """
+    Run the test from an empty working directory, next to which the corpus is looked for, like main.py is run from the
+    repository, so outputs never touch the real ones.
+
+    :return: The working directory
+    """
+
+    directory = tmp_path / 'work'
+    directory.mkdir()
+    (tmp_path / 'reuters21578').mkdir()
+    monkeypatch.chdir(directory)
+
+    return directory
+
+
+@pytest.fixture
+def corpus(workspace: Path) -> Path:
+    """
+    Write a small synthetic corpus where the working directory expects the Reuters corpus.
+
+    :return: The directory of the corpus
+    """
+
+    directory = workspace.parent / 'reuters21578'
+    generate_corpus(directory, scale=0.1, seed=0)
+
+    return directory
@@ -0,0 +1,52 @@
+import json
+import random
+
+import pytest
+
+from aho_corasick import AhoCorasick
+from subproject2 import QueryEngine, _search_query, batch_query
+
+
+def random_word(rng: random.Random, longest: int) -> str:
+    # A small alphabet, so patterns overlap and share prefixes and suffixes often
+    return ''.join(rng.choice('abc') for _ in range(rng.randrange(0, longest + 1)))
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_find_matches_substring_search(seed):
+    rng = random.Random(seed)
+    patterns = [random_word(rng, 5) for _ in range(rng.randrange(1, 30))]
+    automaton = AhoCorasick(patterns)
+
+    for _ in range(50):
+        text = random_word(rng, 20)
+        assert automaton.find(text) == {number for number, pattern in enumerate(patterns) if pattern in text}
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_batch_query_matches_search_query(seed, tmp_path, monkeypatch):
+    rng = random.Random(seed)
+    index = {}
+    for _ in range(200):
+        index[random_word(rng, 8) or 'a'] = sorted(rng.sample(range(1, 100), rng.randrange(1, 10)))
+    file = tmp_path / 'index.txt'
+    file.write_text(json.dumps(index))
+
+    # Some queries twice, and the empty one, which is found in every term
+    queries = [random_word(rng, 4) for _ in range(40)]
+    queries += queries[:5] + ['', 'missing']
+
+    # Separate engines, so neither answers from results the other cached
+    monkeypatch.setattr('subproject2.ENGINE', QueryEngine())
+    expected = {query: _search_query(query, file, 1, show_results=False) for query in queries}
+
+    monkeypatch.setattr('subproject2.ENGINE', QueryEngine())
+    assert batch_query(queries, file) == expected
+
+    # Answered from the result cache the second time, still the same
+    assert batch_query(queries, file) == expected
+
+    # Too few queries for an automaton, each searched on its own
+    engine = QueryEngine()
+    assert engine.batch_search(queries, file, min_batch=len(queries) + 1) == expected
+    assert engine.batch_search(queries[:1], file, min_batch=0) == {queries[0]: expected[queries[0]]}
@@ -0,0 +1,33 @@
+import struct
+
+import pytest
+
+from binary_index import BinaryIndex, postings_path, write_binary_index
+
+
+def test_binary_index_matches_index(tmp_path):
+    index = {'bank': [1, 3, 5], 'rate': [2, 3], 'yen': [70_000, 4_000_000_000], 'zero': [0]}
+    file = write_binary_index(index, tmp_path / 'index.txt')
+
+    binary = BinaryIndex(file)
+    assert dict(binary) == index
+    assert 'missing' not in binary
+    assert len(binary) == len(index)
+
+    # Little-endian, whatever the machine
+    assert struct.pack('<3I', 1, 3, 5) in postings_path(file).read_bytes()
+
+
+def test_empty_binary_index(tmp_path):
+    file = write_binary_index({}, tmp_path / 'index.txt')
+    assert dict(BinaryIndex(file)) == {}
+
+
+def test_postings_of_another_write_are_refused(tmp_path):
+    first = write_binary_index({'bank': [1, 3, 5]}, tmp_path / 'first.txt')
+    second = write_binary_index({'bank': [2, 4, 6]}, tmp_path / 'second.txt')
+
+    # As a reader would see it between the two files being replaced
+    postings_path(first).write_bytes(postings_path(second).read_bytes())
+    with pytest.raises(ValueError):
+        BinaryIndex(first)
@@ -0,0 +1,38 @@
+import random
+
+import pytest
+
+from bm25 import BM25
+
+
+def random_scorer(seed: int) -> BM25:
+    rng = random.Random(seed)
+    documents = rng.randrange(20, 400)
+    lengths = {doc_id: rng.randrange(5, 300) for doc_id in range(1, documents + 1)}
+
+    # Terms from every document to a single one, some with the same frequencies everywhere, so scores tie
+    index, frequencies = {}, {}
+    for number in range(30):
+        postings = sorted(rng.sample(sorted(lengths), rng.randrange(1, documents + 1)))
+        index[f'term{number}'] = postings
+        frequencies[f'term{number}'] = [1 if number % 3 == 0 else rng.randrange(1, 20) for _ in postings]
+
+    return BM25(index, frequencies, lengths)
+
+
+@pytest.mark.parametrize('seed', range(30))
+def test_wand_matches_exhaustive(seed):
+    scorer = random_scorer(seed)
+    rng = random.Random(seed)
+
+    for _ in range(20):
+        terms = rng.sample(sorted(scorer.index), rng.randrange(1, 6))
+        for k in (1, 3, 10, 1000):
+            assert scorer.top_k(terms, k) == scorer.exhaustive(terms, k)
+
+
+def test_unknown_and_repeated_terms():
+    scorer = random_scorer(0)
+
+    assert scorer.top_k(['missing']) == scorer.exhaustive(['missing']) == []
+    assert scorer.top_k(['term1', 'term1', 'missing']) == scorer.exhaustive(['term1', 'term1', 'missing'])
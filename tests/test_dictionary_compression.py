@@ -0,0 +1,49 @@
+import random
+import string
+
+import pytest
+
+from dictionary_compression import DictionaryString, FrontCodedIndex, write_front_coded_index
+
+
+def make_index(seed: int) -> dict:
+    rng = random.Random(seed)
+    stems = [''.join(rng.choices(string.ascii_lowercase, k=rng.randrange(1, 6))) for _ in range(60)]
+
+    # Many terms sharing prefixes, as front coding expects, and a few awkward ones
+    terms = {stem + ''.join(rng.choices('abcé0', k=rng.randrange(0, 4))) for stem in stems for _ in range(5)}
+    terms |= {'a', 'zzzzzzzzzzzzzzzzzzzz', '017', 'bundesbank', 'bundesbanks', 'bundesbankss', 'naïve'}
+
+    return {term: sorted(rng.sample(range(1, 22_000), rng.randrange(1, 20))) for term in terms}
+
+
+@pytest.mark.parametrize('block_size', [1, 2, 8, 64])
+def test_front_coded_lookup(block_size, tmp_path):
+    index = make_index(block_size)
+    file = tmp_path / 'index.fc'
+    write_front_coded_index(index, file, block_size)
+
+    front_coded = FrontCodedIndex(file)
+    assert len(front_coded) == len(index)
+    assert list(front_coded) == sorted(index)
+
+    for term, postings in index.items():
+        assert term in front_coded
+        assert front_coded[term] == postings
+
+    # Terms before, between and after the terms of the index
+    for missing in ['', '0', 'bundesban', 'bundesbanka', 'zzzzzzzzzzzzzzzzzzzzz', '￿']:
+        if missing not in index:
+            assert missing not in front_coded
+            with pytest.raises(KeyError):
+                front_coded[missing]
+
+
+def test_dictionary_string_find():
+    terms = sorted(make_index(0))
+    dictionary = DictionaryString(reversed(terms))
+
+    for position, term in enumerate(terms):
+        assert dictionary.term(position) == term
+        assert dictionary.find(term) == position
+    assert dictionary.find('bundesban') == -1
@@ -0,0 +1,105 @@
+from pathlib import Path
+
+import pytest
+
+import incremental
+import subproject1
+import subproject3
+
+# Every index file the incremental and full builds must agree on
+OUTPUT_FILES = ["output/1. naive_index.txt", *subproject3.STAGE_FILES, "stopwords.txt"]
+# The term frequencies and positions saved alongside them
+STATISTICS_FILES = ["output/1. naive_index.tf", "output/5. stemmed_index.tf", "output/1. naive_index.positions"]
+
+
+def build(incremental_update: bool = False, fused: bool = False, frequencies: bool = False,
+          positions: bool = False) -> None:
+    affected = subproject1.subproject_1(incremental_update=incremental_update, frequencies=frequencies,
+                                        positions=positions)
+    subproject3.subproject_3(fused=fused, write_intermediate=not fused, affected=affected, frequencies=frequencies)
+
+
+def outputs(files: list = OUTPUT_FILES) -> dict:
+    return {file: Path(file).read_bytes() for file in files if Path(file).exists()}
+
+
+def change_corpus(corpus: Path) -> None:
+    # Change the articles of the first file, and remove the last file altogether
+    files = sorted(corpus.glob('*.sgm'))
+    first = files[0].read_text(encoding='latin-1')
+    files[0].write_text(first.replace(' the ', ' zebra ').replace('<BODY>', '<BODY>Quagga '), encoding='latin-1')
+    files[-1].unlink()
+
+
+def full_rebuild(statistics: bool = False) -> dict:
+    build(frequencies=statistics, positions=statistics)
+    return outputs(OUTPUT_FILES + STATISTICS_FILES if statistics else OUTPUT_FILES)
+
+
+@pytest.fixture
+def quiet(capsys):
+    yield
+    capsys.readouterr()
+
+
+def test_incremental_update_matches_full_rebuild(corpus, quiet):
+    build(incremental_update=True)
+    change_corpus(corpus)
+    build(incremental_update=True)
+    updated = outputs()
+
+    assert len(updated) == len(OUTPUT_FILES)
+    assert updated == full_rebuild()
+
+
+def test_incremental_update_after_fused_build(corpus, quiet):
+    build(incremental_update=True)
+    change_corpus(corpus)
+
+    # A fused build leaves no intermediate indexes behind, and the next update starts from scratch
+    build(fused=True)
+    assert not incremental.MANIFEST_FILE.exists()
+    assert not any(Path(file).exists() for file in subproject3.STAGE_FILES[:-1])
+
+    build(incremental_update=True)
+    updated = outputs()
+
+    assert len(updated) == len(OUTPUT_FILES)
+    assert updated == full_rebuild()
+
+
+def test_incremental_update_keeps_saved_statistics(corpus, quiet, capsys):
+    build(incremental_update=True, frequencies=True, positions=True)
+    change_corpus(corpus)
+    capsys.readouterr()
+
+    build(incremental_update=True, frequencies=True, positions=True)
+    updated = outputs(OUTPUT_FILES + STATISTICS_FILES)
+
+    # Only the changed file is read again
+    assert capsys.readouterr().out.count("Reading file") == 1
+    assert len(updated) == len(OUTPUT_FILES + STATISTICS_FILES)
+    assert updated == full_rebuild(statistics=True)
+
+
+def test_incremental_update_without_saved_positions(corpus, quiet):
+    build(incremental_update=True, frequencies=True)
+    change_corpus(corpus)
+
+    # Nothing to keep the positions of the unchanged files from, so they are read again
+    build(incremental_update=True, frequencies=True, positions=True)
+    updated = outputs(OUTPUT_FILES + STATISTICS_FILES)
+
+    assert len(updated) == len(OUTPUT_FILES + STATISTICS_FILES)
+    assert updated == full_rebuild(statistics=True)
+
+
+def test_statistics_match_across_ingestion_modes(corpus, quiet):
+    naive_files = ["output/1. naive_index.txt", "output/1. naive_index.tf", "output/1. naive_index.positions"]
+    subproject1.subproject_1(frequencies=True, positions=True)
+    expected = outputs(naive_files)
+    assert len(expected) == len(naive_files)
+
+    for options in [{'workers': 2}, {'block_size': 5000}, {'memory_budget': 50_000}]:
+        subproject1.subproject_1(frequencies=True, positions=True, **options)
+        assert outputs(naive_files) == expected
@@ -0,0 +1,53 @@
+import os
+import stat
+
+import pytest
+
+from index_writer import atomic_file
+
+
+def test_atomic_file_keeps_permissions(tmp_path):
+    file = tmp_path / 'index.txt'
+    file.write_text('old')
+    os.chmod(file, 0o640)
+
+    with atomic_file(file) as f:
+        f.write('new')
+
+    assert file.read_text() == 'new'
+    assert stat.S_IMODE(file.stat().st_mode) == 0o640
+
+
+def test_atomic_file_new_file_follows_umask(tmp_path):
+    with atomic_file(tmp_path / 'index.txt', 'wb') as f:
+        f.write(b'new')
+
+    umask = os.umask(0)
+    os.umask(umask)
+    assert stat.S_IMODE((tmp_path / 'index.txt').stat().st_mode) == 0o666 & ~umask
+
+
+def test_atomic_file_leaves_file_untouched_on_error(tmp_path):
+    file = tmp_path / 'index.txt'
+    file.write_text('old')
+
+    with pytest.raises(RuntimeError):
+        with atomic_file(file) as f:
+            f.write('half')
+            raise RuntimeError
+
+    assert file.read_text() == 'old'
+    assert os.listdir(tmp_path) == ['index.txt']
+
+
+@pytest.mark.parametrize('fsync', [True, False])
+def test_atomic_file_flushes_file_and_directory(tmp_path, monkeypatch, fsync):
+    synced = []
+    real_fsync = os.fsync
+    monkeypatch.setattr(os, 'fsync', lambda descriptor: synced.append(descriptor) or real_fsync(descriptor))
+
+    with atomic_file(tmp_path / 'index.txt', fsync=fsync) as f:
+        f.write('new')
+
+    assert (tmp_path / 'index.txt').read_text() == 'new'
+    assert len(synced) == (2 if fsync and os.name != 'nt' else 1 if fsync else 0)
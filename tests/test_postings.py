@@ -0,0 +1,98 @@
+import json
+import random
+
+import numpy as np
+import pytest
+
+import postings_store
+from postings import difference, gallop, intersect, intersect_galloping, union
+from postings_store import DOC_ID, PostingsStore
+from segments import MANIFEST_NAME, SegmentStore
+from subproject2 import QueryEngine, _boolean_query, _evaluate, _parse_or
+
+
+def random_postings(rng: random.Random, length: int, highest: int) -> list:
+    return sorted(rng.sample(range(1, highest + 1), min(length, highest)))
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_merges_match_sets(seed):
+    rng = random.Random(seed)
+    for _ in range(50):
+        highest = rng.choice([10, 100, 10_000])
+        first = random_postings(rng, rng.randrange(0, 300), highest)
+        second = random_postings(rng, rng.randrange(0, 300), highest)
+
+        expected = sorted(set(first) & set(second))
+        assert intersect(first, second) == expected
+        assert intersect_galloping(first, second) == expected
+        assert union(first, second) == sorted(set(first) | set(second))
+        assert difference(first, second) == sorted(set(first) - set(second))
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_array_merges_match_list_merges(seed):
+    rng = random.Random(seed)
+    for _ in range(50):
+        highest = rng.choice([10, 100, 10_000])
+        # Lengths far apart too, so intersections binary search the longer array
+        first = random_postings(rng, rng.choice([0, 1, 5, 300]), highest)
+        second = random_postings(rng, rng.randrange(0, 3000), highest)
+        arrays = np.array(first, dtype=DOC_ID), np.array(second, dtype=DOC_ID)
+
+        assert postings_store.intersect(*arrays).tolist() == intersect(first, second)
+        assert postings_store.intersect(*arrays[::-1]).tolist() == intersect(second, first)
+        assert postings_store.union(*arrays).tolist() == union(first, second)
+        assert postings_store.difference(*arrays).tolist() == difference(first, second)
+
+
+@pytest.mark.parametrize('query', ['bank', 'missing', 'bank AND rate', 'bank OR yen', 'bank NOT rate',
+                                   'NOT bank', '( bank OR rate ) NOT ( yen OR missing )', 'rate AND missing'])
+def test_boolean_query_on_store_matches_lists(query):
+    index = {'bank': [1, 3, 5], 'rate': [2, 3], 'yen': [4, 6]}
+    universe = lambda: [1, 2, 3, 4, 5, 6]
+
+    expected = _evaluate(_parse_or(query.split()), index, universe)
+    vectorized = _evaluate(_parse_or(query.split()), PostingsStore.from_index(index), universe)
+    assert isinstance(vectorized, np.ndarray)
+    assert vectorized.tolist() == expected
+
+
+def test_gallop_finds_first_position_at_least_target():
+    postings = [2, 3, 5, 8, 13, 21, 34, 55, 89]
+    for start in range(len(postings)):
+        for target in range(0, 100):
+            expected = next((i for i in range(start, len(postings)) if postings[i] >= target), len(postings))
+            assert gallop(postings, target, start) == expected
+
+
+def test_boolean_query_with_only_negated_terms(tmp_path, monkeypatch):
+    index = {'bank': [1, 3, 5], 'rate': [2, 3], 'yen': [4, 6]}
+    file = tmp_path / 'index.txt'
+    file.write_text(json.dumps(index))
+
+    engine = QueryEngine()
+    monkeypatch.setattr('subproject2.ENGINE', engine)
+
+    assert _boolean_query('NOT bank', file, 1, show_results=False) == [2, 4, 6]
+    assert _boolean_query('NOT bank NOT yen', file, 1, show_results=False) == [2]
+    assert _boolean_query('(NOT rate) OR yen', file, 1, show_results=False) == [1, 4, 5, 6]
+    assert engine.universe(file) == [1, 2, 3, 4, 5, 6]
+
+
+@pytest.mark.parametrize('layout', ['json', 'segments'])
+def test_boolean_query_result_is_a_copy(tmp_path, monkeypatch, layout):
+    index = {'bank': [1, 3, 5], 'rate': [2, 3]}
+    file = tmp_path / 'index.txt'
+    file.write_text(json.dumps(index))
+    if layout == 'segments':
+        store = SegmentStore(tmp_path / 'segments', merge_factor=None, background=False)
+        store.add_segment(index)
+        store.close()
+        file = tmp_path / 'segments' / MANIFEST_NAME
+
+    engine = QueryEngine()
+    monkeypatch.setattr('subproject2.ENGINE', engine)
+
+    _boolean_query('bank', file, 1, show_results=False).append(7)
+    assert _boolean_query('bank', file, 1, show_results=False) == [1, 3, 5]
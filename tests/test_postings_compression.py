@@ -0,0 +1,37 @@
+import random
+
+import pytest
+
+from postings_compression import (CODECS, gamma_decode, gamma_encode, gaps, iter_postings, read_compressed_index,
+                                  vb_decode, vb_encode, write_compressed_index)
+
+# Numbers around every 7-bit boundary of variable-byte codes, and every power of two of gamma codes
+EDGES = [1, 2, 3, 127, 128, 129, 255, 256, 16_383, 16_384, 16_385, 2 ** 21 - 1, 2 ** 21, 2 ** 31 - 1, 2 ** 40]
+
+
+def test_vb_round_trip():
+    assert list(vb_decode(vb_encode([0] + EDGES))) == [0] + EDGES
+
+
+def test_gamma_round_trip():
+    assert list(gamma_decode(gamma_encode(EDGES), len(EDGES))) == EDGES
+
+
+@pytest.mark.parametrize('codec', sorted(CODECS))
+def test_postings_round_trip(codec):
+    rng = random.Random(0)
+    for _ in range(200):
+        postings = sorted(rng.sample(range(1, 100_000), rng.randrange(1, 200)))
+        data = CODECS[codec][0](gaps(postings))
+        assert list(iter_postings(data, len(postings), codec)) == postings
+
+
+@pytest.mark.parametrize('codec', sorted(CODECS))
+def test_compressed_index_round_trip(codec, tmp_path):
+    rng = random.Random(1)
+    index = {f'term{number}': sorted(rng.sample(range(1, 22_000), rng.randrange(1, 50))) for number in range(300)}
+
+    file = tmp_path / f'index.{codec}'
+    write_compressed_index(index, file, codec)
+
+    assert {term: list(postings) for term, postings in read_compressed_index(file, codec)} == index
@@ -0,0 +1,45 @@
+import pytest
+from nltk import word_tokenize
+
+from conftest import ROOT
+from subproject1 import clean
+from sgml_reader import read_articles
+from tokenizer import tokenize
+
+# Texts exercising every rule of clean(): acronyms, contractions, apostrophes, numbers, control characters and "^M"
+TEXTS = [
+    "The U.S. and U.K. said it's a 2.5 pct rise, up from 1.9 pct in 1986.",
+    "Shares cannot gimme gonna gotta lemme wanna wanna1 Cannot CANNOT can't won't",
+    "Bundesbank's president (Karl Otto Poehl) said: \"rates will stay\" -- at 3.5%.",
+    "Line one^M\nLine two^Mthree ^^M M^ caret^ end\x03\x02\x07\x05\x7f",
+    "<quote>{braces} [brackets] a+b=c @home & co * 10/20 #1 ``quoted'' 'single'",
+    "U.S.'s A.G.'s I.B.M. 's it 's rock'n'roll o'clock 1980s 3-for-2 split",
+    "“Curly” ‘quotes’ «guillemets» – en — em „ low",
+    "",
+]
+
+
+def reference(text: str) -> list:
+    """
+    Tokenize a text the way the tokenizer replaces: `clean()`, then `nltk.word_tokenize()`.
+
+    `preserve_line=True` skips sentence splitting, which needs NLTK's punkt data. `clean()` has already removed the
+    periods, so the tokens are the same either way.
+    """
+
+    return word_tokenize(clean(text), preserve_line=True)
+
+
+@pytest.mark.parametrize('text', TEXTS)
+def test_tokenizer_matches_reference(text):
+    assert list(tokenize(text)) == reference(text)
+
+
+def test_tokenizer_matches_reference_on_corpus():
+    files = sorted((ROOT.parent / 'reuters21578').glob('*.sgm'))
+    if not files:
+        pytest.skip("The Reuters corpus is not next to the repository")
+
+    for file in files:
+        for article in read_articles(file):
+            assert list(tokenize(article.text)) == reference(article.text), f"article {article.newid}"
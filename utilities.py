@@ -1,8 +1,34 @@
+import sys
+
 from rich.table import Table
 from rich.console import Console
 from rich.align import Align
 from rich import box
 
+from postings_store import PostingsStore
+
+
+def calc_memory_size(index) -> int:
+    """
+    Get the memory taken by an index of Python objects: the dictionary, its keys, its postings lists and everything in
+    them, however deeply nested, i.e. the position lists of a positional index.
+
+    Small ints are shared by Python, and counted anyway, so this is how much the index would take without sharing.
+
+    :param index: The index to find the memory size of
+    :return: The size in bytes
+    """
+
+    size = sys.getsizeof(index)
+
+    if isinstance(index, dict):
+        for key, value in index.items():
+            size += sys.getsizeof(key) + calc_memory_size(value)
+    elif isinstance(index, (list, tuple)):
+        size += sum(map(calc_memory_size, index))
+
+    return size
+
 
 def calc_percent_change(new: float, old: float) -> float:
     """
@@ -39,6 +65,10 @@ def calc_postings_size(index: dict) -> int:
     :return: The number of total postings in the given index
     """
 
+    # An array-backed store knows its total without looking at every postings list
+    if isinstance(index, PostingsStore):
+        return index.postings_size()
+
     return sum(len(x) for x in index.values())
 
 
@@ -99,6 +129,27 @@ def create_postings_table():
     return postings_table
 
 
+def create_storage_table(title: str = "Effect of Lossless Compression"):
+    """
+    Create the table for showing the effects of lossless compression on the on-disk size of the index, or any other
+    comparison of ways of storing it.
+
+    The table has 3 columns:
+     - "Stored as" enumerates the different ways of storing the index
+     - "Size (bytes)" is the size of the stored index
+     - "% Change" shows how much this size has changed compared to the first way of storing the same part of the index
+
+    :param title: The title of the table
+    :return: The constructed Table object
+    """
+
+    storage_table = Table(title=title, box=box.MINIMAL, safe_box=True)
+    storage_table.add_column("Stored as", justify='right')
+    storage_table.add_column("Size (bytes)", justify='center')
+    storage_table.add_column("% Change", justify='center')
+    return storage_table
+
+
 def render_table(CASE_FOLDING_DICT_SIZE, CASE_FOLDING_POSTINGS_SIZE, CML_CHANGE_DICT_SIZE_150_STOPW,
                  CML_CHANGE_DICT_SIZE_30_STOPW, CML_CHANGE_DICT_SIZE_CASE_FOLDING, CML_CHANGE_DICT_SIZE_STEM,
                  CML_CHANGE_POSTINGS_SIZE_150_STOPW, CML_CHANGE_POSTINGS_SIZE_30_STOPW,
@@ -108,7 +159,7 @@ def render_table(CASE_FOLDING_DICT_SIZE, CASE_FOLDING_POSTINGS_SIZE, CML_CHANGE_
                  PCT_CHANGE_DICT_SIZE_STEM, PCT_CHANGE_POSTINGS_SIZE_150_STOPW, PCT_CHANGE_POSTINGS_SIZE_30_STOPW,
                  PCT_CHANGE_POSTINGS_SIZE_CASE_FOLDING, PCT_CHANGE_POSTINGS_SIZE_NO_NUMS, PCT_CHANGE_POSTINGS_SIZE_STEM,
                  STEM_DICT_SIZE, STEM_POSTINGS_SIZE, STOPW150_DICT_SIZE, STOPW150_POSTINGS_SIZE, STOPW30_DICT_SIZE,
-                 STOPW30_POSTINGS_SIZE):
+                 STOPW30_POSTINGS_SIZE, STORAGE_SIZES=None):
     """
     Render the size data table to the console
 
@@ -128,6 +179,10 @@ def render_table(CASE_FOLDING_DICT_SIZE, CASE_FOLDING_POSTINGS_SIZE, CML_CHANGE_
 
     - Any parameter starting with "CML_CHANGE" is a cumulative percentage change datum. These parameters end with
       what step in the lossy compression pipeline they refer to.
+
+    - STORAGE_SIZES is an optional list of sections, each a list of (description, size in bytes) tuples, for the
+      different ways of storing a part of the index. If given, they are shown as the rows of a second table, each
+      compared to the first row of its section.
     """
 
     # Create main table
@@ -190,3 +245,138 @@ def render_table(CASE_FOLDING_DICT_SIZE, CASE_FOLDING_POSTINGS_SIZE, CML_CHANGE_
     console = Console()
     console.print()
     console.print(main_table)
+
+    if STORAGE_SIZES:
+        render_storage_table(STORAGE_SIZES)
+
+
+def render_storage_table(STORAGE_SIZES, title: str = "Effect of Lossless Compression"):
+    """
+    Render a table comparing ways of storing the index to the console.
+
+    :param STORAGE_SIZES: A list of sections, each a list of (description, size in bytes) tuples, for the different
+                          ways of storing a part of the index. Each row is compared to the first row of its section
+    :param title: The title of the table
+    """
+
+    # Create the table, and fill it with data, one section at a time
+    storage_table = create_storage_table(title)
+    for section in STORAGE_SIZES:
+        BASE_SIZE = section[0][1]
+        for description, size in section:
+            storage_table.add_row(description, f"{size:,}", str(calc_percent_change(size, BASE_SIZE)))
+        storage_table.add_section()
+
+    console = Console()
+    console.print()
+    console.print(storage_table)
+
+
+def create_benchmark_table(title: str = "Benchmark Results"):
+    """
+    Create the table for showing benchmark results.
+
+    The table has 6 columns:
+     - "Benchmark" names what was timed
+     - "p50 (ms)" and "p99 (ms)" are the median and 99th percentile timings
+     - "Throughput" is how many items were handled per second, at the median timing
+     - "Peak RSS (MB)" is the peak memory of the process so far
+     - "% Change p50" shows how much the median timing has changed since an earlier run, if given
+
+    :param title: The title of the table
+    :return: The constructed Table object
+    """
+
+    benchmark_table = Table(title=title, box=box.MINIMAL, safe_box=True)
+    benchmark_table.add_column("Benchmark", justify='right', no_wrap=True)
+    benchmark_table.add_column("p50 (ms)", justify='center')
+    benchmark_table.add_column("p99 (ms)", justify='center')
+    benchmark_table.add_column("Throughput", justify='center', no_wrap=True)
+    benchmark_table.add_column("Peak RSS (MB)", justify='center')
+    benchmark_table.add_column("% Change p50", justify='center')
+    return benchmark_table
+
+
+def render_benchmark_table(RESULTS, BASELINE=None):
+    """
+    Render a table of benchmark results to the console.
+
+    :param RESULTS: The results of a benchmark run, from `benchmark.run_benchmarks()`
+    :param BASELINE: The results of an earlier run at the same scale, to compare median timings to, if any
+    """
+
+    benchmark_table = create_benchmark_table(f"Benchmark Results ({RESULTS['scale']:g}x corpus, "
+                                             f"{RESULTS['articles']:,} articles)")
+
+    for name, summary in RESULTS['benchmarks'].items():
+        throughput, peak, change = "-", "-", "-"
+        if summary['throughput'] is not None:
+            throughput = f"{summary['throughput']:,.0f} {summary['throughput_unit']}"
+        if summary['peak_rss_bytes'] is not None:
+            peak = f"{summary['peak_rss_bytes'] / 2 ** 20:,.1f}"
+        if BASELINE is not None and name in BASELINE['benchmarks'] and BASELINE['benchmarks'][name]['p50_ms']:
+            change = str(calc_percent_change(summary['p50_ms'], BASELINE['benchmarks'][name]['p50_ms']))
+
+        benchmark_table.add_row(name, f"{summary['p50_ms']:,.3f}", f"{summary['p99_ms']:,.3f}", throughput, peak,
+                                change)
+
+    # Too few runs to tell the 99th percentile from the slowest run
+    if any(summary.get('p99_is_max') for summary in RESULTS['benchmarks'].values()):
+        benchmark_table.caption = "With fewer than 100 runs, p99 is the slowest run"
+
+
+    console = Console()
+    console.print()
+    console.print(benchmark_table)
+
+
+def create_metrics_table(title: str = "Where Time and Memory Went"):
+    """
+    Create the table for showing the metrics of a run.
+
+    The table has 6 columns:
+     - "Timer" names the timed stage, or counter
+     - "Calls" is how many times the stage ran, or items it gave, or the total of the counter
+     - "Total (s)", "Mean (ms)" and "Max (ms)" are the time spent in the stage, all calls together, per call, and at most
+     - "Rate (/s)" is how many calls the stage handles per second, or how much the counter grew per second of the run
+     - "Peak memory (MB)" is the most memory allocated during a single call, if tracked
+
+    :param title: The title of the table
+    :return: The constructed Table object
+    """
+
+    metrics_table = Table(title=title, box=box.MINIMAL, safe_box=True)
+    metrics_table.add_column("Timer", justify='right', no_wrap=True)
+    metrics_table.add_column("Calls", justify='center')
+    metrics_table.add_column("Total (s)", justify='center')
+    metrics_table.add_column("Mean (ms)", justify='center')
+    metrics_table.add_column("Max (ms)", justify='center')
+    metrics_table.add_column("Rate (/s)", justify='center')
+    metrics_table.add_column("Peak memory (MB)", justify='center')
+    return metrics_table
+
+
+def render_metrics_table(REPORT):
+    """
+    Render a table of the metrics of a run to the console: its timers, then its counters.
+
+    :param REPORT: The metrics of the run, from `metrics.METRICS.report()`
+    """
+
+    metrics_table = create_metrics_table(f"Where Time and Memory Went ({REPORT['wall_seconds']:0.2f} seconds)")
+
+    for name, stats in REPORT['timers'].items():
+        mean = "-" if stats['mean_ms'] is None else f"{stats['mean_ms']:,.3f}"
+        rate = "-" if stats['per_second'] is None else f"{stats['per_second']:,.0f}"
+        peak = "-" if stats['peak_bytes'] is None else f"{stats['peak_bytes'] / 2 ** 20:,.1f}"
+        metrics_table.add_row(name, f"{stats['calls']:,}", f"{stats['seconds']:,.3f}", mean,
+                              f"{stats['max_ms']:,.3f}", rate, peak)
+
+    metrics_table.add_section()
+    for name, counter in REPORT['counters'].items():
+        rate = "-" if counter['per_second'] is None else f"{counter['per_second']:,.0f}"
+        metrics_table.add_row(name, f"{counter['total']:,}", "-", "-", "-", rate, "-")
+
+    console = Console()
+    console.print()
+    console.print(metrics_table)